@@ -9,6 +9,8 @@ import os
 from typing import Optional
 import google.generativeai as genai
 
+from model_scheduler import call_model, estimate_tokens
+
 # Global agent instance
 _AGENT = None
 
@@ -50,12 +52,13 @@ class SimpleAgent:
             if self.system_instructions:
                 # Use the system instructions as a system prompt if available
                 chat = model.start_chat(history=[])
-                response = chat.send_message(
-                    f"System: {self.system_instructions}\n\nUser: {prompt}"
-                )
+                message = f"System: {self.system_instructions}\n\nUser: {prompt}"
+                response = await call_model(lambda: chat.send_message_async(message),
+                                            model=self.model, tokens=estimate_tokens(message))
             else:
                 # Otherwise just send the prompt directly
-                response = model.generate_content(prompt)
+                response = await call_model(lambda: model.generate_content_async(prompt),
+                                            model=self.model, tokens=estimate_tokens(prompt))
             
             return response
             
@@ -13,13 +13,14 @@ from .utils import (
     track_agent_usage, 
     save_to_agent_memory, 
     get_agent_memory, 
-    create_mcp_context_from_inputs,
+    build_mcp_context,
     extract_metrics_from_mcp_response
 )
 
 # Import MCP components
 from mcp.context import MCPContext
 from mcp.model_adapter import MCPModelFactory
+from token_accounting import usage_from_metadata, count_tokens_batch
 
 # Simplified Plan class that mimics the functionality of google.generativeai.adk.plan.Plan
 class SimplePlan:
@@ -122,13 +123,14 @@ async def study_assistant_plan_with_mcp(agent, inputs, user_id=None) -> dict:
     chat_history = inputs.get('chat_history', None)
     
     # Create MCP context
-    context = create_mcp_context_from_inputs(
+    context = await build_mcp_context(
         user_input=query,
         user_id=user_id,
         session_id=session_id,
         document_text=document_text,
         chat_history=chat_history,
-        context_type="study"
+        context_type="study",
+        retrieve_document=True
     )
     
     # Get the appropriate model adapter
@@ -202,6 +204,7 @@ async def study_assistant_plan(agent, inputs, user_id=None) -> dict:
         prompt = query
     
     # Generate a response
+    response = None
     try:
         # Properly await the async response
         response = await agent.generate_content(prompt)
@@ -219,9 +222,13 @@ async def study_assistant_plan(agent, inputs, user_id=None) -> dict:
     
     # Track usage if user_id is provided
     if user_id:
-        # Rough estimate of token usage
-        estimated_tokens = (len(query) + len(response_text)) // 4
-        track_agent_usage(user_id, estimated_tokens, "study_assistant")
+        # Reported usage when the response has it, otherwise counted locally
+        usage = usage_from_metadata(response) if response is not None else None
+        if usage is not None:
+            tokens_used = usage['total_tokens']
+        else:
+            tokens_used = sum(count_tokens_batch([prompt, response_text]))
+        track_agent_usage(user_id, tokens_used, "study_assistant")
     
     return {
         "success": True,
@@ -247,7 +254,7 @@ async def proofread_and_summarize_plan_with_mcp(agent, inputs, user_id=None) ->
     session_id = inputs.get('session_id', None)
     
     # Create MCP context
-    context = create_mcp_context_from_inputs(
+    context = await build_mcp_context(
         user_input=text,
         user_id=user_id,
         session_id=session_id,
@@ -342,7 +349,7 @@ async def entertainment_chat_plan_with_mcp(agent, inputs, user_id=None) -> dict:
     chat_history = inputs.get('chat_history', None)
     
     # Create MCP context
-    context = create_mcp_context_from_inputs(
+    context = await build_mcp_context(
         user_input=message,
         user_id=user_id,
         session_id=session_id,
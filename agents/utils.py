@@ -6,12 +6,32 @@ Firestore operations, and token usage tracking.
 """
 
 from typing import Dict, Any, List, Optional
+import os
 import json
+import time
+import heapq
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from flask import g, has_app_context
 import firebase_utils as fb_utils
+import write_behind
 
 # Import MCP related modules
 from mcp.context import MCPContext, ContextType
+from request_metrics import observe, timed
+from token_accounting import count_tokens
+from conversation_summary import SUMMARY_ENABLED, SUMMARY_HEADER, get_conversation_summarizer
+
+# Recent sessions whose memory is merged when no session ID is given
+AGENT_MEMORY_SESSIONS = int(os.getenv("AGENT_MEMORY_SESSIONS", "3"))
+
+# Threads reading those sessions' interactions concurrently (shared by all requests)
+AGENT_MEMORY_FANOUT_WORKERS = int(os.getenv("AGENT_MEMORY_FANOUT_WORKERS", "8"))
+
+_memory_executor = ThreadPoolExecutor(max_workers=AGENT_MEMORY_FANOUT_WORKERS,
+                                      thread_name_prefix="agent-memory")
 
 def track_agent_usage(user_id: str, token_count: int, plan_name: Optional[str] = None) -> None:
     """
@@ -26,22 +46,18 @@ def track_agent_usage(user_id: str, token_count: int, plan_name: Optional[str] =
         # Get the current date for daily tracking
         today = datetime.now().strftime("%Y-%m-%d")
         
-        # Reference to the user's usage document
-        usage_ref = fb_utils.db.collection('users').document(user_id) \
-            .collection('usage').document(today)
-        
         # Prepare update data
         update_data = {
-            'tokens': fb_utils.firestore.Increment(token_count),
-            'last_updated': fb_utils.firestore.SERVER_TIMESTAMP
+            'tokens': write_behind.increment(token_count),
+            'last_updated': write_behind.SERVER_TIMESTAMP
         }
         
         # Add plan name if provided
         if plan_name:
-            update_data[f'plan_{plan_name}_tokens'] = fb_utils.firestore.Increment(token_count)
+            update_data[f'plan_{plan_name}_tokens'] = write_behind.increment(token_count)
         
-        # Update the token count atomically
-        usage_ref.set(update_data, merge=True)
+        # Queue the atomic increment of the user's usage document for today
+        write_behind.write(f"users/{user_id}/usage/{today}", update_data, merge=True)
     except Exception as e:
         # Log the error but don't raise it to avoid disrupting the user experience
         print(f"Error tracking token usage: {e}")
@@ -65,34 +81,57 @@ def save_to_agent_memory(
         bool: True if successful, False otherwise
     """
     try:
-        # Create a memory entry
+        # Create a memory entry, timed when queued so entries batched together keep their order
+        entry_id, queued_at = write_behind.ordered_stamp()
         memory_entry = {
             'user_input': user_input,
             'agent_response': agent_response,
-            'timestamp': fb_utils.firestore.SERVER_TIMESTAMP
+            'timestamp': write_behind.client_timestamp(queued_at)
         }
         
-        # Save to memory collection
-        memory_ref = fb_utils.db.collection('users').document(user_id) \
-            .collection('agent_memory').document(session_id) \
-            .collection('interactions').document()
-        
-        memory_ref.set(memory_entry)
+        # Queue the entry for the memory collection
+        session_path = f"users/{user_id}/agent_memory/{session_id}"
+        write_behind.write(f"{session_path}/interactions/{entry_id}", memory_entry)
         
         # Update the session document with metadata
-        session_ref = fb_utils.db.collection('users').document(user_id) \
-            .collection('agent_memory').document(session_id)
-        
-        session_ref.set({
-            'last_interaction': fb_utils.firestore.SERVER_TIMESTAMP,
-            'interaction_count': fb_utils.firestore.Increment(1)
+        write_behind.write(session_path, {
+            'last_interaction': write_behind.SERVER_TIMESTAMP,
+            'interaction_count': write_behind.increment(1)
         }, merge=True)
         
+        _forget_request_memory(user_id)
         return True
     except Exception as e:
         print(f"Error saving to agent memory: {e}")
         return False
 
+def _request_memory_cache() -> Optional[Dict[Any, List[Dict[str, Any]]]]:
+    """Memory lookups made during the current request (None outside a Flask app context)."""
+    if not has_app_context():
+        return None
+    cache = getattr(g, "agent_memory_cache", None)
+    if cache is None:
+        cache = g.agent_memory_cache = {}
+    return cache
+
+def _forget_request_memory(user_id: str) -> None:
+    cache = _request_memory_cache()
+    if cache:
+        for key in [key for key in cache if key[0] == user_id]:
+            del cache[key]
+
+def _memory_sort_key(entry: Dict[str, Any]) -> float:
+    timestamp = entry.get('timestamp')
+    if hasattr(timestamp, 'timestamp'):
+        return timestamp.timestamp()
+    if isinstance(timestamp, (int, float)):
+        return timestamp
+    return 0.0
+
+def _stream_interactions(query) -> List[Dict[str, Any]]:
+    return [doc.to_dict() for doc in query.stream()]
+
+@timed("firestore.agent_memory")
 def get_agent_memory(
     user_id: str,
     session_id: Optional[str] = None,
@@ -101,6 +140,10 @@ def get_agent_memory(
     """
     Retrieve agent memory for a user, optionally filtered by session ID.
     
+    Without a session ID, the interactions of the most recent sessions are read
+    concurrently and merged newest first. Results are reused for the rest of the
+    request.
+    
     Args:
         user_id: The user ID
         session_id: Optional session ID to filter by
@@ -109,7 +152,15 @@ def get_agent_memory(
     Returns:
         List of memory entries
     """
+    cache = _request_memory_cache()
+    cache_key = (user_id, session_id, limit)
+    if cache is not None and cache_key in cache:
+        return list(cache[cache_key])
+    
     try:
+        # Interactions still in the write-behind queue must be visible to this read
+        write_behind.flush_pending(f"users/{user_id}/agent_memory/")
+        
         if session_id:
             # Get memory for a specific session
             memory_ref = fb_utils.db.collection('users').document(user_id) \
@@ -117,35 +168,37 @@ def get_agent_memory(
                 .collection('interactions')
             
             query = memory_ref.order_by('timestamp', direction='DESCENDING').limit(limit)
+            
+            # Execute the query
+            results = _stream_interactions(query)
         else:
             # Get recent memory across all sessions
             sessions_ref = fb_utils.db.collection('users').document(user_id) \
                 .collection('agent_memory')
             
             # Get the most recent sessions
-            recent_sessions = sessions_ref.order_by('last_interaction', direction='DESCENDING').limit(3)
+            recent_sessions = sessions_ref.order_by('last_interaction', direction='DESCENDING') \
+                .limit(AGENT_MEMORY_SESSIONS)
             
-            # Placeholder for combined results
-            combined_results = []
+            # Read each session's newest interactions at the same time
+            queries = [
+                session_doc.reference.collection('interactions')
+                .order_by('timestamp', direction='DESCENDING').limit(max(1, limit // AGENT_MEMORY_SESSIONS))
+                for session_doc in recent_sessions.stream()
+            ]
+            session_results = list(_memory_executor.map(_stream_interactions, queries))
             
-            # Collect memory from each recent session
-            for session_doc in recent_sessions.stream():
-                session_memory = session_doc.reference.collection('interactions') \
-                    .order_by('timestamp', direction='DESCENDING').limit(limit // 3)
-                
-                session_results = [doc.to_dict() for doc in session_memory.stream()]
-                combined_results.extend(session_results)
-            
-            # Sort by timestamp and limit results
-            combined_results.sort(key=lambda x: x.get('timestamp', 0), reverse=True)
-            return combined_results[:limit]
-        
-        # Execute the query and return results
-        results = [doc.to_dict() for doc in query.stream()]
-        return results
+            # Each list is already newest first: merge them instead of sorting everything
+            results = list(itertools.islice(
+                heapq.merge(*session_results, key=_memory_sort_key, reverse=True), limit
+            ))
     except Exception as e:
         print(f"Error retrieving agent memory: {e}")
         return []
+    
+    if cache is not None:
+        cache[cache_key] = results
+    return list(results)
 
 def clear_agent_memory(user_id: str, session_id: str) -> bool:
     """
@@ -159,6 +212,9 @@ def clear_agent_memory(user_id: str, session_id: str) -> bool:
         bool: True if successful, False otherwise
     """
     try:
+        # Queued interactions have to exist before they can be deleted
+        write_behind.flush_pending(f"users/{user_id}/agent_memory/")
+        
         # Get reference to the interactions collection
         interactions_ref = fb_utils.db.collection('users').document(user_id) \
             .collection('agent_memory').document(session_id) \
@@ -182,6 +238,7 @@ def clear_agent_memory(user_id: str, session_id: str) -> bool:
             'cleared_at': fb_utils.firestore.SERVER_TIMESTAMP
         }, merge=True)
         
+        _forget_request_memory(user_id)
         return True
     except Exception as e:
         print(f"Error clearing agent memory: {e}")
@@ -296,72 +353,175 @@ def add_document_to_mcp_context(context: MCPContext, document_text: str, filenam
         metadata=ContextMetadata(source="document_reference", importance=10)
     )
 
-def create_mcp_context_from_inputs(
+def _add_context_type_instruction(context: MCPContext, context_type: str) -> None:
+    """Add the system instruction for a context type."""
+    if context_type == "study":
+        context.add_system_instruction(
+            "You are a helpful study assistant. You help users understand complex topics, "
+            "answer questions about their study materials, and provide educational support."
+        )
+    elif context_type == "entertainment":
+        context.add_system_instruction(
+            "You are an entertainment assistant. You can discuss movies, music, books, and other "
+            "forms of entertainment. You provide recommendations and engage in casual conversation."
+        )
+    elif context_type == "proofread":
+        context.add_system_instruction(
+            "You are a proofreading assistant. You help users improve their writing by "
+            "identifying grammar issues, enhancing clarity, and suggesting improvements."
+        )
+
+async def _in_thread(source: str, timings: Dict[str, float], func, *args):
+    """Run blocking I/O for a context source in a worker thread, recording how long it took."""
+    started = time.perf_counter()
+    try:
+        return await asyncio.to_thread(func, *args)
+    finally:
+        elapsed = time.perf_counter() - started
+        timings[source] = timings.get(source, 0.0) + elapsed
+        observe(f"context.{source}", elapsed)
+
+def _resolve_document(document_text: Optional[str], document_id: Optional[str],
+                      query: Optional[str]) -> Optional[str]:
+    """Document text to send: the chunks relevant to query, or the whole document."""
+    if query is not None:
+        try:
+            from document_index import build_document_excerpt, load_document_excerpt
+            if document_text:
+                document_text = build_document_excerpt(document_text, query)
+            else:
+                document_text = load_document_excerpt(document_id, query)
+        except Exception as e:
+            print(f"Warning: Document retrieval failed, sending the full document: {e}")
+    
+    # Resolve the document from the server-side store if only its ID was given
+    if not document_text and document_id:
+        try:
+            from document_store import load_document
+            document_text = load_document(document_id)
+        except Exception as e:
+            print(f"Warning: Failed to load document {document_id} from store: {e}")
+    return document_text
+
+@timed("context_build")
+async def build_mcp_context(
     user_input: str,
     user_id: Optional[str] = None,
     session_id: Optional[str] = None,
     document_text: Optional[str] = None,
     chat_history: Optional[List[Dict[str, str]]] = None,
-    context_type: str = "general"
+    context_type: str = "general",
+    document_id: Optional[str] = None,
+    retrieve_document: bool = False,
+    chat_type: Optional[str] = None,
+    load_history: bool = False,
+    timings: Optional[Dict[str, float]] = None
 ) -> MCPContext:
     """
     Create an MCP context from various inputs.
     
+    User memory, chat history and the document are fetched concurrently, each
+    in a worker thread. Each source's time is recorded as a "context.<source>"
+    phase in the request metrics.
+    
     Args:
         user_input: The current user input
         user_id: Optional user ID
         session_id: Optional session ID
         document_text: Optional document text
-        chat_history: Optional chat history
+        chat_history: Optional chat history already fetched in this request
         context_type: Type of context ("study", "entertainment", etc.)
+        document_id: Optional document store ID, used when document_text is not given
+        retrieve_document: Send only the document chunks relevant to the user input
+            (and the previous user turn) instead of the whole document
+        chat_type: Chat the history belongs to, for its rolling summary (defaults to context_type)
+        load_history: Fetch the chat history when chat_history isn't given
+        timings: Optional dict that receives seconds spent per source
         
     Returns:
         An initialized MCP context
     """
+    chat_type = chat_type or context_type
+    timings = {} if timings is None else timings
+    
+    async def memory():
+        if not user_id:
+            return None
+        return await _in_thread("memory", timings, get_agent_memory, user_id, session_id, 10)
+    
+    async def history():
+        history_messages = chat_history
+        if history_messages is None and load_history and user_id:
+            from firebase_utils import get_chat_history
+            history_messages = await _in_thread("history", timings, get_chat_history, user_id, chat_type)
+        summary, recent_history = None, history_messages
+        # Long histories are sent as a summary plus recent turns
+        if history_messages and user_id and SUMMARY_ENABLED:
+            try:
+                summary, recent_history = await _in_thread(
+                    "summary", timings, get_conversation_summarizer().compact_history,
+                    user_id, chat_type, history_messages
+                )
+            except Exception as e:
+                print(f"Warning: Failed to apply conversation summary: {e}")
+        return history_messages, summary, recent_history
+    
+    history_task = asyncio.ensure_future(history())
+    
+    async def document():
+        if not (document_text or document_id):
+            return None
+        query = None
+        if retrieve_document:
+            # Follow-ups like "explain that part more" need the previous question's terms too
+            try:
+                history_messages, _, _ = await asyncio.shield(history_task)
+            except Exception:
+                history_messages = chat_history
+            previous_questions = [m.get('content', '') for m in (history_messages or []) if m.get('role') == 'user']
+            query = " ".join([user_input] + previous_questions[-1:])
+        return await _in_thread("document", timings, _resolve_document, document_text, document_id, query)
+    
+    memory_result, history_result, document_result = await asyncio.gather(
+        memory(), history_task, document(), return_exceptions=True
+    )
+    
     # Create context based on type
     context = MCPContext()
-    
-    # Add type-specific system instruction
-    if context_type == "study":
-        context.add_system_instruction(
-            "You are a helpful study assistant. You help users understand complex topics, "
-            "answer questions about their study materials, and provide educational support."
-        )
-    elif context_type == "entertainment":
-        context.add_system_instruction(
-            "You are an entertainment assistant. You can discuss movies, music, books, and other "
-            "forms of entertainment. You provide recommendations and engage in casual conversation."
-        )
-    elif context_type == "proofread":
-        context.add_system_instruction(
-            "You are a proofreading assistant. You help users improve their writing by "
-            "identifying grammar issues, enhancing clarity, and suggesting improvements."
-        )
+    _add_context_type_instruction(context, context_type)
     
     # Set user and session IDs
     if user_id:
         context.set_user_id(user_id)
     if session_id:
         context.set_session_id(session_id)
-      # Load user memory if user_id is provided
+    
+    # Add user memory if user_id is provided
     if user_id:
-        try:
-            load_user_memory_into_mcp_context(context, user_id, session_id)
-        except Exception as e:
-            print(f"Warning: Failed to load user memory: {e}")
-            # Continue processing without failing the whole context creation
+        if isinstance(memory_result, Exception):
+            print(f"Warning: Failed to load user memory: {memory_result}")
+            memory_result = None
+        context.add_user_memory({"interactions": memory_result or [], "user_id": user_id})
     
     # Add chat history if provided
-    if chat_history:
-        try:
-            format_chat_history_for_mcp(chat_history, context)
-        except Exception as e:
-            print(f"Warning: Failed to format chat history: {e}")
+    if isinstance(history_result, Exception):
+        print(f"Warning: Failed to load chat history: {history_result}")
+    else:
+        _, summary, recent_history = history_result
+        if summary:
+            context.add_system_instruction(SUMMARY_HEADER + summary)
+        if recent_history:
+            try:
+                format_chat_history_for_mcp(recent_history, context)
+            except Exception as e:
+                print(f"Warning: Failed to format chat history: {e}")
     
     # Add document content if provided
-    if document_text:
+    if isinstance(document_result, Exception):
+        print(f"Warning: Failed to load document: {document_result}")
+    elif document_result:
         try:
-            add_document_to_mcp_context(context, document_text)
+            add_document_to_mcp_context(context, document_result)
         except Exception as e:
             print(f"Warning: Failed to add document to context: {e}")
     
@@ -370,6 +530,15 @@ def create_mcp_context_from_inputs(
     
     return context
 
+def create_mcp_context_from_inputs(user_input: str, **kwargs) -> MCPContext:
+    """
+    Blocking wrapper around build_mcp_context for sync code outside the event loop.
+    
+    Async code (views, plans) should await build_mcp_context directly.
+    """
+    from async_runtime import run_async
+    return run_async(build_mcp_context(user_input, **kwargs))
+
 def extract_metrics_from_mcp_response(response) -> Dict[str, int]:
     """
     Extract usage metrics from an MCP response.
@@ -385,12 +554,12 @@ def extract_metrics_from_mcp_response(response) -> Dict[str, int]:
     if hasattr(response, 'usage_metrics'):
         metrics = response.usage_metrics
     else:
-        # Rough estimate based on text length if no metrics available
-        text_length = len(response.text) if hasattr(response, 'text') else 0
+        # Count the response text if no metrics are available
+        completion_tokens = count_tokens(response.text) if hasattr(response, 'text') else 0
         metrics = {
             'prompt_tokens': 0,  # Unknown without the prompt
-            'completion_tokens': text_length // 4,  # Rough estimate
-            'total_tokens': text_length // 4  # Rough estimate
+            'completion_tokens': completion_tokens,
+            'total_tokens': completion_tokens
         }
     
     return metrics
\ No newline at end of file
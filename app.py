@@ -6,11 +6,27 @@ import sys
 import re
 import time
 import random
+import asyncio
 import traceback
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, session, g, flash, make_response
+from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, session, g, flash, make_response, Response, stream_with_context
 from file_optimizer import convert_to_serializable, read_csv_optimized
 from json_utils import EnhancedJSONEncoder, convert_to_json_serializable
+from file_utils import extract_text_from_file
+from document_store import load_document
+from upload_jobs import get_upload_job_queue, JOB_DONE, JOB_FAILED
+from proofreading import proofread_with_mcp, proofread_warning
+from mcp.prompts import build_prompt_parts
+from request_logging import init_request_logging, get_logger, user_content
+from request_metrics import (
+    init_request_metrics, render_prometheus, metrics_token_valid,
+    PROMETHEUS_CONTENT_TYPE
+)
+from mcp.model_adapter import MCPModelRegistry
+from mcp.single_flight import get_single_flight, make_flight_key
+from mcp.fake_model import FakeGenerativeModel, USE_FAKE_MODEL
+from async_runtime import run_async, iterate_async, async_to_sync
+from model_scheduler import call_model, estimate_tokens
 
 # Define a safer jsonify function that handles non-serializable types
 def safe_jsonify(data):
@@ -52,7 +68,7 @@ from subscription_utils import (
     get_admin_dashboard_data,
     update_user_limit,
     reset_all_daily_token_usage,
-    get_user_daily_token_usage
+    get_cached_plan_and_usage
 )
 import shutil
 import stripe
@@ -91,6 +107,10 @@ load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 genai.configure(api_key=GOOGLE_API_KEY)
 
+# Build the shared MCP Gemini adapter (and its model list) before the first request needs it
+if GOOGLE_API_KEY:
+    MCPModelRegistry.warm_up("gemini")
+
 # Token usage limits
 FREE_PLAN_DAILY_LIMIT = 25000  # 25K tokens per day for free users
 PAID_PLAN_DAILY_LIMIT = 100000  # 100K tokens per day for premium users
@@ -140,6 +160,18 @@ else:
 
 app.secret_key = secret_key
 
+# Run async views on the worker's shared event loop instead of a new loop per request
+app.async_to_sync = async_to_sync
+
+# Structured logging with per-request correlation IDs; registered first so
+# every later hook logs under the request's ID
+init_request_logging(app)
+# Per-route phase timings, exported on /metrics
+init_request_metrics(app)
+auth_log = get_logger("auth")
+session_log = get_logger("session")
+chat_log = get_logger("study_chat")
+
 # Configure custom JSON encoder to handle NumPy types and other non-standard JSON serializable types
 try:
     from json_utils import EnhancedJSONEncoder
@@ -265,14 +297,14 @@ from functools import wraps
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        print(f"[LOGIN_REQUIRED] Checking session for route: {request.path}")
-        print(f"[LOGIN_REQUIRED] Session keys present: {list(session.keys())}")
-        print(f"[LOGIN_REQUIRED] Session cookie present: {'session' in request.cookies}")
+        if auth_log.debug_enabled():
+            auth_log.debug("Checking session for route %s: keys=%s, cookie present=%s",
+                           request.path, list(session.keys()), 'session' in request.cookies)
         
         try:
             # First, check if user_id is in session
             if 'user_id' not in session or not session.get('user_id'):
-                print(f"[LOGIN_REQUIRED] No user_id in session, redirecting to login")
+                auth_log.debug("No user_id in session, redirecting to login")
                 
                 # Store the requested URL for redirecting after login
                 next_url = request.url
@@ -283,18 +315,16 @@ def login_required(f):
             if not validate_session():
                 # Store the requested URL for redirecting after login
                 next_url = request.url
-                print(f"[LOGIN_REQUIRED] Session validation failed, redirecting to login with next={next_url}")
+                auth_log.info("Session validation failed, redirecting to login with next=%s", next_url)
                 # Clear any invalid session data
                 session.clear()
                 # Redirect to login page with the next parameter
                 return redirect(url_for('login', next=next_url))
                 
-            print(f"[LOGIN_REQUIRED] Session is valid for user {session.get('user_id')}")
+            auth_log.debug("Session is valid for user %s", session.get('user_id'))
             return f(*args, **kwargs)
         except Exception as e:
-            print(f"[LOGIN_REQUIRED] Unexpected error during authentication: {e}")
-            import traceback
-            print(f"[LOGIN_REQUIRED] Error traceback: {traceback.format_exc()}")
+            auth_log.exception("Unexpected error during authentication: %s", e)
             
             session.clear()
             flash('An authentication error occurred. Please log in again.', 'danger')
@@ -325,18 +355,19 @@ def validate_session():
     Returns True if the session is valid, False otherwise.
     """
     # Log detailed session state for debugging
-    print(f"[SESSION VALIDATE] Session keys: {list(session.keys())}")
-    print(f"[SESSION VALIDATE] User ID: {session.get('user_id', 'None')}")
-    print(f"[SESSION VALIDATE] Explicitly logged out: {session.get('explicitly_logged_out', False)}")
+    if auth_log.debug_enabled():
+        auth_log.debug("Validating session: keys=%s, user_id=%s, explicitly_logged_out=%s",
+                       list(session.keys()), session.get('user_id', 'None'),
+                       session.get('explicitly_logged_out', False))
     
     # Check if user has explicitly logged out
     if session.get('explicitly_logged_out'):
-        print(f"[SESSION VALIDATE] User explicitly logged out")
+        auth_log.debug("User explicitly logged out")
         return False
     
     # First check if user_id exists and is not empty
     if 'user_id' not in session or not session.get('user_id'):
-        print(f"[SESSION VALIDATE] No valid user_id in session")
+        auth_log.debug("No valid user_id in session")
         return False
         
     # Check for session age (optional security feature)
@@ -345,7 +376,7 @@ def validate_session():
     
     # Force re-login after 30 days (2592000 seconds) of inactivity
     if current_time - login_time > 2592000:
-        print(f"[SESSION VALIDATE] Session too old, clearing")
+        auth_log.info("Session too old, clearing")
         session.clear()
         return False
     
@@ -365,25 +396,23 @@ def validate_session():
                     # Update the login time after verification
                     session['login_time'] = current_time
                     session.modified = True
-                    print(f"[SESSION VALIDATE] Firebase verification successful for {uid}")
+                    auth_log.debug("Firebase verification successful for %s", uid)
                 except Exception as firebase_error:
-                    print(f"[SESSION VALIDATE] Firebase verification failed for {uid}: {firebase_error}")
+                    auth_log.warning("Firebase verification failed for %s: %s", uid, firebase_error)
                     session.clear()
                     return False
     except Exception as e:
-        print(f"[SESSION VALIDATE] Session validation error: {e}")
+        auth_log.warning("Session validation error: %s", e)
         session.clear()
         return False
         
     # Update the login time if we're near the threshold
     if current_time - login_time > 3600:  # Update every hour
-        print(f"[SESSION VALIDATE] Updating login time, old: {login_time}, new: {current_time}")
+        auth_log.debug("Updating login time, old: %s, new: %s", login_time, current_time)
         session['login_time'] = current_time
         session.modified = True
-        # Double check that the update was applied
-        print(f"[SESSION VALIDATE] Verified updated login time: {session.get('login_time')}")
         
-    print(f"[SESSION VALIDATE] Session is valid")
+    auth_log.debug("Session is valid")
     return True
 
 # Translations for multilingual support
@@ -731,83 +760,38 @@ app.config['MAX_CONTENT_LENGTH'] = (10 * 1024 * 1024)  # 10MB max upload
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Initialize the Gemini model
-model = genai.GenerativeModel('gemini-2.0-flash')
+# Initialize the Gemini model (MODEL_BACKEND=fake swaps in the offline fake for load tests)
+model = FakeGenerativeModel('gemini-2.0-flash') if USE_FAKE_MODEL else genai.GenerativeModel('gemini-2.0-flash')
+
+async def _send_with_limit(send, content, history=None):
+    """
+    Await a Gemini async send/generate call through the shared model-call scheduler.
+    Identical calls already in flight (same history and content) share one response.
+    """
+    key = make_flight_key(model.model_name, history, content)
+    response, _ = await get_single_flight().do(
+        key, lambda: call_model(lambda: send(content), model=model.model_name, tokens=estimate_tokens(content))
+    )
+    return response
 
 # Function to get AI response
 def get_ai_response(prompt, history=None, system_prompt=None, language=None):
+    """Sync entry point for get_ai_response_async, dispatched to the shared event loop."""
+    return run_async(get_ai_response_async(prompt, history, system_prompt, language))
+
+async def get_ai_response_async(prompt, history=None, system_prompt=None, language=None):
     try:
         # Determine language for response if not explicitly provided
         if (language is None):
             language = (g.current_language if hasattr(g, 'current_language') else 'en')
         
-        # Add language instruction to system_prompt
-        language_instructions = {
-            'en': "Please respond in English.",
-            'pl': "Proszę odpowiadać w języku polskim.",
-            'az': "Zəhmət olmasa Azərbaycan dilində cavab verin."
-        }
-        
-        # Define identity information (only to be used when directly asked)
-        identity_info = {
-            'en': "Your name is Liya. You are an AI assistant created by LightYearAI, powered by Google's Gemini model. If asked about your creator, founder, or who made you, mention that you were developed by LightYearAI.",
-            'pl': "Nazywasz się Liya. Jesteś asystentem AI stworzonym przez LightYearAI, opartym na modelu Gemini od Google. Jeśli zapytają o twojego twórcę, założyciela lub kto cię stworzył, wspomnij, że zostałaś stworzona przez LightYearAI.",
-            'az': "Sizin adınız Liya-dır. Siz Google-ın Gemini modeli ilə işləyən LightYearAI tərəfindən yaradılmış AI köməkçisisiniz. Əgər yaradıcınız, təsisçiniz və ya sizi kimin yaratdığı haqqında soruşsalar, LightYearAI tərəfindən yaradıldığınızı qeyd edin."
-        }
-        
-        language_instruction = language_instructions.get(language, "Please respond in English.")
-        identity_information = identity_info.get(language, identity_info['en'])
-
-        # Instruction to keep responses natural and never mention AI/limitations
-        natural_instruction = {
-            'en': "Never mention that you are an AI, language model, or chatbot. Do not use disclaimers about your abilities or limitations. Respond as a friendly, knowledgeable assistant in a natural, casual, and human-like way.",
-            'pl': "Nigdy nie wspominaj, że jesteś AI, modelem językowym lub chatbotem. Nie używaj zastrzeżeń dotyczących swoich możliwości lub ograniczeń. Odpowiadaj jako przyjazny, kompetentny asystent w naturalny, swobodny i ludzki sposób.",
-            'az': "Heç vaxt süni intellekt, dil modeli və ya çatbot olduğunuzu qeyd etməyin. Bacarıq və məhdudiyyətləriniz barədə heç bir açıqlama verməyin. Cavablarınızı səmimi, bilikli və insan kimi təbii şəkildə verin."
-        }
-        natural_instruction_text = natural_instruction.get(language, natural_instruction['en'])
-        
-        # Check if user is asking about identity
-        is_identity_question = False
-        identity_keywords = [
-            'your name', 'who are you', 'who made you', 'who created you', 
-            'your creator', 'what are you called', 'what\'s your name',
-            'what is your name', 'kim olduğun', 'kim yaratdı', 'adın nədir',
-            'kim seni yarattı', 'kim jesteś', 'kto cię stworzył', 'jak się nazywasz',
-            'twój twórca', 'twoje imię', 'nazywasz się', 'founder', 'made by',
-            'developed by', 'company', 'LightYearAI', 'Liya', 'your identity'
-        ]
-        
-        # Check if prompt contains identity-related keywords
-        for keyword in identity_keywords:
-            if (keyword.lower() in prompt.lower()):
-                is_identity_question = True
-                break
-        
-        # Prepare the conversation
+        # Prepare the conversation; instruction blocks are precompiled per language
         if (history):
-            # For ongoing conversations, use identity only if specifically asked
+            # Ongoing conversations keep their history; system_prompt only applies to new ones
             chat = model.start_chat(history=history)
-            if (is_identity_question):
-                response = chat.send_message(f"{identity_information}\n\n{natural_instruction_text}\n\n{prompt}\n\n{language_instruction}")
-            else:
-                response = chat.send_message(f"{natural_instruction_text}\n\n{prompt}\n\n{language_instruction}")
+            response = await _send_with_limit(chat.send_message_async, build_prompt_parts(prompt, language), history)
         else:
-            # For new conversations
-            if (system_prompt):
-                # Only include identity in system prompt if specifically asked
-                if (is_identity_question):
-                    system_prompt = f"{system_prompt}\n\n{identity_information}\n\n{natural_instruction_text}\n\n{language_instruction}"
-                else:
-                    system_prompt = f"{system_prompt}\n\n{natural_instruction_text}\n\n{language_instruction}"
-                
-                combined_prompt = f"{system_prompt}\n\nUser request: {prompt}"
-                response = model.generate_content(combined_prompt)
-            else:
-                # When no system prompt, still check if identity question
-                if (is_identity_question):
-                    response = model.generate_content(f"{identity_information}\n\n{natural_instruction_text}\n\n{prompt}\n\n{language_instruction}")
-                else:
-                    response = model.generate_content(f"{natural_instruction_text}\n\n{prompt}\n\n{language_instruction}")
+            response = await _send_with_limit(model.generate_content_async, build_prompt_parts(prompt, language, system_prompt))
         
         return response.text
     except Exception as e:
@@ -819,6 +803,16 @@ def get_ai_response(prompt, history=None, system_prompt=None, language=None):
         else:
             return f"Sorry, I encountered an error: {str(e)}"
 
+def _metrics_response():
+    return Response(render_prometheus(), mimetype=PROMETHEUS_CONTENT_TYPE)
+
+# Prometheus metrics: admins, or a scraper presenting METRICS_TOKEN as a bearer token
+@app.route('/metrics')
+def metrics():
+    if metrics_token_valid(request.headers.get('Authorization')):
+        return _metrics_response()
+    return admin_required(_metrics_response)()
+
 # Language route
 @app.route('/set_language/<lang>')
 def set_language(lang):
@@ -837,23 +831,20 @@ def before_request():
         current_file = session.get('current_file', {})
         filename = current_file.get('filename', '')
         if filename == 'azeri_text.txt':
-            print(f"[IMMEDIATE CLEAR] Detected problematic azeri_text.txt - removing immediately")
             session.pop('current_file', None)
             session.modified = True
-            print(f"[IMMEDIATE CLEAR] azeri_text.txt removed from session")
+            session_log.info("Removed problematic azeri_text.txt from session")
     
     # Session persistence debugging
     has_current_file = 'current_file' in session
-    current_file_size = len(session.get('current_file', {}).get('content', '')) if has_current_file else 0
+    current_file_size = session.get('current_file', {}).get('content_length', 0) if has_current_file else 0
     has_file_id = bool(session.get('current_file', {}).get('file_id')) if has_current_file else False
     endpoint = request.endpoint
     
     if '/static/' not in request.path and request.path != '/favicon.ico':
-        print(f"[SESSION TRACKING] Request to {request.path} ({endpoint})")
-        print(f"[SESSION TRACKING] Has current_file: {has_current_file}, Content size: {current_file_size}, Has file_id: {has_file_id}")
-        if has_current_file:
-            current_filename = session.get('current_file', {}).get('filename', 'unknown')
-            print(f"[SESSION TRACKING] Current filename: {current_filename}")
+        session_log.debug("Request to %s (%s): has current_file=%s, content size=%s, has file_id=%s, filename=%s",
+                          request.path, endpoint, has_current_file, current_file_size, has_file_id,
+                          session.get('current_file', {}).get('filename') if has_current_file else None)
       # ENHANCED STALE SESSION DATA CLEANUP: More aggressive clearing for problematic files
     if has_current_file and '/static/' not in request.path and request.path != '/favicon.ico':
         current_file = session.get('current_file', {})
@@ -891,7 +882,7 @@ def before_request():
                     should_clear = True
                     clear_reason = f"file data older than 30 minutes ({time_diff.total_seconds():.0f} seconds)"
             except Exception as date_error:
-                print(f"[STALE SESSION CLEANUP] Date parsing error: {date_error}")
+                session_log.warning("Stale session cleanup: date parsing error: %s", date_error)
                 should_clear = True
                 clear_reason = "invalid timestamp format - clearing as precaution"
           # FORCE CLEAR: Any file with no timestamp (probably old)
@@ -900,34 +891,32 @@ def before_request():
             clear_reason = "no timestamp - likely old session data"
         
         if should_clear:
-            print(f"[STALE SESSION CLEANUP] FORCE CLEARING: {filename} ({clear_reason})")
+            session_log.info("Stale session cleanup: clearing %s (%s)", filename, clear_reason)
             try:
                 # Import clearing functions
                 from file_optimizer import aggressive_session_clear, clear_flask_session_data
                 
                 # Log session state before clearing
-                session_keys_before = list(session.keys())
-                print(f"[STALE SESSION CLEANUP] Session keys before clearing: {session_keys_before}")
+                session_log.debug("Session keys before clearing: %s", list(session.keys()))
                 
                 # Use aggressive clearing for persistent data
                 aggressive_result = aggressive_session_clear(session)
-                print(f"[STALE SESSION CLEANUP] Aggressive clear result: {aggressive_result}")
+                session_log.debug("Aggressive clear result: %s", aggressive_result)
                 
                 # Follow up with standard clearing
                 clear_result = clear_flask_session_data(session)
-                print(f"[STALE SESSION CLEANUP] Standard clear result: {clear_result}")
+                session_log.debug("Standard clear result: %s", clear_result)
                 
                 # Additional direct clearing - force removal
                 if 'current_file' in session:
-                    print(f"[STALE SESSION CLEANUP] WARNING: File data STILL present after both clearing methods!")
+                    session_log.warning("File data still present after both clearing methods, removing directly")
                     # Force delete the key directly
                     session.pop('current_file', None)
                     session.modified = True
-                    print(f"[STALE SESSION CLEANUP] Direct pop() executed")
                 
                 # Nuclear option if STILL present
                 if 'current_file' in session:
-                    print(f"[STALE SESSION CLEANUP] CRITICAL: File data persisting despite all clearing attempts!")
+                    session_log.error("File data persisting despite all clearing attempts, rebuilding session")
                     # Complete session rebuild
                     user_id = session.get('user_id')
                     user_name = session.get('user_name')
@@ -944,16 +933,14 @@ def before_request():
                     session['language'] = language
                     session.modified = True
                     session.permanent = True
-                    print(f"[STALE SESSION CLEANUP] NUCLEAR CLEAR: Complete session rebuild executed")
                 else:
-                    print(f"[STALE SESSION CLEANUP] SUCCESS: Old file data successfully removed")
+                    session_log.debug("Old file data successfully removed")
                 
                 # Final verification
-                final_keys = list(session.keys())
-                print(f"[STALE SESSION CLEANUP] Final session keys: {final_keys}")
+                session_log.debug("Final session keys: %s", list(session.keys()))
                     
             except Exception as e:
-                print(f"[STALE SESSION CLEANUP] Error during enhanced clearing: {e}")
+                session_log.warning("Error during enhanced session clearing: %s", e)
                 # Ultimate emergency fallback: force clear everything file-related
                 keys_to_remove = []
                 for key in session.keys():
@@ -962,10 +949,9 @@ def before_request():
                 
                 for key in keys_to_remove:
                     session.pop(key, None)
-                    print(f"[STALE SESSION CLEANUP] Emergency removal of key: {key}")
                 
                 session.modified = True
-                print(f"[STALE SESSION CLEANUP] Emergency fallback clearing completed")
+                session_log.warning("Emergency fallback removed session keys: %s", keys_to_remove)
     
     # Set default language if not set
     if ('language' not in session):
@@ -999,23 +985,15 @@ def before_request():
     g.usage_percentage = 0
     g.remaining_tokens = FREE_PLAN_DAILY_LIMIT
     
+    # Static assets and the favicon never render the usage badge
+    is_static_request = request.path.startswith('/static/') or request.path == '/favicon.ico'
+    
     try:
         # Make sure user_id is a valid value, not None or empty string
-        if user_id and str(user_id).strip():
-            db = firestore.client()
-            
-            # Get user's subscription status
-            subscription = get_user_subscription(user_id)
-            plan = subscription.get('plan', 'free')
-            
-            # Get user's token usage for today
-            current_usage = get_user_daily_token_usage(user_id)
-            
-            # Handle case where current_usage might be a dictionary or integer
-            if isinstance(current_usage, dict):
-                tokens_used = current_usage.get('tokens_used', 0)
-            else:
-                tokens_used = current_usage
+        if user_id and str(user_id).strip() and not is_static_request:
+            # Plan and today's usage come from the in-process cache, which
+            # increment_user_token_usage and the Stripe webhook keep current
+            plan, tokens_used = get_cached_plan_and_usage(user_id)
             
             # Get plan limits
             daily_limit = FREE_PLAN_DAILY_LIMIT if (plan == 'free') else PAID_PLAN_DAILY_LIMIT
@@ -1030,19 +1008,18 @@ def before_request():
             g.usage_percentage = usage_percentage
             g.remaining_tokens = daily_limit - tokens_used
     except Exception as e:
-        print(f"[TOKEN ERROR] Failed to retrieve token usage data: {e}")
+        session_log.warning("Failed to retrieve token usage data: %s", e)
         # Error handling is not needed here since we already set default values
     
     # Additional session debugging only for non-static requests
-    if '/static/' not in request.path and request.path != '/favicon.ico':
-        print(f"[SESSION DEBUG] Cookie session ID: {request.cookies.get('session', 'no-session-cookie')[:10]}...")
-        print(f"[SESSION DEBUG] Session modified flag: {session.modified}")
-        if has_current_file:
-            print(f"[SESSION DEBUG] File metadata: {session['current_file'].get('filename')}, uploaded: {session['current_file'].get('upload_time')}")
+    if not is_static_request and session_log.debug_enabled():
+        session_log.debug("Cookie session ID: %s..., modified flag: %s",
+                          request.cookies.get('session', 'no-session-cookie')[:10], session.modified)
+        # Size-capped unless debug is on for this request
+        session_log.debug("Session: %s", user_content(dict(session), "session"))
+        session_log.debug("g.user_name: %s, g.user_picture: %s", g.user_name, g.user_picture)
     # Add Firestore client to template context
     g.db = firestore.client() if firebase_admin._apps else None
-    print('SESSION:', dict(session))
-    print('g.user_name:', g.user_name, 'g.user_picture:', g.user_picture)
 
     # Add Firebase configuration to all templates
     g.firebase_api_key = os.environ.get('FIREBASE_API_KEY', '')
@@ -1225,6 +1202,94 @@ def get_user_memory(user_id, key, default=None):
         return doc.to_dict().get(key, default)
     return default
 
+def resolve_study_document_id(data, user_id):
+    """
+    Pick the stored document a study chat request refers to.
+
+    A fileId sent by the client is used when the document belongs to the user,
+    otherwise the file currently referenced by the session.
+    """
+    if not (data.get('hasFile') or data.get('hasFileId')) or data.get('pdfContent'):
+        return None
+    requested_id = data.get('fileId')
+    if requested_id:
+        from document_store import get_document_store
+        record = get_document_store().get_record(requested_id)
+        if record and record.get('metadata', {}).get('user_id') == user_id:
+            return requested_id
+    return (session.get('current_file') or {}).get('file_id')
+
+async def build_study_mcp_context(user_message, user_id, session_id, chat_history=None,
+                                  pdf_content=None, document_id=None):
+    """
+    Build the MCP context for a study chat turn, including uploaded-file metadata.
+    Shared by the JSON and streaming study chat endpoints.
+
+    Pass the chat history if the request already fetched it; otherwise it is
+    loaded alongside the user's memory and the document.
+    """
+    from agents.utils import build_mcp_context
+    from mcp.context import ContextType, ContextMetadata
+
+    has_document = bool(pdf_content or document_id)
+
+    # Create MCP context from inputs, including file content
+    timings = {}
+    mcp_context = await build_mcp_context(
+        user_input=user_message,
+        user_id=user_id,
+        session_id=session_id,
+        document_text=pdf_content,  # Inline content sent by the client, if any
+        document_id=document_id,  # Otherwise resolved from the document store
+        chat_history=chat_history,
+        context_type="study",
+        retrieve_document=True,  # Only the chunks relevant to this turn
+        load_history=chat_history is None,
+        timings=timings
+    )
+    if chat_log.debug_enabled():
+        chat_log.debug("Study context sources: %s",
+                       ", ".join(f"{name}={secs * 1000:.0f}ms" for name, secs in timings.items()))
+
+    # Add a system instruction to emphasize using the document content in responses
+    if has_document:
+        mcp_context.add_system_instruction(
+            "This conversation includes an uploaded document. When the user asks about the document or its contents, " +
+            "you MUST reference and use information from the document in your response. " +
+            "The document text has been provided in the context."
+        )
+
+    # If file is present, add explicit metadata to help MCP understand the context better
+    if 'current_file' in session and has_document:
+        # Add file metadata to the context
+        file_metadata = {
+            "filename": session['current_file'].get('filename', 'document.pdf'),
+            "file_id": session['current_file'].get('file_id', ''),
+            "file_type": os.path.splitext(session['current_file'].get('filename', ''))[1][1:].lower() or 'pdf',
+            "has_content": has_document,
+            "content_length": len(pdf_content) if pdf_content else session['current_file'].get('content_length', 0)
+        }
+
+        # Use the correct ContextType with more explicit instructions about using the document content
+        file_context_message = {
+            "file_context": f"The user has uploaded a document named '{file_metadata['filename']}'. " +
+                           f"The content of this document has been included in the conversation context. " +
+                           f"When the user asks about 'the file' or 'the document', they are referring to this document. " +
+                           f"IMPORTANT: You must reference the document content when responding to questions about it.",
+            "response_requirements": "When the user asks about the document, make sure to extract and use relevant information from the document in your response. " +
+                                    "If the user asks for information that may be contained in the document, check the document content first.",
+            "file_metadata": file_metadata
+        }
+
+        # Create and add the element with high importance to ensure it's prioritized
+        mcp_context.add_element(
+            content=file_context_message,
+            type_=ContextType.USER_MEMORY,  # Use USER_MEMORY which is a valid ContextType
+            metadata=ContextMetadata(source="file_upload", importance=10)
+        )
+
+    return mcp_context
+
 @app.route('/study/chat', methods=['POST'])
 @login_required
 async def study_chat():
@@ -1244,39 +1309,32 @@ async def study_chat():
     verify_session_state("study_chat_start")
     
     data = request.json
-    print(f"DEBUG: study_chat called with data keys: {list(data.keys())}")
     user_message = data.get('message', '')
     pdf_content = data.get('pdfContent', None)
     file_id = data.get('fileId', None)
     formatted_response = "<p>Response processing error</p>"  # Default value in case of errors
     
-    # Log session information to help debug
-    print(f"DEBUG: Session info - user_id: {session.get('user_id')}")
-    if 'current_file' in session:
-        print(f"DEBUG: Session has current_file with keys: {list(session['current_file'].keys())}")
-        print(f"DEBUG: Current file in session - filename: {session['current_file'].get('filename')}, id: {session['current_file'].get('file_id')}")
-        print(f"DEBUG: Content length in session: {len(session['current_file'].get('content', ''))}")
+    # Log request and session information to help debug
+    if chat_log.debug_enabled():
+        chat_log.debug("study_chat called with data keys: %s, user_id: %s", list(data.keys()), session.get('user_id'))
+        chat_log.debug("Session current_file: %s", session.get('current_file'))
+        chat_log.debug("Upload flags: hasFileId=%s, hasFile=%s, pdf_content=%s, file_id=%s",
+                       data.get('hasFileId', False), data.get('hasFile', False), bool(pdf_content), file_id)
     
-    # Support front-end upload flags to load file context
-    # First check if hasFile or hasFileId flags are set
-    has_file_flag = data.get('hasFile', False)
-    has_file_id_flag = data.get('hasFileId', False)
-    print(f"DEBUG: Upload flags: hasFileId={has_file_id_flag}, hasFile={has_file_flag}")
-    print(f"DEBUG: File data: pdf_content={bool(pdf_content)}, file_id={file_id}")
-    print(f"DEBUG: Current file in session: {'current_file' in session}")
-    
-    # If flags are set but we don't have content yet, get it from session
-    if (has_file_flag or has_file_id_flag) and not pdf_content and 'current_file' in session:
-        print("Loading file content from session due to flags")
-        pdf_content = session['current_file'].get('content')
-        file_id = session['current_file'].get('file_id')
-        print(f"Loaded file from session: id={file_id}, content_length={len(pdf_content) if pdf_content else 0}")
+    # If flags are set but we don't have content yet, refer to the stored document.
+    # The session only holds the file ID; the text is resolved lazily from the
+    # document store by whichever branch below actually needs it.
     user_id = session.get('user_id')
+    document_id = resolve_study_document_id(data, user_id)
+    if document_id:
+        file_id = document_id
+        chat_log.debug("Using stored document: id=%s", file_id)
+    has_document = bool(pdf_content or document_id)
     session_id = (data.get('sessionId') or str(int((time.time() * 1000))))
     
     try:
-        # Check if user has exceeded their token limit
-        can_use, remaining_tokens = check_user_token_limit(user_id)
+        # Check if user has exceeded their token limit; Firestore calls run off the event loop
+        can_use, remaining_tokens = await asyncio.to_thread(check_user_token_limit, user_id)
         
         if (not can_use):
             return jsonify({
@@ -1287,17 +1345,13 @@ async def study_chat():
         # Import the chat history functions
         from firebase_utils import get_chat_history, save_chat_message, format_chat_history_for_api
 
-        # Get chat history from Firestore
-        chat_history = get_chat_history(user_id, 'study')        # Add file context to user message if needed
+        # Add file context to user message if needed
         enhanced_user_message = user_message
-        if pdf_content and ('current_file' in session):
+        if has_document and ('current_file' in session):
             filename = session['current_file'].get('filename', 'document.pdf')
             file_context = f"I'm asking about the document I uploaded titled: '{filename}'. Please answer using the content of this document."
             enhanced_user_message = f"{file_context}\n\n{user_message}"
 
-        # Save the user message to Firestore
-        save_chat_message(user_id, 'study', user_message, 'user')
-
         # --- Memory: Extract and save facts if user shares them ---
         import re
 
@@ -1325,8 +1379,10 @@ async def study_chat():
                 # Extract and save facts to memory
                 pass
 
-        # Debug: print what is being saved
-        print(f"[MEMORY SAVE] user_id={user_id} | extracted_facts={matches if ('matches' in locals() and matches) else 'None'} | message='{user_message}'")
+        # Debug: log what is being saved; the message is size-capped unless debugging
+        chat_log.debug("Memory save: user_id=%s | extracted_facts=%s | message=%s",
+                       user_id, matches if ('matches' in locals() and matches) else 'None',
+                       user_content(user_message, "study_chat"))
 
         # Extract any command from the text
         command_regex = r"^\/(\w+)(?:\s+(.*))?$"
@@ -1347,6 +1403,14 @@ async def study_chat():
             pdf_reference_terms = ["pdf", "document", "file", "attached", "attachment"]
             is_pdf_reference = (any((term in command_text.lower()) for term in pdf_reference_terms) or (command_text.strip() == ""))
 
+            # Commands that operate on the document need its full text
+            if is_pdf_reference and not pdf_content and document_id:
+                pdf_content = await asyncio.to_thread(load_document, document_id)
+
+            # Get chat history from Firestore, then save the user message to it
+            chat_history = await asyncio.to_thread(get_chat_history, user_id, 'study')
+            await asyncio.to_thread(save_chat_message, user_id, 'study', user_message, 'user')
+
             # Use traditional approach for commands
             memory_facts = []
             if (user_id):
@@ -1376,7 +1440,7 @@ async def study_chat():
                 else:
                     enhanced_prompt = f"Please proofread and improve the following text: \n\n{command_text}"
                 
-                response = get_ai_response(enhanced_prompt, formatted_history, system_prompt, g.current_language)
+                response = await get_ai_response_async(enhanced_prompt, formatted_history, system_prompt, g.current_language)
                 formatted_response = f"<div class='proofread-result'><h5>Proofreading Results</h5>{response}</div>"
             
             elif (command_type == 'summarize'):
@@ -1395,7 +1459,7 @@ async def study_chat():
                 else:
                     enhanced_prompt = f"Please summarize the following text: \n\n{command_text}"
                 
-                response = get_ai_response(enhanced_prompt, formatted_history, system_prompt, g.current_language)
+                response = await get_ai_response_async(enhanced_prompt, formatted_history, system_prompt, g.current_language)
                 formatted_response = f"<div class='summary-result'><h5>Summary Results</h5>{response}</div>"
                 
             # Add other command types as needed...
@@ -1415,65 +1479,20 @@ async def study_chat():
                 if (memory_context):
                     enhanced_prompt = f"{memory_context}\n\n{enhanced_prompt}"
                 
-                response = get_ai_response(enhanced_prompt, formatted_history, system_prompt, g.current_language)
+                response = await get_ai_response_async(enhanced_prompt, formatted_history, system_prompt, g.current_language)
                 formatted_response = "<p>" + response.replace("\n", "<br>") + "</p>"
         else:
             # USE MCP FOR NORMAL CHAT INTERACTIONS
             from mcp.model_adapter import MCPModelFactory
-            from agents.utils import create_mcp_context_from_inputs, extract_metrics_from_mcp_response
-
-            # Initialize MCP context
-            context_type = "study"
-
-            # Get file name if available
-            filename = None
-            if 'current_file' in session and pdf_content:
-                filename = session['current_file'].get('filename')            # Create MCP context from inputs, including file content
-            mcp_context = create_mcp_context_from_inputs(
-                user_input=user_message,
-                user_id=user_id,
-                session_id=session_id,
-                document_text=pdf_content,  # The PDF content will be properly included here
-                chat_history=chat_history,
-                context_type=context_type
-            )
-            
-            # Add a system instruction to emphasize using the document content in responses
-            if pdf_content:
-                mcp_context.add_system_instruction(
-                    "This conversation includes an uploaded document. When the user asks about the document or its contents, " +
-                    "you MUST reference and use information from the document in your response. " +
-                    "The document text has been provided in the context."
-                )            # If file is present, add explicit metadata to help MCP understand the context better
-            if 'current_file' in session and pdf_content:
-                from mcp.context import ContextType, ContextMetadata
-
-                # Add file metadata to the context
-                file_metadata = {
-                    "filename": session['current_file'].get('filename', 'document.pdf'),
-                    "file_id": session['current_file'].get('file_id', ''),
-                    "file_type": os.path.splitext(session['current_file'].get('filename', ''))[1][1:].lower() or 'pdf',
-                    "has_content": bool(pdf_content),
-                    "content_length": len(pdf_content) if pdf_content else 0
-                }
+            from agents.utils import extract_metrics_from_mcp_response
 
-                # Use the correct ContextType with more explicit instructions about using the document content
-                file_context_message = {
-                    "file_context": f"The user has uploaded a document named '{file_metadata['filename']}'. " +
-                                   f"The content of this document has been included in the conversation context. " +
-                                   f"When the user asks about 'the file' or 'the document', they are referring to this document. " +
-                                   f"IMPORTANT: You must reference the document content when responding to questions about it.",
-                    "response_requirements": "When the user asks about the document, make sure to extract and use relevant information from the document in your response. " +
-                                            "If the user asks for information that may be contained in the document, check the document content first.",
-                    "file_metadata": file_metadata                        
-                }
-
-                # Create and add the element with high importance to ensure it's prioritized
-                mcp_context.add_element(
-                    content=file_context_message,
-                    type_=ContextType.USER_MEMORY,  # Use USER_MEMORY which is a valid ContextType
-                    metadata=ContextMetadata(source="file_upload", importance=10)
-                )
+            # History, memory and the document are loaded together; the new message is
+            # saved after so it isn't also replayed as history
+            mcp_context = await build_study_mcp_context(
+                user_message, user_id, session_id,
+                pdf_content=pdf_content, document_id=document_id
+            )
+            await asyncio.to_thread(save_chat_message, user_id, 'study', user_message, 'user')
 
             # Get model adapter
             model_adapter = MCPModelFactory.create(model_name="gemini")
@@ -1488,22 +1507,18 @@ async def study_chat():
             # Extract token metrics for usage tracking
             metrics = extract_metrics_from_mcp_response(response_obj)
             tokens_used = metrics.get('total_tokens', 0)            # Track token usage
-            track_token_usage_for_api_call(user_id, user_message, response, tokens_used)
+            await asyncio.to_thread(track_token_usage_for_api_call, user_id, user_message, response, tokens_used)
         
         # Save assistant response to Firestore
-        save_chat_message(user_id, 'study', response, 'assistant')
+        await asyncio.to_thread(save_chat_message, user_id, 'study', response, 'assistant')
           
         # Make sure to check if current_file exists in session and has content
-        has_file = bool((pdf_content and 'current_file' in session) or ('current_file' in session and session['current_file'].get('content')))
+        has_file = bool('current_file' in session and (has_document or session['current_file'].get('file_id')))
         
         # Final verification of session state before returning response
         final_state = verify_session_state("study_chat_end")
-        print(f"[FINAL SESSION] hasFile = {has_file}, content available: {bool(pdf_content)}")
-        
-        if has_file:
-            print(f"[FINAL SESSION] Filename: {session.get('current_file', {}).get('filename')}")
-            print(f"[FINAL SESSION] File ID: {session.get('current_file', {}).get('file_id')}")
-            print(f"[FINAL SESSION] Content length: {len(session.get('current_file').get('content', ''))}")
+        chat_log.debug("Final session: hasFile=%s, content available=%s, current_file=%s",
+                       has_file, has_document, session.get('current_file') if has_file else None)
         
         return jsonify({
             'response': formatted_response,
@@ -1512,17 +1527,115 @@ async def study_chat():
             'fileId': session.get('current_file', {}).get('file_id') if has_file else None
         })
     except Exception as e:
-        print(f"Error in study chat: {e}")
-        import traceback
-        traceback.print_exc()
+        chat_log.exception("Error in study chat: %s", e)
         error_message = "Sorry, I encountered an error processing your request. Please try again."
 
         # Try to save the error to Firestore to help with debugging
         try:
-            save_chat_message(user_id, 'study', f"ERROR: {str(e)}", 'system')
+            await asyncio.to_thread(save_chat_message, user_id, 'study', f"ERROR: {str(e)}", 'system')
         except:
             pass
         return jsonify({'response': f"<p>{error_message}</p>"})
+
+
+def sse_event(event, payload):
+    """Format a Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@app.route('/study/chat/stream', methods=['POST'])
+@login_required
+def study_chat_stream():
+    """
+    Server-Sent Events variant of /study/chat.
+
+    Emits a `chunk` event for every piece of text as the model produces it and a
+    final `done` event once token usage has been recorded. Slash commands
+    (/proofread, /summarize, ...) are still handled by /study/chat.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        session.clear()
+        return jsonify({'error': 'authentication_required'}), 401
+
+    data = (request.get_json() or {})
+    user_message = data.get('message', '')
+    if not user_message:
+        return jsonify({'error': 'No message provided'}), 400
+
+    pdf_content = data.get('pdfContent', None)
+    session_id = (data.get('sessionId') or str(int((time.time() * 1000))))
+
+    # Same document resolution as /study/chat: only the ID is kept in the session
+    document_id = resolve_study_document_id(data, user_id)
+    has_document = bool(pdf_content or document_id)
+
+    from firebase_utils import save_chat_message
+    from mcp.model_adapter import MCPModelFactory
+
+    try:
+        can_use, remaining_tokens = check_user_token_limit(user_id)
+        if (not can_use):
+            return jsonify({
+                'response': "<p>You've reached your daily token limit. Please try again tomorrow or upgrade to premium for a higher limit.</p>",
+                'error': 'token_limit_exceeded'
+            }), 429
+
+        enhanced_user_message = user_message
+        if has_document and ('current_file' in session):
+            filename = session['current_file'].get('filename', 'document.pdf')
+            enhanced_user_message = f"I'm asking about the document I uploaded titled: '{filename}'. Please answer using the content of this document.\n\n{user_message}"
+
+        # History, memory and the document are loaded together; the new message is saved after
+        # so it isn't also replayed as history
+        mcp_context = run_async(build_study_mcp_context(
+            user_message, user_id, session_id,
+            pdf_content=pdf_content, document_id=document_id
+        ))
+        save_chat_message(user_id, 'study', user_message, 'user')
+        model_adapter = MCPModelFactory.create(model_name="gemini")
+        stream = model_adapter.stream_with_context(enhanced_user_message, mcp_context)
+    except Exception as e:
+        chat_log.exception("Error in study chat stream: %s", e)
+        try:
+            save_chat_message(user_id, 'study', f"ERROR: {str(e)}", 'system')
+        except:
+            pass
+        return jsonify({'response': "<p>Sorry, I encountered an error processing your request. Please try again.</p>"})
+
+    current_file = session.get('current_file') or {}
+    file_info = {
+        'hasFile': bool(current_file.get('file_id')),
+        'fileName': current_file.get('filename'),
+        'fileId': current_file.get('file_id')
+    }
+
+    def generate():
+        try:
+            for chunk in iterate_async(stream):
+                yield sse_event('chunk', {'text': chunk})
+
+            # Token accounting is finalized once the full response is known
+            tokens_used = stream.usage_metrics.get('total_tokens', 0)
+            track_token_usage_for_api_call(user_id, user_message, stream.text, tokens_used)
+            save_chat_message(user_id, 'study', stream.text, 'assistant')
+
+            yield sse_event('done', {
+                'response': "<p>" + stream.text.replace("\n", "<br>") + "</p>",
+                'tokensUsed': tokens_used,
+                **file_info
+            })
+        except Exception as e:
+            chat_log.exception("Error in study chat stream: %s", e)
+            yield sse_event('error', {
+                'response': "<p>Sorry, I encountered an error processing your request. Please try again.</p>"
+            })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/study/upload', methods=['POST'])
 @login_required
 def study_upload():
@@ -1537,7 +1650,7 @@ def study_upload():
     print(f"[CACHE FIX] Standard session clearing result: {clear_result}")
     
     # Verify session state before processing upload
-    before_state = verify_session_state("pre_upload")
+    verify_session_state("pre_upload")
     
     # Double check that the user is properly authenticated
     if not session.get('user_id'):
@@ -1562,81 +1675,25 @@ def study_upload():
 
             # Save the uploaded file
             filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            # Unique name on disk: the file is read after this request returns
+            file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
             file.save(file_path)
             
             print(f"[UPLOAD DEBUG] File saved to: {file_path}")
-            print(f"[UPLOAD DEBUG] File exists: {os.path.exists(file_path)}")
             print(f"[UPLOAD DEBUG] File size: {os.path.getsize(file_path)} bytes")
 
-            # Extract text from the file
-            print(f"[UPLOAD DEBUG] Starting text extraction from file: {filename}")
-            text = extract_text_from_file(file_path)
-            
-            if (not text):
-                print(f"[UPLOAD DEBUG] Failed to extract text from file: {filename}")
-                return jsonify({'error': 'Could not extract text from the file'}), 400
-            
-            text_length = len(text) if text else 0
-            print(f"[UPLOAD DEBUG] Successfully extracted text, length: {text_length} characters")
-            print(f"[UPLOAD DEBUG] Text sample (first 100 chars): {text[:100] if text else 'EMPTY'}")
-            
-            # Check if this will be stored to Firebase/session
+            # Parse the file in the background; the client polls the status endpoint
             user_id = session.get('user_id')
-            print(f"[UPLOAD DEBUG] User ID from session: {user_id}")
-            
-            # Store in current_file session variable to enable context in future conversations
-            if text:
-                print(f"[UPLOAD DEBUG] Storing file content in session, length: {len(text)} characters")
-                
-                # Generate a random file ID if we don't have one
-                file_id = str(uuid.uuid4())
-                
-                # Store in session                # Save session state before update for comparison
-                before_session = session.get('current_file', {})
-                before_keys = list(before_session.keys()) if before_session else []
-                  # Using convert_to_serializable that was imported at the top of the file
-                # No need to redefine or import the function here
-                
-                # Create file metadata with proper serialization
-                session['current_file'] = {
-                    'file_id': file_id,
-                    'filename': filename,
-                    'content': text,
-                    'upload_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-                session.modified = True
-                
-                # Force session save by accessing it again
-                print(f"[UPLOAD DEBUG] Session updated with file: {filename}, ID: {file_id}")
-                print(f"[UPLOAD DEBUG] Verify content in session: {len(session['current_file']['content'])} characters")
-                print(f"[UPLOAD DEBUG] Session content first 50 chars: {session['current_file']['content'][:50]}")
-                
-                # Verify session persistence by checking if the data was properly saved
-                print(f"[SESSION PERSISTENCE] Before update - keys: {before_keys}")
-                print(f"[SESSION PERSISTENCE] After update - keys: {list(session['current_file'].keys())}")
-                print(f"[SESSION PERSISTENCE] Session implementation: {app.session_interface.__class__.__name__}")
-                  # Double check session storage
-                file_content_len = len(session['current_file']['content'])
-                session_id = request.cookies.get('session', 'no-session-cookie')
-                print(f"[SESSION PERSISTENCE] Content length in session: {file_content_len} bytes")
-                print(f"[SESSION PERSISTENCE] Session cookie exists: {'session' in request.cookies}")
-                print(f"[SESSION PERSISTENCE] Session ID: {session_id[:10]}... (truncated)")
-                
-                # Final verification after session update
-                after_state = verify_session_state("post_upload")
-                
-                # Log the differences between before and after states
-                print(f"[SESSION COMPARE] Content before: {before_state.get('content_length', 0)}, after: {after_state.get('content_length', 0)}")
-                print(f"[SESSION COMPARE] File ID before: {before_state.get('file_id', 'None')}, after: {after_state.get('file_id', 'None')}")
-                print(f"[SESSION COMPARE] Filename before: {before_state.get('filename', 'None')}, after: {after_state.get('filename', 'None')}")
+            job_id = get_upload_job_queue().submit(user_id, file_path, filename)
+            print(f"[UPLOAD DEBUG] Queued extraction job {job_id} for file: {filename}")
             
             return jsonify({
                 'success': True,
                 'filename': filename,
-                'content': text,
-                'message': 'File processed successfully'
-            })
+                'job_id': job_id,
+                'status_url': url_for('study_upload_status', job_id=job_id),
+                'message': 'File uploaded, processing started'
+            }), 202
             
         except Exception as e:
             print(f"[UPLOAD DEBUG] Global error in file processing: {e}")
@@ -1644,6 +1701,48 @@ def study_upload():
     
     return jsonify({'error': 'Invalid file'}), 400
 
+@app.route('/study/upload/status/<job_id>', methods=['GET'])
+@login_required
+def study_upload_status(job_id):
+    """Report progress of a background extraction job started by /study/upload."""
+    user_id = session.get('user_id')
+    job = get_upload_job_queue().get(job_id)
+    if not job or job.get('user_id') != user_id:
+        return jsonify({'error': 'Job not found'}), 404
+
+    response = {
+        'job_id': job_id,
+        'status': job['status'],
+        'filename': job['filename'],
+        'pages_processed': job['pages_processed'],
+        'total_pages': job['total_pages']
+    }
+
+    if job['status'] == JOB_FAILED:
+        response['error'] = job['error']
+    elif job['status'] == JOB_DONE:
+        response.update({
+            'file_id': job['file_id'],
+            'content_length': job['content_length'],
+            'preview': job['preview']
+        })
+
+        # Point the session at the extracted document once, so later chat
+        # requests resolve it from the document store
+        current_file = session.get('current_file') or {}
+        if current_file.get('file_id') != job['file_id']:
+            session['current_file'] = {
+                'file_id': job['file_id'],
+                'filename': job['filename'],
+                'content_length': job['content_length'],
+                'content_hash': job['content_hash'],
+                'upload_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            session.modified = True
+            print(f"[UPLOAD DEBUG] Session updated with file: {job['filename']}, ID: {job['file_id']}")
+
+    return jsonify(response)
+
 # Proofreading Routes
 @app.route('/proofread/upload', methods=['POST'])
 @login_required
@@ -1684,104 +1783,13 @@ def proofread_upload():
             
             print(f"Successfully extracted text, length: {len(text)} characters")
 
-            # Get AI to proofread the text
-
-            # Limit text size to avoid token limits
-            text_to_process = (text[:4000] if (len(text) > 4000) else text)
-            
-            prompt = f"""
-            You are a professional proofreader and editor. Please carefully proofread the following text and identify ANY errors or improvements, no matter how small.
-
-            Look for:
-            - Spelling errors
-            - Grammar mistakes
-            - Punctuation issues
-            - Awkward phrasing
-            - Run-on sentences
-            - Inconsistencies
-
-            Even if the text seems mostly correct, examine it critically and find areas for improvement.
-            
-            Text to proofread:
-            {text_to_process}
-
-            Format your response as a JSON with the following structure:
-            {{
-                "corrected_text": "The full corrected text with all errors fixed",
-                "corrections": [
-                    {{
-                        "original": "original text with error",
-                        "corrected": "corrected text",
-                        "explanation": "detailed explanation of why this needed correction"
-                    }}
-                ]
-            }}
-
-            If there are truly no errors at all (which is rare), return an empty list for "corrections".
-            """
-            
-            response = get_ai_response(prompt)
-            print(f"AI proofreading response received, length: {len(response)} characters")
-            
-            try:
-
-                # Try to parse as JSON, but handle if it's not valid JSON
-                json_start = response.find('{')
-                json_end = (response.rfind('}') + 1)
-                if ((json_start >= 0) and (json_end > json_start)):
-                    json_str = response[json_start:json_end]
-                    result = json.loads(json_str)
-
-                    # Make sure corrections is a list, even if empty
-                    if ("corrections" not in result):
-                        result["corrections"] = []
-
-                    # If no corrections found but texts differ, create a fallback correction
-                    if ((len(result["corrections"]) == 0) and (result["corrected_text"] != text_to_process)):
-                        result["corrections"] = [{
-                            "original": "Original text",
-                            "corrected": "Corrected text",
-                            "explanation": "The text contained errors that have been corrected."
-                        }]
-                        
-                else:
+            # Proofread the whole document chunk by chunk through MCP
+            user_id = session.get('user_id')
+            result = run_async(proofread_with_mcp(text, user_id=user_id, session_id=str(int((time.time() * 1000)))))
+            print(f"Proofreading finished: {len(result['corrections'])} corrections across {result['chunks']} chunk(s)")
 
-                    # Fall back to parsing the response manually
-                    corrected_text = text  # Default to original text
-                    corrections = []
-                    
-                    lines = response.split('\n')
-                    for i, line in enumerate(lines):
-                        if (("original:" in line.lower()) and ((i + 1) < len(lines)) and ("corrected:" in lines[(i + 1)].lower())):
-                            original = line.split(":", 1)[1].strip()
-                            corrected = lines[(i + 1)].split(":", 1)[1].strip()
-                            explanation = ""
-                            if (((i + 2) < len(lines)) and ("explanation:" in lines[(i + 2)].lower())):
-                                explanation = lines[(i + 2)].split(":", 1)[1].strip()
-                            
-                            corrections.append({
-                                "original": original,
-                                "corrected": corrected,
-                                "explanation": explanation
-                            })
-                    
-                    result = {
-                        "corrected_text": corrected_text,
-                        "corrections": corrections
-                    }
-            except Exception as e:
-                print(f"Error parsing JSON response: {e}")
-                print(f"Response content: {response[:500]}...")
-
-                # Create a basic structure if parsing fails
-                result = {
-                    "corrected_text": text,
-                    "corrections": [{
-                        "original": "Error parsing response",
-                        "corrected": "Please try again",
-                        "explanation": str(e)
-                    }]
-                }
+            # Track token usage
+            track_token_usage_for_api_call(user_id, "Proofread file", result["corrected_text"], result["tokens_used"])
             
             try:
 
@@ -1809,7 +1817,10 @@ def proofread_upload():
                 
                 return jsonify({
                     'pdf_url': pdf_url,
-                    'corrections': result["corrections"]
+                    'corrections': result["corrections"],
+                    'truncated': result["truncated"],
+                    'failed_chunks': result["failed_chunks"],
+                    'warning': proofread_warning(result)
                 })
             except Exception as e:
                 print(f"Error generating or saving PDF: {e}")
@@ -1843,97 +1854,33 @@ async def proofread_text():
         
     try:
 
-        # Check token limits
-        can_use, remaining_tokens = check_user_token_limit(user_id)
+        # Check token limits; Firestore and file work runs off the event loop
+        can_use, remaining_tokens = await asyncio.to_thread(check_user_token_limit, user_id)
         if (not can_use):
             return jsonify({
                 'error': 'Token limit exceeded',
                 'message': "You've reached your daily token limit. Please try again tomorrow or upgrade to premium for a higher limit."
             }), 429
 
-        # Limit length for tokens
-        text_to_process = (text[:4000] if (len(text) > 4000) else text)
-
-        # USE MCP FOR PROOFREADING
-        from mcp.model_adapter import MCPModelFactory
-        from agents.utils import create_mcp_context_from_inputs, extract_metrics_from_mcp_response
-        from mcp.context import ContextType, ContextMetadata
-
-        # Create MCP context
-        mcp_context = create_mcp_context_from_inputs(
-            user_input=text_to_process,
-            user_id=user_id,
-            session_id=session_id,
-            context_type="proofread"
-        )
-
-        # Add specific proofreading instructions
-        mcp_context.add_system_instruction(
-            """
-            You are a professional proofreader and editor. Please carefully proofread the following text and identify ANY errors or improvements.
-            Look for:
-            - Spelling errors
-            - Grammar mistakes
-            - Punctuation issues
-            - Awkward phrasing
-            - Run-on sentences
-            - Inconsistencies
-            
-            Format your response as a JSON with the following structure:
-            {
-                "corrected_text": "The full corrected text with all errors fixed",
-                "corrections": [
-                    {
-                        "original": "original text with error",
-                        "corrected": "corrected text",
-                        "explanation": "detailed explanation of why this needed correction"
-                    }
-                ]
-            }
-            
-            If there are truly no errors at all (which is rare), return an empty list for "corrections".
-            """
-        )
-
-        # Get model adapter
-        model_adapter = MCPModelFactory.create(model_name="gemini")
-
-        # Generate response
-        response_obj = await model_adapter.generate_with_context("Please proofread this text", mcp_context)
-        response = response_obj.text
-
-        # Extract metrics for usage tracking
-        metrics = extract_metrics_from_mcp_response(response_obj)
-        tokens_used = metrics.get('total_tokens', 0)
+        # USE MCP FOR PROOFREADING: the whole text, split into chunks proofread concurrently
+        result = await proofread_with_mcp(text, user_id=user_id, session_id=session_id)
 
         # Track token usage
-        track_token_usage_for_api_call(user_id, "Proofread text", response, tokens_used)
-
-        # Parse JSON from AI response
-        json_start = response.find('{')
-        json_end = (response.rfind('}') + 1)
-        result = {'corrected_text': text_to_process, 'corrections': []}
-        
-        if ((json_start >= 0) and (json_end > json_start)):
-            try:
-                import json
-                json_str = response[json_start:json_end]
-                result = json.loads(json_str)
-            except Exception as json_error:
-                print(f"Error parsing JSON from AI response: {json_error}")
+        await asyncio.to_thread(track_token_usage_for_api_call, user_id, "Proofread text",
+                                result['corrected_text'], result['tokens_used'])
 
         # Prepare a temporary original file for PDF header
         temp_txt = os.path.join(tempfile.gettempdir(), f"text_{uuid.uuid4().hex}.txt")
         with open(temp_txt, 'w', encoding='utf-8') as f:
-            f.write(text_to_process)
+            f.write(text)
 
         # Generate PDF
-        pdf_path = create_proofread_pdf(result['corrected_text'], result['corrections'], temp_txt)
+        pdf_path = await asyncio.to_thread(create_proofread_pdf, result['corrected_text'], result['corrections'], temp_txt)
 
         # Copy PDF to uploads
         pdf_filename = f"text_{uuid.uuid4().hex}_corrected.pdf"
         final_pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], pdf_filename)
-        shutil.copy2(pdf_path, final_pdf_path)
+        await asyncio.to_thread(shutil.copy2, pdf_path, final_pdf_path)
 
         # Build URL for download
         if (os.environ.get('RENDER')):
@@ -1942,7 +1889,13 @@ async def proofread_text():
         else:
             pdf_url = url_for('download_file', filename=pdf_filename, _external=True)
             
-        return jsonify({'pdf_url': pdf_url, 'corrections': result['corrections']})
+        return jsonify({
+            'pdf_url': pdf_url,
+            'corrections': result['corrections'],
+            'truncated': result['truncated'],
+            'failed_chunks': result['failed_chunks'],
+            'warning': proofread_warning(result)
+        })
     except Exception as e:
         print(f"Error in proofread_text: {e}")
         return jsonify({'error': str(e)}), 500
@@ -2021,9 +1974,8 @@ def excel_agent_process():
                 "type": "generation"
             }
 
-        # Process with the agent
-        import asyncio
-        result = asyncio.run(agent.process_request(uploaded_file, instruction))
+        # Process with the agent on the shared event loop
+        result = run_async(agent.process_request(uploaded_file, instruction))
         
         # Track token usage
         track_token_usage_for_api_call(user_id, instruction, "Excel Agent Processing")
@@ -0,0 +1,142 @@
+"""
+Shared asyncio runtime for the web workers.
+
+Each worker process runs one long-lived event loop on a background thread.
+Sync Flask routes submit coroutines to it and wait for the result, and Flask's
+async views are dispatched to it instead of getting a fresh loop per request.
+Because the loop outlives requests, async clients, semaphores and caches bound
+to it can be reused across requests.
+
+Outbound model calls are scheduled on this loop by model_scheduler, which
+bounds concurrency and applies rate limits per worker.
+"""
+
+import os
+import asyncio
+import threading
+import functools
+import contextvars
+import concurrent.futures
+
+# Default time a sync caller waits for a submitted coroutine (seconds, 0 = no limit)
+ASYNC_CALL_TIMEOUT = float(os.getenv("ASYNC_CALL_TIMEOUT", "300"))
+
+_loop = None
+_loop_thread = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """
+    Get the worker's shared event loop, starting it on first use.
+
+    The loop is recreated after a fork so gunicorn workers never share a loop
+    inherited from the master process.
+    """
+    global _loop, _loop_thread, _loop_pid
+    pid = os.getpid()
+    if _loop is not None and _loop_pid == pid and _loop_thread.is_alive():
+        return _loop
+
+    with _loop_lock:
+        if _loop is None or _loop_pid != pid or not _loop_thread.is_alive():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=_run_loop, args=(loop,),
+                name="shared-event-loop", daemon=True
+            )
+            thread.start()
+            _loop, _loop_thread, _loop_pid = loop, thread, pid
+    return _loop
+
+
+def _run_loop(loop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def in_loop_thread():
+    """Check whether the caller is running on the shared loop's thread."""
+    return _loop_thread is not None and threading.current_thread() is _loop_thread
+
+
+def submit(coro):
+    """
+    Schedule a coroutine on the shared loop and return a concurrent Future.
+
+    The caller's context variables (Flask's request and app context) are
+    carried over to the task so async views can keep using ``request``,
+    ``session`` and ``g``.
+    """
+    loop = get_event_loop()
+    ctx = contextvars.copy_context()
+    result = concurrent.futures.Future()
+
+    def start():
+        if not result.set_running_or_notify_cancel():
+            coro.close()
+            return
+        # Tasks copy the current context when created, so create it inside ctx
+        task = ctx.run(loop.create_task, coro)
+
+        def done(t):
+            if t.cancelled():
+                result.set_exception(concurrent.futures.CancelledError())
+            elif t.exception() is not None:
+                result.set_exception(t.exception())
+            else:
+                result.set_result(t.result())
+
+        task.add_done_callback(done)
+
+    loop.call_soon_threadsafe(start)
+    return result
+
+
+def run_async(coro, timeout=None):
+    """
+    Run a coroutine on the shared loop and block until it finishes.
+
+    Args:
+        coro: The coroutine to run
+        timeout: Seconds to wait; defaults to ASYNC_CALL_TIMEOUT
+
+    Returns:
+        The coroutine's result (exceptions are re-raised in the caller)
+    """
+    if in_loop_thread():
+        coro.close()
+        raise RuntimeError("run_async() cannot be called from the shared event loop thread")
+    if timeout is None:
+        timeout = ASYNC_CALL_TIMEOUT or None
+    return submit(coro).result(timeout=timeout)
+
+
+def iterate_async(async_iterable, timeout=None):
+    """Drive an async iterator on the shared loop from sync code, yielding items as they arrive."""
+    iterator = async_iterable.__aiter__()
+
+    async def next_item():
+        try:
+            return False, await iterator.__anext__()
+        except StopAsyncIteration:
+            return True, None
+
+    while True:
+        finished, item = run_async(next_item(), timeout=timeout)
+        if finished:
+            break
+        yield item
+
+
+def async_to_sync(func):
+    """
+    Replacement for ``Flask.async_to_sync`` that dispatches async views to the
+    shared loop instead of creating a new loop for every request.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return run_async(func(*args, **kwargs))
+    return wrapper
+
@@ -0,0 +1,266 @@
+"""
+Rolling summaries of long conversations.
+
+Replaying a whole chat history into every prompt makes each turn more
+expensive than the last. Once more than SUMMARY_TRIGGER_MESSAGES messages
+are not yet covered by a summary, the older ones are compacted by the model
+into a summary document per user and chat type
+(users/<uid>/chat_summaries/<chat_type>). This runs in the background at
+background priority, never on the request path. Context building then sends
+the summary plus the messages after it, keeping the last
+SUMMARY_RECENT_MESSAGES verbatim once the summary has caught up, so prompt
+size stays bounded however long the conversation gets.
+
+Only histories read from Firestore (messages with an 'id' and 'timestamp_value')
+can be summarized. Coverage is tracked by the last summarized message's
+(time, ID), the order get_chat_history reads messages in, so messages that
+share a time are never split across the summary boundary.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import write_behind
+from request_metrics import increment
+
+# Set to "false" to always replay the chat history verbatim
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() != "false"
+
+# Unsummarized messages that trigger a compaction (and the most ever sent verbatim)
+SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "20"))
+
+# Messages kept verbatim after a compaction
+SUMMARY_RECENT_MESSAGES = int(os.getenv("SUMMARY_RECENT_MESSAGES", "8"))
+
+# Length the model is asked to keep the summary under (words)
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "300"))
+
+# Summaries kept in process
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "1024"))
+
+SUMMARY_HEADER = "Summary of the earlier conversation with this user:\n"
+
+SUMMARY_INSTRUCTION = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Merge the existing summary and the new messages into one updated summary of at most "
+    "{max_words} words. Keep facts the user shared about themselves, the topics covered, "
+    "decisions and answers given, and open questions. Write plain prose with no preamble."
+)
+
+
+def _summary_path(user_id: str, chat_type: str) -> str:
+    return f"users/{user_id}/chat_summaries/{chat_type}"
+
+
+class SummaryStore:
+    """Reads and writes summary documents, with an in-process LRU in front of Firestore."""
+
+    def __init__(self, max_entries: int = SUMMARY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (user_id, chat_type) -> record or None
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, chat_type: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the stored summary record.
+
+        Returns:
+            dict: summary, covered_until and covered_id (time and ID of the last
+            summarized message) and message_count, or None if there is no summary yet
+        """
+        key = (user_id, chat_type)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        record = self._load(user_id, chat_type)
+        self._remember(key, record)
+        return record
+
+    def _load(self, user_id: str, chat_type: str) -> Optional[Dict[str, Any]]:
+        import firebase_utils as fb_utils
+        path = _summary_path(user_id, chat_type)
+        write_behind.flush_pending(path)
+        doc = (fb_utils.db.collection('users').document(user_id)
+               .collection('chat_summaries').document(chat_type).get())
+        data = doc.to_dict() if getattr(doc, 'exists', False) else None
+        if not data or not data.get('summary'):
+            return None
+        return {
+            'summary': data['summary'],
+            'covered_until': data.get('covered_until', 0),
+            'covered_id': data.get('covered_id'),
+            'message_count': data.get('message_count', 0)
+        }
+
+    def _remember(self, key, record) -> None:
+        with self._lock:
+            self._entries[key] = record
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self, user_id: str, chat_type: str, record: Dict[str, Any]) -> None:
+        """Store a summary record (queued behind the response like other chat writes)."""
+        write_behind.write(_summary_path(user_id, chat_type), dict(
+            record, chat_type=chat_type, updated_at=write_behind.SERVER_TIMESTAMP
+        ))
+        self._remember((user_id, chat_type), dict(record))
+
+
+class ConversationSummarizer:
+    """Splits histories into summary + recent turns and compacts old turns in the background."""
+
+    def __init__(self, store: Optional[SummaryStore] = None, generate=None,
+                 trigger: int = SUMMARY_TRIGGER_MESSAGES, recent: int = SUMMARY_RECENT_MESSAGES,
+                 max_words: int = SUMMARY_MAX_WORDS):
+        """
+        Args:
+            store: Summary storage; a Firestore-backed SummaryStore by default
+            generate: async (instruction, text) -> summary text; the MCP model adapter by default
+            trigger: Unsummarized messages that trigger a compaction
+            recent: Messages kept verbatim after a compaction
+            max_words: Summary length limit given to the model
+        """
+        self.store = store or SummaryStore()
+        self.generate = generate or _generate_with_adapter
+        self.trigger = max(1, trigger)
+        self.recent = max(0, min(recent, self.trigger - 1))
+        self.max_words = max_words
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def compact_history(self, user_id: str, chat_type: str,
+                        chat_history: List[Dict[str, Any]]) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """
+        Split a chat history into the stored summary and the messages to send verbatim.
+
+        Schedules a background compaction when too many messages are unsummarized.
+
+        Args:
+            user_id: The user ID
+            chat_type: Chat the history belongs to ('study', ...)
+            chat_history: Messages oldest first, as returned by get_chat_history
+
+        Returns:
+            tuple: (summary text or None, messages to replay)
+        """
+        if not chat_history or any('timestamp_value' not in m or 'id' not in m for m in chat_history):
+            return None, chat_history
+
+        record = self.store.get(user_id, chat_type)
+        pending = [m for m in chat_history if not _covers(record, m)]
+        if len(pending) > self.trigger:
+            self.schedule(user_id, chat_type, record, pending[:len(pending) - self.recent])
+
+        return (record['summary'] if record else None), pending[-self.trigger:]
+
+    def schedule(self, user_id: str, chat_type: str, record: Optional[Dict[str, Any]],
+                 messages: List[Dict[str, Any]]) -> bool:
+        """Start a background compaction unless one is already running for this chat."""
+        key = (user_id, chat_type)
+        with self._lock:
+            if key in self._running:
+                return False
+            self._running.add(key)
+
+        from async_runtime import submit
+        future = submit(self.compact(user_id, chat_type, record, messages))
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return True
+
+    def _finish(self, key, future) -> None:
+        with self._lock:
+            self._running.discard(key)
+        if not future.cancelled() and future.exception() is not None:
+            print(f"[SUMMARY] Compaction failed for {key[1]} chat: {future.exception()}")
+
+    async def compact(self, user_id: str, chat_type: str, record: Optional[Dict[str, Any]],
+                      messages: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Fold messages into the summary record and store it.
+
+        Returns:
+            dict: The new record, or None if the model produced nothing
+        """
+        from model_scheduler import model_priority, PRIORITY_BACKGROUND
+
+        started = time.perf_counter()
+        lines = []
+        if record:
+            lines.append("Existing summary:\n" + record['summary'] + "\n")
+        lines.append("New messages:")
+        for message in messages:
+            speaker = "User" if message.get('role', 'user') == 'user' else "Assistant"
+            lines.append(f"{speaker}: {message.get('content', '')}")
+
+        with model_priority(PRIORITY_BACKGROUND):
+            summary = await self.generate(SUMMARY_INSTRUCTION.format(max_words=self.max_words),
+                                          "\n".join(lines))
+        if not summary or not summary.strip():
+            return None
+
+        last = max(messages, key=_order_key)
+        new_record = {
+            'summary': summary.strip(),
+            'covered_until': _as_number(last['timestamp_value']),
+            'covered_id': last['id'],
+            'message_count': (record['message_count'] if record else 0) + len(messages)
+        }
+        self.store.save(user_id, chat_type, new_record)
+        increment("conversation_summaries_total")
+        print(f"[SUMMARY] Compacted {len(messages)} {chat_type} message(s) in "
+              f"{time.perf_counter() - started:.1f}s")
+        return new_record
+
+
+def _as_number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _order_key(message: Dict[str, Any]) -> Tuple[float, str]:
+    """Position of a message in history order: time, then ID (as get_chat_history sorts)."""
+    return _as_number(message['timestamp_value']), str(message['id'])
+
+
+def _covers(record: Optional[Dict[str, Any]], message: Dict[str, Any]) -> bool:
+    """Whether a summary record already includes a message."""
+    if not record:
+        return False
+    if record.get('covered_id') is None:
+        # Records written before IDs were tracked only know the time
+        return _as_number(message['timestamp_value']) <= record['covered_until']
+    return _order_key(message) <= (record['covered_until'], record['covered_id'])
+
+
+async def _generate_with_adapter(instruction: str, text: str) -> Optional[str]:
+    from mcp.context import MCPContext
+    from mcp.model_adapter import MCPModelFactory
+
+    context = MCPContext()
+    context.add_system_instruction(instruction)
+    response = await MCPModelFactory.create(model_name="gemini").generate_with_context(text, context)
+    if response.error is not None:
+        raise response.error
+    return response.text
+
+
+# Process-wide summarizer instance
+_SUMMARIZER = None
+_SUMMARIZER_LOCK = threading.Lock()
+
+def get_conversation_summarizer() -> ConversationSummarizer:
+    """Get the process-wide conversation summarizer, creating it on first use."""
+    global _SUMMARIZER
+    if _SUMMARIZER is None:
+        with _SUMMARIZER_LOCK:
+            if _SUMMARIZER is None:
+                _SUMMARIZER = ConversationSummarizer()
+    return _SUMMARIZER
@@ -14,6 +14,8 @@ import json
 from datetime import datetime
 import google.generativeai as genai
 from flask import url_for
+from token_accounting import count_tokens_batch
+from model_scheduler import call_model_sync, estimate_tokens
 
 # Safe execution environment for user code
 def safe_execute_code(code_string, dataframe):
@@ -108,13 +110,17 @@ def get_gemini_transform_code(prompt, df_preview):
         Return only the executable Python code without any explanations or markdown formatting.
         """
         
-        # Generate response from Gemini
-        response = model.generate_content(
-            [system_prompt, user_prompt],
-            generation_config={
-                "temperature": 0.2,  # Lower temperature for more deterministic code generation
-                "max_output_tokens": 2048
-            }
+        # Generate response from Gemini, through the shared model-call scheduler
+        response = call_model_sync(
+            lambda: model.generate_content_async(
+                [system_prompt, user_prompt],
+                generation_config={
+                    "temperature": 0.2,  # Lower temperature for more deterministic code generation
+                    "max_output_tokens": 2048
+                }
+            ),
+            model=model.model_name,
+            tokens=estimate_tokens([system_prompt, user_prompt])
         )
         
         code = response.text
@@ -137,9 +143,8 @@ def get_gemini_transform_code(prompt, df_preview):
                 
             # Method 3: Estimate tokens from input and output length if no token count available
             if token_usage == 0:
-                # Rough estimation
-                prompt_tokens = len(df_preview) // 4
-                code_tokens = len(code) // 4
+                # Count locally
+                prompt_tokens, code_tokens = count_tokens_batch([df_preview, code])
                 token_usage = prompt_tokens + code_tokens
             
             # Validate token_usage is an integer
@@ -0,0 +1,386 @@
+"""
+Retrieval index over stored documents.
+
+Instead of sending up to 100 KB of an uploaded document with every chat turn,
+the document is split into chunks once, at upload time, and indexed with
+BM25. Each turn then only sends the chunks most relevant to the question.
+
+Indexes are keyed by the document's content hash (the same one the document
+store uses), so re-uploads of the same file share an index. They are kept on
+disk next to the document store, with an LRU of loaded indexes in memory.
+
+With DOCUMENT_EMBEDDINGS enabled, chunks are also embedded with a Gemini
+embedding model and ranked by a mix of BM25 and cosine similarity, computed
+with NumPy over the whole chunk matrix at once.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from document_store import DOCUMENT_STORE_DIR, get_document_store, register_sweep_hook
+from proofreading import chunk_text
+
+# Where indexes are stored
+DOCUMENT_INDEX_DIR = os.getenv("DOCUMENT_INDEX_DIR", os.path.join(DOCUMENT_STORE_DIR, "index"))
+
+# Characters of new text per indexed chunk, and overlap carried from the previous one
+DOCUMENT_CHUNK_CHARS = int(os.getenv("DOCUMENT_CHUNK_CHARS", "1500"))
+DOCUMENT_CHUNK_OVERLAP = int(os.getenv("DOCUMENT_CHUNK_OVERLAP", "150"))
+
+# Chunks sent with each chat turn
+DOCUMENT_RETRIEVAL_TOP_K = int(os.getenv("DOCUMENT_RETRIEVAL_TOP_K", "6"))
+
+# Documents up to this many characters are sent whole; retrieval only pays off above it
+DOCUMENT_RETRIEVAL_MIN_CHARS = int(os.getenv("DOCUMENT_RETRIEVAL_MIN_CHARS", "12000"))
+
+# Set to "true" to also rank chunks by embedding similarity (needs NumPy)
+DOCUMENT_EMBEDDINGS = os.getenv("DOCUMENT_EMBEDDINGS", "false").lower() == "true"
+DOCUMENT_EMBEDDING_MODEL = os.getenv("DOCUMENT_EMBEDDING_MODEL", "models/text-embedding-004")
+
+# Loaded indexes kept in memory
+DOCUMENT_INDEX_CACHE_SIZE = int(os.getenv("DOCUMENT_INDEX_CACHE_SIZE", "32"))
+
+# Bump when the chunking or index format changes; older indexes are rebuilt
+INDEX_VERSION = 1
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+_CONTENT_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word terms of a text (Unicode-aware, so Polish and Azerbaijani work too)."""
+    return [term for term in _TERM.findall(text.lower()) if len(term) > 1 or term.isdigit()]
+
+
+@dataclass
+class RetrievedChunk:
+    """A chunk selected for a query."""
+    index: int
+    start: int
+    end: int
+    text: str
+
+
+class DocumentIndex:
+    """BM25 index over the chunks of one document, with optional chunk embeddings."""
+
+    def __init__(self, spans, term_freqs, lengths, doc_freqs, embeddings=None):
+        self.spans = spans  # [(start, end)] into the document text
+        self.term_freqs = term_freqs  # [{term: count}] per chunk
+        self.lengths = lengths
+        self.doc_freqs = doc_freqs
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        self.embeddings = embeddings  # unit-normalized (chunks x dims) array, or None
+
+    @classmethod
+    def build(cls, text: str, max_chars: int = DOCUMENT_CHUNK_CHARS,
+              overlap: int = DOCUMENT_CHUNK_OVERLAP) -> 'DocumentIndex':
+        """Chunk and index a document."""
+        spans, term_freqs, lengths = [], [], []
+        doc_freqs = Counter()
+        for chunk in chunk_text(text, max_chars, overlap):
+            terms = Counter(tokenize(chunk.text))
+            spans.append((chunk.start, chunk.end))
+            term_freqs.append(dict(terms))
+            lengths.append(sum(terms.values()))
+            doc_freqs.update(terms.keys())
+        return cls(spans, term_freqs, lengths, dict(doc_freqs))
+
+    def bm25_scores(self, query: str) -> List[float]:
+        """BM25 score of every chunk for a query."""
+        n = len(self.spans)
+        scores = [0.0] * n
+        if not n:
+            return scores
+        avg_length = self.avg_length or 1.0
+        for term in set(tokenize(query)):
+            df = self.doc_freqs.get(term)
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for i, freqs in enumerate(self.term_freqs):
+                tf = freqs.get(term)
+                if tf:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / avg_length)
+                    scores[i] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def rank(self, query: str, k: int, query_embedding=None) -> List[int]:
+        """
+        Indexes of the k best chunks for a query, in document order.
+
+        When no chunk matches (e.g. "summarize this"), chunks spread evenly
+        over the document are returned instead.
+        """
+        n = len(self.spans)
+        if n <= k:
+            return list(range(n))
+
+        scores = self.bm25_scores(query)
+        if self.embeddings is not None and query_embedding is not None:
+            top = max(scores) or 1.0
+            similarity = self.embeddings @ query_embedding
+            scores = [0.5 * s / top + 0.5 * max(float(c), 0.0) for s, c in zip(scores, similarity)]
+
+        if not any(scores):
+            step = n / k
+            return sorted({int(i * step) for i in range(k)})
+        best = sorted(range(n), key=lambda i: scores[i], reverse=True)[:k]
+        return sorted(i for i in best if scores[i] > 0)
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": INDEX_VERSION,
+            "spans": self.spans,
+            "term_freqs": self.term_freqs,
+            "lengths": self.lengths,
+            "doc_freqs": self.doc_freqs
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict, embeddings=None) -> Optional['DocumentIndex']:
+        if data.get("version") != INDEX_VERSION:
+            return None
+        return cls([tuple(span) for span in data["spans"]], data["term_freqs"],
+                   data["lengths"], data["doc_freqs"], embeddings)
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def gemini_embed(texts: List[str], task_type: str) -> List[List[float]]:
+    """
+    Embed texts with the Gemini embedding model, 100 per request.
+
+    Calls go through the model scheduler, so this must run off the shared loop
+    (context building resolves documents in a worker thread); on the loop thread
+    run_async raises rather than stalling every other request.
+    """
+    import google.generativeai as genai
+    from model_scheduler import call_model_sync, estimate_tokens, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+    # Document chunks are embedded by upload jobs; queries while a user waits
+    priority = PRIORITY_BACKGROUND if task_type == "retrieval_document" else PRIORITY_INTERACTIVE
+    vectors = []
+    for i in range(0, len(texts), 100):
+        batch = texts[i:i + 100]
+        result = call_model_sync(
+            lambda: genai.embed_content_async(model=DOCUMENT_EMBEDDING_MODEL, content=batch, task_type=task_type),
+            model=DOCUMENT_EMBEDDING_MODEL, priority=priority, tokens=estimate_tokens(batch)
+        )
+        vectors.extend(result["embedding"])
+    return vectors
+
+
+class DocumentIndexStore:
+    """Indexes on disk keyed by content hash, with an in-memory LRU."""
+
+    def __init__(self, root_dir: str = DOCUMENT_INDEX_DIR, cache_size: int = DOCUMENT_INDEX_CACHE_SIZE,
+                 use_embeddings: bool = DOCUMENT_EMBEDDINGS,
+                 embed: Callable[[List[str], str], List[List[float]]] = gemini_embed):
+        self.root_dir = root_dir
+        self.cache_size = cache_size
+        self.use_embeddings = use_embeddings and np is not None
+        self.embed = embed
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _path(self, content_hash: str, suffix: str) -> str:
+        if not _CONTENT_HASH_PATTERN.match(content_hash):
+            raise ValueError(f"Invalid content hash: {content_hash!r}")
+        return os.path.join(self.root_dir, f"{content_hash}{suffix}")
+
+    def _remember(self, content_hash: str, index: DocumentIndex) -> None:
+        with self._lock:
+            self._cache[content_hash] = index
+            self._cache.move_to_end(content_hash)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def build(self, content_hash: str, text: str) -> DocumentIndex:
+        """Index a document and save the index."""
+        index = DocumentIndex.build(text)
+        if self.use_embeddings:
+            try:
+                vectors = self.embed([text[start:end] for start, end in index.spans], "retrieval_document")
+                index.embeddings = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+            except Exception as e:
+                print(f"[DOCUMENT INDEX] Embedding failed for {content_hash[:12]}, using BM25 only: {e}")
+
+        try:
+            self._write(self._path(content_hash, ".json"),
+                        json.dumps(index.to_dict(), ensure_ascii=False).encode('utf-8'))
+            if index.embeddings is not None:
+                path = self._path(content_hash, ".npy")
+                fd, tmp_path = tempfile.mkstemp(dir=self.root_dir, suffix=".tmp")
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, index.embeddings)
+                os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[DOCUMENT INDEX] Could not save index {content_hash[:12]}: {e}")
+
+        self._remember(content_hash, index)
+        return index
+
+    def _write(self, path: str, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.root_dir, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, content_hash: str) -> Optional[DocumentIndex]:
+        """Load a document's index, or None if it hasn't been built."""
+        with self._lock:
+            index = self._cache.get(content_hash)
+            if index is not None:
+                self._cache.move_to_end(content_hash)
+                return index
+        try:
+            with open(self._path(content_hash, ".json"), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        embeddings = None
+        if self.use_embeddings:
+            try:
+                embeddings = np.load(self._path(content_hash, ".npy"))
+            except (OSError, ValueError):
+                pass
+        index = DocumentIndex.from_dict(data, embeddings)
+        if index is not None:
+            self._remember(content_hash, index)
+        return index
+
+    def get_or_build(self, content_hash: str, text: str) -> DocumentIndex:
+        return self.get(content_hash) or self.build(content_hash, text)
+
+    def sweep(self, live_hashes, max_age: float) -> int:
+        """Remove index files of documents no longer stored (and older than max_age seconds)."""
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.root_dir):
+            content_hash, ext = os.path.splitext(name)
+            if ext not in (".json", ".npy", ".tmp") or content_hash in live_hashes:
+                continue
+            path = os.path.join(self.root_dir, name)
+            try:
+                # Indexes of inline (unstored) documents have no pointer; they go by age alone
+                if now - os.path.getmtime(path) > max_age:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+            with self._lock:
+                self._cache.pop(content_hash, None)
+        return removed
+
+    def embed_query(self, query: str):
+        """Unit-normalized query embedding, or None when embeddings are off or fail."""
+        if not self.use_embeddings:
+            return None
+        try:
+            vector = np.asarray(self.embed([query], "retrieval_query")[0], dtype=np.float32)
+            return _normalize_rows(vector)
+        except Exception as e:
+            print(f"[DOCUMENT INDEX] Query embedding failed, using BM25 only: {e}")
+            return None
+
+
+# Process-wide index store
+_INDEX_STORE = None
+_INDEX_STORE_LOCK = threading.Lock()
+
+def get_document_index_store() -> DocumentIndexStore:
+    """Get the process-wide document index store, creating it on first use."""
+    global _INDEX_STORE
+    if _INDEX_STORE is None:
+        with _INDEX_STORE_LOCK:
+            if _INDEX_STORE is None:
+                _INDEX_STORE = DocumentIndexStore()
+    return _INDEX_STORE
+
+
+def _sweep_indexes(live_hashes, max_age: float) -> None:
+    get_document_index_store().sweep(live_hashes, max_age)
+
+
+register_sweep_hook(_sweep_indexes)
+
+
+def index_document(content_hash: str, text: str) -> Optional[DocumentIndex]:
+    """Build the index for a stored document at upload time (small documents are skipped)."""
+    if not text or len(text) <= DOCUMENT_RETRIEVAL_MIN_CHARS:
+        return None
+    return get_document_index_store().build(content_hash, text)
+
+
+def retrieve_chunks(text: str, query: str, k: int = DOCUMENT_RETRIEVAL_TOP_K,
+                    content_hash: Optional[str] = None) -> List[RetrievedChunk]:
+    """
+    Select the chunks of a document most relevant to a query.
+
+    Args:
+        text: Full document text
+        query: The question being asked
+        k: Number of chunks to return
+        content_hash: SHA-256 of the text, if already known (e.g. from the document store)
+
+    Returns:
+        list[RetrievedChunk]: Selected chunks in document order
+    """
+    if content_hash is None:
+        content_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    store = get_document_index_store()
+    index = store.get_or_build(content_hash, text)
+    selected = index.rank(query, k, store.embed_query(query) if index.embeddings is not None else None)
+    return [RetrievedChunk(i, index.spans[i][0], index.spans[i][1], text[index.spans[i][0]:index.spans[i][1]])
+            for i in selected]
+
+
+def build_document_excerpt(text: str, query: str, k: int = DOCUMENT_RETRIEVAL_TOP_K,
+                           content_hash: Optional[str] = None) -> str:
+    """
+    Document text to send with a question: the whole text when it is short,
+    otherwise the top-k relevant chunks joined in document order.
+    """
+    if len(text) <= DOCUMENT_RETRIEVAL_MIN_CHARS:
+        return text
+    chunks = retrieve_chunks(text, query, k, content_hash)
+    parts = [f"[Excerpts from a longer document ({len(text)} characters), selected for the question]"]
+    for chunk in chunks:
+        parts.append(f"[Excerpt {chunk.index + 1}]\n{chunk.text.strip()}")
+    return "\n\n".join(parts)
+
+
+def load_document_excerpt(file_id: str, query: str, k: int = DOCUMENT_RETRIEVAL_TOP_K) -> Optional[str]:
+    """Like build_document_excerpt, for a document in the document store."""
+    store = get_document_store()
+    record = store.get_record(file_id)
+    if not record:
+        return None
+    text = store.get(file_id)
+    if text is None:
+        return None
+    return build_document_excerpt(text, query, k, record.get('content_hash'))
@@ -0,0 +1,355 @@
+"""
+Server-side document store for extracted file text.
+
+Uploaded documents used to travel in the Flask session cookie, which meant
+signing and shipping up to 100 KB+ on every request. This module keeps the
+extracted text on local disk instead and the session only carries the file ID
+and some metadata.
+
+Layout on disk:
+    <root>/blobs/<sha256>.txt   - UTF-8 text, content-addressed (deduplicated)
+    <root>/ids/<file_id>.json   - pointer from a file ID to a blob hash
+
+Reads go through an in-memory LRU tier first and fall back to an mmap-backed
+reader, so partial reads (previews) don't have to load the whole document.
+
+Pointers not read for DOCUMENT_RETENTION_SECONDS expire. At most every
+DOCUMENT_SWEEP_INTERVAL a background sweep removes them, then the blobs no
+pointer refers to, then anything registered with register_sweep_hook (the
+retrieval indexes) that belongs to those blobs.
+"""
+
+import os
+import re
+import json
+import mmap
+import hashlib
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Where documents are stored; defaults to a folder under the system temp dir
+DOCUMENT_STORE_DIR = os.getenv(
+    "DOCUMENT_STORE_DIR",
+    os.path.join(tempfile.gettempdir(), "document_store")
+)
+
+# Byte budget for the in-memory LRU tier
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv("DOCUMENT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Seconds a document is kept after it was last stored or read
+DOCUMENT_RETENTION_SECONDS = int(os.getenv("DOCUMENT_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+# Seconds between retention sweeps (each worker process sweeps on its own)
+DOCUMENT_SWEEP_INTERVAL = int(os.getenv("DOCUMENT_SWEEP_INTERVAL", "3600"))
+
+# Unreferenced files younger than this are left alone: a put() may not have written its pointer yet
+_SWEEP_GRACE_SECONDS = 300
+
+# Only IDs we generate (uuid4 / hex) are accepted, which keeps paths safe
+_FILE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_\-]{1,128}$')
+
+
+_sweep_hooks = []
+
+def register_sweep_hook(hook):
+    """
+    Run hook(live_hashes, max_age) after each retention sweep.
+
+    live_hashes is the set of content hashes still referenced; files derived
+    from other hashes (and older than max_age seconds) can be removed.
+    """
+    _sweep_hooks.append(hook)
+
+
+class DocumentStore:
+    """Content-addressed on-disk text store with an LRU in-memory tier."""
+
+    def __init__(self, root_dir=DOCUMENT_STORE_DIR, cache_max_bytes=DOCUMENT_CACHE_MAX_BYTES,
+                 retention_seconds=DOCUMENT_RETENTION_SECONDS, sweep_interval=DOCUMENT_SWEEP_INTERVAL):
+        self.root_dir = root_dir
+        self.blob_dir = os.path.join(root_dir, "blobs")
+        self.id_dir = os.path.join(root_dir, "ids")
+        self.cache_max_bytes = cache_max_bytes
+        self.retention_seconds = retention_seconds
+        self.sweep_interval = sweep_interval
+        self._cache = OrderedDict()  # content_hash -> text
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._sweeping = False
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.id_dir, exist_ok=True)
+
+    # ----- paths -----
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.blob_dir, f"{content_hash}.txt")
+
+    def _id_path(self, file_id):
+        if not file_id or not _FILE_ID_PATTERN.match(str(file_id)):
+            raise ValueError(f"Invalid document ID: {file_id!r}")
+        return os.path.join(self.id_dir, f"{file_id}.json")
+
+    # ----- LRU tier -----
+
+    def _cache_get(self, content_hash):
+        with self._lock:
+            text = self._cache.get(content_hash)
+            if text is not None:
+                self._cache.move_to_end(content_hash)
+            return text
+
+    def _cache_put(self, content_hash, text):
+        size = len(text.encode('utf-8')) if text else 0
+        if size > self.cache_max_bytes:
+            return
+        with self._lock:
+            if content_hash in self._cache:
+                self._cache.move_to_end(content_hash)
+                return
+            self._cache[content_hash] = text
+            self._cache_bytes += size
+            while self._cache_bytes > self.cache_max_bytes and self._cache:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted.encode('utf-8'))
+
+    # ----- public API -----
+
+    def put(self, file_id, text, metadata=None):
+        """
+        Store a document's text under the given file ID.
+
+        Args:
+            file_id (str): ID the session will refer to the document by
+            text (str): Extracted document text
+            metadata (dict, optional): Extra fields kept alongside the pointer
+
+        Returns:
+            dict: Pointer record with file_id, content_hash and content_length
+        """
+        if text is None:
+            text = ''
+        data = text.encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
+
+        blob_path = self._blob_path(content_hash)
+        if not os.path.exists(blob_path):
+            self._write_blob(blob_path, data)
+
+        record = {
+            'file_id': file_id,
+            'content_hash': content_hash,
+            'content_length': len(text),
+            'metadata': metadata or {}
+        }
+        id_path = self._id_path(file_id)
+        fd, tmp_path = tempfile.mkstemp(dir=self.id_dir, suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, id_path)
+
+        # A concurrent delete of the last other pointer may have removed the blob
+        # before this pointer existed; now that it does, no delete will remove it again
+        if not os.path.exists(blob_path):
+            self._write_blob(blob_path, data)
+
+        self._cache_put(content_hash, text)
+        self._maybe_sweep()
+        return record
+
+    def _write_blob(self, blob_path, data):
+        # Write to a temp file first so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, blob_path)
+
+    def get_record(self, file_id):
+        """Return the pointer record for a file ID, or None if unknown."""
+        try:
+            path = self._id_path(file_id)
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            # Documents in use don't expire
+            os.utime(path, None)
+        except OSError:
+            pass
+        return record
+
+    def get(self, file_id):
+        """Return the full text for a file ID, or None if unknown."""
+        record = self.get_record(file_id)
+        if not record:
+            return None
+
+        content_hash = record['content_hash']
+        text = self._cache_get(content_hash)
+        if text is not None:
+            return text
+
+        text = self._read_blob(content_hash)
+        if text is not None:
+            self._cache_put(content_hash, text)
+        return text
+
+    def get_prefix(self, file_id, max_chars):
+        """
+        Return at most max_chars characters from the start of a document.
+
+        Uses the cached copy when present, otherwise maps only the bytes needed.
+        """
+        record = self.get_record(file_id)
+        if not record:
+            return None
+
+        content_hash = record['content_hash']
+        text = self._cache_get(content_hash)
+        if text is not None:
+            return text[:max_chars]
+
+        # UTF-8 is at most 4 bytes per character
+        text = self._read_blob(content_hash, max_bytes=max_chars * 4)
+        return text[:max_chars] if text is not None else None
+
+    def delete(self, file_id):
+        """Remove a file ID pointer, and its blob once no other pointer refers to it."""
+        record = self.get_record(file_id)
+        try:
+            os.remove(self._id_path(file_id))
+        except (OSError, ValueError):
+            return False
+        if record and not self._is_referenced(record['content_hash']):
+            try:
+                os.remove(self._blob_path(record['content_hash']))
+            except OSError:
+                pass
+            with self._lock:
+                text = self._cache.pop(record['content_hash'], None)
+                if text is not None:
+                    self._cache_bytes -= len(text.encode('utf-8'))
+        return True
+
+    def _is_referenced(self, content_hash):
+        """Whether any pointer still refers to the blob (a scan, so deletes are O(documents))."""
+        for name in os.listdir(self.id_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.id_dir, name), 'r', encoding='utf-8') as f:
+                    if json.load(f).get('content_hash') == content_hash:
+                        return True
+            except (OSError, ValueError):
+                continue
+        return False
+
+    def _maybe_sweep(self):
+        """Start a background sweep if the last one is more than sweep_interval ago."""
+        with self._lock:
+            if self._sweeping or time.monotonic() - self._last_sweep < self.sweep_interval:
+                return
+            self._sweeping = True
+        threading.Thread(target=self.sweep, name="document-store-sweep", daemon=True).start()
+
+    def sweep(self):
+        """
+        Remove expired pointers, unreferenced blobs, and (via the sweep hooks) their indexes.
+
+        Returns:
+            int: Number of pointers and blobs removed
+        """
+        removed = 0
+        try:
+            now = time.time()
+            live_hashes = set()
+            for name in os.listdir(self.id_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.id_dir, name)
+                try:
+                    if now - os.path.getmtime(path) > self.retention_seconds:
+                        os.remove(path)
+                        removed += 1
+                        continue
+                    with open(path, 'r', encoding='utf-8') as f:
+                        live_hashes.add(json.load(f).get('content_hash'))
+                except (OSError, ValueError):
+                    continue
+
+            for name in os.listdir(self.blob_dir):
+                content_hash, ext = os.path.splitext(name)
+                path = os.path.join(self.blob_dir, name)
+                if (ext == ".txt" and content_hash in live_hashes) or ext not in (".txt", ".tmp"):
+                    continue
+                try:
+                    if now - os.path.getmtime(path) > _SWEEP_GRACE_SECONDS:
+                        os.remove(path)
+                        removed += 1
+                        with self._lock:
+                            text = self._cache.pop(content_hash, None)
+                            if text is not None:
+                                self._cache_bytes -= len(text.encode('utf-8'))
+                except OSError:
+                    continue
+
+            for hook in list(_sweep_hooks):
+                try:
+                    hook(live_hashes, self.retention_seconds)
+                except Exception as e:
+                    print(f"[DOCUMENT STORE] Sweep hook failed: {e}")
+            if removed:
+                print(f"[DOCUMENT STORE] Sweep removed {removed} expired document file(s)")
+        finally:
+            with self._lock:
+                self._last_sweep = time.monotonic()
+                self._sweeping = False
+        return removed
+
+    def _read_blob(self, content_hash, max_bytes=None):
+        path = self._blob_path(content_hash)
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    return ''
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    data = mm[:max_bytes] if max_bytes else mm[:]
+            # A byte cut may split a multi-byte character at the end
+            return data.decode('utf-8', errors='ignore' if max_bytes else 'replace')
+        except OSError as e:
+            print(f"[DOCUMENT STORE] Error reading blob {content_hash}: {e}")
+            return None
+
+
+# Process-wide store instance
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+def get_document_store():
+    """Get the process-wide document store, creating it on first use."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = DocumentStore()
+    return _STORE
+
+def save_document(file_id, text, metadata=None):
+    """Store document text under file_id and return its pointer record."""
+    return get_document_store().put(file_id, text, metadata)
+
+def load_document(file_id):
+    """Load the full text of a stored document, or None if it is not available."""
+    if not file_id:
+        return None
+    return get_document_store().get(file_id)
+
+def load_document_prefix(file_id, max_chars):
+    """Load the first max_chars characters of a stored document."""
+    if not file_id:
+        return None
+    return get_document_store().get_prefix(file_id, max_chars)
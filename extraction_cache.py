@@ -0,0 +1,200 @@
+"""
+On-disk cache of extracted document text.
+
+Text extraction (PyPDF2, pdfplumber, PyMuPDF, python-docx) is slow and the same
+files get uploaded again and again, by the same and by different users. Results
+are keyed by the SHA-256 of the file bytes plus the extractor name and version,
+so a cached entry is only reused for byte-identical input and is invalidated
+whenever an extractor's version is bumped.
+
+Entries live in one file each and are evicted least-recently-used (by mtime,
+which is refreshed on every hit) once the directory exceeds its byte budget.
+"""
+
+import os
+import hashlib
+import tempfile
+import threading
+import inspect
+import functools
+
+# Where cached extractions are stored
+EXTRACTION_CACHE_DIR = os.getenv(
+    "EXTRACTION_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "extraction_cache")
+)
+
+# Byte budget for the cache directory
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Set to "false" to bypass the cache (e.g. while working on an extractor)
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() != "false"
+
+_READ_CHUNK_BYTES = 1024 * 1024
+
+# Stands in for the file's name in extractor output; cached entries are shared by
+# every upload with the same bytes, so the real (per-upload) name is filled in on
+# the way out
+FILENAME_PLACEHOLDER = "\x00filename\x00"
+
+
+class UncachedText(str):
+    """Extractor output that is returned as-is but never cached (errors, diagnostics)."""
+
+
+def hash_file(file_path):
+    """Return the SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(file_hash, extractor, version, variant=''):
+    """Build the cache key for a file hash and a given extractor version."""
+    raw = f"{file_hash}:{extractor}:{version}:{variant.lower()}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ExtractionCache:
+    """Size-bounded LRU cache of extracted text stored as files on disk."""
+
+    def __init__(self, root_dir=EXTRACTION_CACHE_DIR, max_bytes=EXTRACTION_CACHE_MAX_BYTES):
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.root_dir, f"{key}.txt")
+
+    def _entries(self):
+        """Yield (path, size, mtime) for every cached entry."""
+        try:
+            with os.scandir(self.root_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith('.txt'):
+                        stat = entry.stat()
+                        yield entry.path, stat.st_size, stat.st_mtime
+        except OSError:
+            return
+
+    def get(self, key):
+        """Return cached text for a key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except (OSError, ValueError):
+            return None
+        try:
+            # Refresh recency for LRU eviction
+            os.utime(path, None)
+        except OSError:
+            pass
+        return text
+
+    def put(self, key, text):
+        """Store text under a key, evicting old entries if over budget."""
+        data = text.encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        try:
+            existed = os.path.exists(path)
+            fd, tmp_path = tempfile.mkstemp(dir=self.root_dir, suffix=".tmp")
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[EXTRACTION CACHE] Could not write entry {key[:12]}: {e}")
+            return
+
+        with self._lock:
+            if not existed:
+                self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Recount from disk: other worker processes share the directory
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
+
+
+# Process-wide cache instance
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+def get_extraction_cache():
+    """Get the process-wide extraction cache, creating it on first use."""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = ExtractionCache()
+    return _CACHE
+
+
+def cached_extractor(name, version, key_args=()):
+    """
+    Decorator caching a text extractor's output by file content.
+
+    The wrapped function must take the file path as its first argument and
+    return the extracted text. Empty results and UncachedText results are not
+    cached. FILENAME_PLACEHOLDER in the output is replaced with the file's name.
+
+    Args:
+        name (str): Extractor name, part of the cache key
+        version (str): Bump this whenever the extractor's output changes
+        key_args (tuple): Names of other arguments that change the output and
+            therefore belong in the cache key
+    """
+    def decorator(extract):
+        signature = inspect.signature(extract)
+
+        def with_filename(text, file_path):
+            if isinstance(text, str) and FILENAME_PLACEHOLDER in text:
+                return text.replace(FILENAME_PLACEHOLDER, os.path.basename(file_path))
+            return text
+
+        @functools.wraps(extract)
+        def wrapper(file_path, *args, **kwargs):
+            if not EXTRACTION_CACHE_ENABLED:
+                return with_filename(extract(file_path, *args, **kwargs), file_path)
+
+            try:
+                file_hash = hash_file(file_path)
+            except OSError:
+                # Let the extractor report the missing/unreadable file
+                return with_filename(extract(file_path, *args, **kwargs), file_path)
+
+            cache = get_extraction_cache()
+            variant = os.path.splitext(file_path)[1]
+            if key_args:
+                bound = signature.bind(file_path, *args, **kwargs)
+                variant += repr([bound.arguments.get(arg) for arg in key_args])
+            key = make_cache_key(file_hash, name, version, variant)
+            text = cache.get(key)
+            if text is not None:
+                print(f"[EXTRACTION CACHE] Hit for {os.path.basename(file_path)} ({name} {version})")
+                return with_filename(text, file_path)
+
+            text = extract(file_path, *args, **kwargs)
+            if isinstance(text, str) and text and not isinstance(text, UncachedText):
+                cache.put(key, text)
+            return with_filename(text, file_path)
+        return wrapper
+    return decorator
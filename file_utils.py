@@ -8,8 +8,24 @@ from datetime import datetime
 import pandas as pd
 import io
 
-def extract_text_from_file(file_path):
-    """Extract text from various file formats with improved error handling"""
+from extraction_cache import cached_extractor, UncachedText, FILENAME_PLACEHOLDER
+
+# Bump when extract_text_from_file's output changes to invalidate cached extractions
+EXTRACTOR_VERSION = "2"
+
+@cached_extractor("file_utils", EXTRACTOR_VERSION)
+def extract_text_from_file(file_path, progress_callback=None):
+    """
+    Extract text from various file formats with improved error handling
+
+    Args:
+        file_path (str): Path to the file
+        progress_callback (callable, optional): Called as progress_callback(pages_done, total_pages)
+            after each PDF page is processed
+
+    Returns:
+        str: Extracted text
+    """
     print(f"[CONTENT EXTRACTION] Starting to extract text from file: {file_path}")
     file_extension = os.path.splitext(file_path)[1].lower()
     print(f"[CONTENT EXTRACTION] File extension detected: {file_extension}")
@@ -53,6 +69,8 @@ def extract_text_from_file(file_path):
                         except Exception as page_err:
                             print(f"[CONTENT EXTRACTION] Error extracting text from page {i+1}: {page_err}")
                             text += f"[Error extracting text from page {i+1}]\n"
+                        if (progress_callback):
+                            progress_callback(i + 1, len(pdf.pages))
             except Exception as pdf_err:
                 print(f"[CONTENT EXTRACTION] Error processing PDF file: {pdf_err}")
 
@@ -141,7 +159,7 @@ def extract_text_from_file(file_path):
             except Exception as e:
                 print(f"Binary fallback failed: {e}")
             
-            return "Could not decode the text file with any supported encoding."
+            return UncachedText("Could not decode the text file with any supported encoding.")
                 
         elif (file_extension in ['.docx']):
             print(f"[CONTENT EXTRACTION] Processing DOCX file: {file_path}")
@@ -211,17 +229,17 @@ def extract_text_from_file(file_path):
                     result = doc_props_text + result
                 
                 if (not result):
-                    return "The DOCX file appears to be empty or contains no extractable text."
+                    return UncachedText("The DOCX file appears to be empty or contains no extractable text.")
                     
                 print(f"Successfully extracted {len(result)} characters from DOCX file")
                 return result
                 
             except ImportError:
                 print("python-docx library not available")
-                return "Unable to process DOCX file: python-docx library not installed. Please install it with 'pip install python-docx'."
+                return UncachedText("Unable to process DOCX file: python-docx library not installed. Please install it with 'pip install python-docx'.")
             except Exception as docx_err:
                 print(f"Error extracting text from DOCX: {docx_err}")
-                return f"Error processing DOCX file: {str(docx_err)}"
+                return UncachedText(f"Error processing DOCX file: {str(docx_err)}")
         
         elif (file_extension in ['.csv']):
             print(f"[CONTENT EXTRACTION] Processing CSV file: {file_path}")
@@ -267,7 +285,7 @@ def extract_text_from_file(file_path):
                 
                 # Add file metadata
                 metadata = f"CSV File Analysis:\n"
-                metadata += f"- Filename: {os.path.basename(file_path)}\n"
+                metadata += f"- Filename: {FILENAME_PLACEHOLDER}\n"
                 metadata += f"- Size: {file_size:,} bytes\n"
                 metadata += f"- Columns: {', '.join(df.columns.tolist())}\n"
                 
@@ -292,7 +310,7 @@ def extract_text_from_file(file_path):
                 return text
             except Exception as csv_err:
                 print(f"Error extracting text from CSV: {csv_err}")
-                return f"Error processing CSV file: {str(csv_err)}"
+                return UncachedText(f"Error processing CSV file: {str(csv_err)}")
         
         elif (file_extension in ['.xlsx', '.xls']):
             print(f"[CONTENT EXTRACTION] Processing Excel file: {file_path}")
@@ -316,7 +334,7 @@ def extract_text_from_file(file_path):
                     
                     # Initialize empty string for results
                     text = f"Excel File Analysis:\n"
-                    text += f"- Filename: {os.path.basename(file_path)}\n"
+                    text += f"- Filename: {FILENAME_PLACEHOLDER}\n"
                     text += f"- Size: {file_size:,} bytes\n"
                     text += f"- Sheets: {', '.join(sheet_names)}\n\n"
                     
@@ -348,7 +366,7 @@ def extract_text_from_file(file_path):
                     sheet_names = xl.sheet_names
                     
                     text = f"Excel File Analysis:\n"
-                    text += f"- Filename: {os.path.basename(file_path)}\n"
+                    text += f"- Filename: {FILENAME_PLACEHOLDER}\n"
                     text += f"- Size: {file_size:,} bytes\n"
                     text += f"- Sheets: {', '.join(sheet_names)}\n\n"
                     
@@ -375,15 +393,15 @@ def extract_text_from_file(file_path):
                 return text
             except Exception as excel_err:
                 print(f"Error extracting text from Excel: {excel_err}")
-                return f"Error processing Excel file: {str(excel_err)}"
+                return UncachedText(f"Error processing Excel file: {str(excel_err)}")
         
         else:
             print(f"Unsupported file extension: {file_extension}")
-            return f"Unsupported file format: {file_extension}. Supported formats are: PDF, DOCX, TXT, CSV, XLSX, and XLS."
+            return UncachedText(f"Unsupported file format: {file_extension}. Supported formats are: PDF, DOCX, TXT, CSV, XLSX, and XLS.")
             
     except Exception as e:
         print(f"Global error in extract_text_from_file: {e}")
-        return f"There was an error extracting text from this file: {str(e)}"
+        return UncachedText(f"There was an error extracting text from this file: {str(e)}")
 
 def read_dataframe_from_file(file_path):
     """Read data into a pandas DataFrame from CSV or Excel files"""
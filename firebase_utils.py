@@ -15,6 +15,11 @@ import requests
 import html
 import re
 import time
+import threading
+from collections import OrderedDict
+
+from request_metrics import timed
+import write_behind
 
 # Mock Firebase implementation for development/testing
 print("Note: Using mock Firebase implementation for testing")
@@ -81,6 +86,10 @@ class MockCollectionReference:
         # Just return self for chaining in mocks
         return self
     
+    def start_after(self, cursor):
+        # Just return self for chaining in mocks
+        return self
+    
     def stream(self):
         # Return empty list for now
         return []
@@ -306,6 +315,90 @@ else:
     print("Firebase not available. Using mock Firebase implementation.")
 
 # Chat History Functions
+
+# (user, chat type) pairs whose recent messages are kept in process
+CHAT_HISTORY_CACHE_SIZE = int(os.getenv("CHAT_HISTORY_CACHE_SIZE", "1024"))
+
+# Most recent messages cached per pair
+CHAT_HISTORY_CACHE_TAIL = int(os.getenv("CHAT_HISTORY_CACHE_TAIL", "50"))
+
+# Seconds a cached tail is trusted; bounds staleness from writes by other worker processes
+CHAT_HISTORY_CACHE_TTL = int(os.getenv("CHAT_HISTORY_CACHE_TTL", "120"))
+
+
+class ChatTailCache:
+    """LRU cache of the most recent chat messages per (user, chat type), oldest first."""
+    
+    def __init__(self, max_entries=CHAT_HISTORY_CACHE_SIZE, tail=CHAT_HISTORY_CACHE_TAIL,
+                 ttl=CHAT_HISTORY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.tail = tail
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (user_id, chat_type) -> entry
+        self._lock = threading.Lock()
+    
+    def get(self, user_id, chat_type, limit):
+        """The last `limit` messages, or None if the cache can't answer for sure."""
+        key = (user_id, chat_type)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires_at'] < time.time():
+                del self._entries[key]
+                return None
+            messages = entry['messages']
+            # Short tails answer any limit only when they hold the whole history
+            if len(messages) < limit and not entry['complete']:
+                return None
+            self._entries.move_to_end(key)
+            return [dict(message) for message in messages[-limit:]] if limit > 0 else []
+    
+    def put(self, user_id, chat_type, messages, complete):
+        """Store the newest messages of a history, complete if nothing older exists."""
+        with self._lock:
+            self._entries[(user_id, chat_type)] = {
+                'messages': [dict(message) for message in messages[-self.tail:]],
+                'complete': complete and len(messages) <= self.tail,
+                'expires_at': time.time() + self.ttl
+            }
+            self._entries.move_to_end((user_id, chat_type))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def append(self, user_id, chat_type, message):
+        """Add a newly saved message to a cached tail (uncached pairs are left alone)."""
+        with self._lock:
+            entry = self._entries.get((user_id, chat_type))
+            if entry is None:
+                return
+            entry['messages'].append(dict(message))
+            if len(entry['messages']) > self.tail:
+                del entry['messages'][:-self.tail]
+                entry['complete'] = False
+    
+    def invalidate(self, user_id):
+        """Drop every cached tail of a user."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+
+_chat_tail_cache = ChatTailCache()
+
+
+def _timestamp_value(timestamp, fallback=0):
+    """Numeric sort value of a Firestore timestamp (datetime or protobuf Timestamp)."""
+    if hasattr(timestamp, 'timestamp'):
+        return timestamp.timestamp()
+    if hasattr(timestamp, 'seconds'):
+        return timestamp.seconds + (timestamp.nanos / 1e9)
+    if isinstance(timestamp, (int, float)):
+        return timestamp
+    return fallback
+
+
+@timed("firestore.save_chat_message")
 def save_chat_message(user_id, chat_type, message, role="user"):
     """
     Save a chat message to Firestore.
@@ -327,78 +420,91 @@ def save_chat_message(user_id, chat_type, message, role="user"):
         return f"temp-{datetime.now().timestamp()}"
     
     try:
-        # Create a new message document with timestamp
+        # Time and ID are fixed when the message is queued, not at commit, so messages
+        # committed in one batch keep their order
+        message_id, queued_at = write_behind.ordered_stamp()
         message_data = {
             'content': message,
             'role': role,
-            'timestamp': firestore.SERVER_TIMESTAMP,
+            'timestamp': write_behind.client_timestamp(queued_at),
             'chat_type': chat_type
         }
         
-        # Add to user's chat collection
-        message_ref = db.collection('users').document(user_id).collection('chat_history').document()
-        message_ref.set(message_data)
+        # Queue the write to the user's chat collection
+        write_behind.write(f"users/{user_id}/chat_history/{message_id}", message_data)
         
-        return message_ref.id
+        # Keep the cached tail current so the next turn doesn't re-read it; it holds
+        # the same time Firestore will
+        _chat_tail_cache.append(user_id, chat_type, dict(
+            message_data, id=message_id, timestamp=queued_at, timestamp_value=queued_at.timestamp()
+        ))
+        
+        return message_id
     except Exception as e:
         print(f"Error saving chat message: {e}")
         # Return a temporary ID so the chat can continue
         from datetime import datetime
         return f"temp-{datetime.now().timestamp()}"
 
-def get_chat_history(user_id, chat_type, limit=50):
+@timed("firestore.chat_history")
+def get_chat_history(user_id, chat_type, limit=50, before=None):
     """
     Get chat history for a specific user and chat type.
     
+    The query filters on chat_type and orders by timestamp, then document ID,
+    in Firestore (the chat_type/timestamp/__name__ composite index in
+    firestore.indexes.json), so it reads at most `limit` documents. The newest page is served from the
+    in-process tail cache when it is warm.
+    
     Args:
         user_id (str): User ID
         chat_type (str): Type of chat ('study', 'entertainment', etc.)
         limit (int): Maximum number of messages to retrieve (default: 50)
+        before (str, optional): ID of a message; returns the page of messages older than it
     
     Returns:
-        list: List of chat messages in chronological order
+        list: The most recent matching messages (before the cursor), in chronological order
     """
     if not user_id:
         print("Cannot get chat history: No user ID provided")
         # Return empty list instead of failing
         return []
     
+    if before is None:
+        cached = _chat_tail_cache.get(user_id, chat_type, limit)
+        if cached is not None:
+            return cached
+    
     try:
-        # Modified query approach that doesn't require a composite index
-        # First, get all chat history for this user
-        messages_ref = (db.collection('users')
-                       .document(user_id)
-                       .collection('chat_history')
-                       .limit(limit * 2))  # Get more than needed initially
-        
-        # Then filter in memory
+        # Messages still in the write-behind queue must be visible to this read
+        write_behind.flush_pending(f"users/{user_id}/chat_history/")
+        
+        history_ref = db.collection('users').document(user_id).collection('chat_history')
+        # Messages with equal times (e.g. legacy batch commit times) are ordered by ID,
+        # which sorts in queue order, so limits and cursors never split a tie unpredictably
+        query = (history_ref
+                 .where('chat_type', '==', chat_type)
+                 .order_by('timestamp', direction='DESCENDING')
+                 .order_by('__name__', direction='DESCENDING'))
+        if before is not None:
+            cursor = history_ref.document(before).get()
+            if not getattr(cursor, 'exists', False):
+                return []
+            query = query.start_after(cursor)
+        
         messages = []
-        for doc in messages_ref.stream():
+        for doc in query.limit(limit).stream():
             message_data = doc.to_dict()
-            doc_chat_type = message_data.get('chat_type')
-            
-            # Only include messages matching the requested chat_type
-            if doc_chat_type == chat_type:
-                message_data['id'] = doc.id
-                
-                # Convert Firebase timestamp to comparable value if it exists
-                timestamp = message_data.get('timestamp')
-                if hasattr(timestamp, 'seconds'):
-                    # Convert Firebase timestamp to numeric value for sorting
-                    message_data['timestamp_value'] = timestamp.seconds + (timestamp.nanos / 1e9)
-                elif isinstance(timestamp, (int, float)):
-                    message_data['timestamp_value'] = timestamp
-                else:
-                    # If no valid timestamp, use document ID for ordering (fallback)
-                    message_data['timestamp_value'] = doc.id
-                
-                messages.append(message_data)
+            message_data['id'] = doc.id
+            message_data['timestamp_value'] = _timestamp_value(message_data.get('timestamp'))
+            messages.append(message_data)
         
-        # Sort by timestamp_value for more reliable ordering
-        messages.sort(key=lambda x: x.get('timestamp_value', 0))
+        # Newest first from the query; callers expect chronological order
+        messages.reverse()
         
-        # Limit to requested number after filtering
-        return messages[:limit]
+        if before is None:
+            _chat_tail_cache.put(user_id, chat_type, messages, complete=len(messages) < limit)
+        return messages
     except Exception as e:
         print(f"Error getting chat history: {e}")
         # In case of error, return empty list instead of failing
@@ -421,6 +527,8 @@ def delete_chat_history(user_id, chat_type=None, message_ids=None):
         return False
     
     try:
+        # Queued messages have to exist before they can be deleted
+        write_behind.flush_pending(f"users/{user_id}/chat_history/")
         batch = db.batch()
         
         if message_ids:
@@ -446,6 +554,7 @@ def delete_chat_history(user_id, chat_type=None, message_ids=None):
         
         # Commit the batch
         batch.commit()
+        _chat_tail_cache.invalidate(user_id)
         return True
     except Exception as e:
         print(f"Error deleting chat history: {e}")
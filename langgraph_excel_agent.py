@@ -32,6 +32,8 @@ from dotenv import load_dotenv
 
 # Import existing excel functionality
 from excel_generator import generate_excel_from_dict_xlsx, parse_gemini_response
+from model_scheduler import call_model, estimate_tokens, PRIORITY_BATCH
+from mcp.fake_model import FakeGenerativeModel, USE_FAKE_MODEL
 
 load_dotenv()
 
@@ -62,7 +64,10 @@ class ExcelAgent:
     """
     
     def __init__(self):
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        if USE_FAKE_MODEL:
+            self.model = FakeGenerativeModel('gemini-2.0-flash-exp')
+        else:
+            self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
         self.memory = MemorySaver()
         self.graph = self._build_graph()
         
@@ -576,13 +581,19 @@ Write in a conversational, helpful tone that builds user confidence in the resul
     async def _call_claude(self, prompt: str) -> str:
         """Call Claude (via Gemini) with the given prompt"""
         try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config={
-                    "temperature": 0.3,
-                    "top_p": 0.8,
-                    "max_output_tokens": 2048,
-                }
+            # Scheduled behind interactive chat; retried on rate limits and server errors
+            response = await call_model(
+                lambda: self.model.generate_content_async(
+                    prompt,
+                    generation_config={
+                        "temperature": 0.3,
+                        "top_p": 0.8,
+                        "max_output_tokens": 2048,
+                    }
+                ),
+                model=self.model.model_name,
+                priority=PRIORITY_BATCH,
+                tokens=estimate_tokens(prompt)
             )
             return response.text
         except Exception as e:
@@ -15,10 +15,26 @@ from .context import (
 )
 from .model_adapter import (
     MCPModelResponse,
+    MCPModelStream,
     MCPModelAdapter,
     GeminiAdapter,
     MCPModelRegistry,
-    MCPModelFactory
+    MCPModelFactory,
+    ModelCatalog,
+    FakeAdapter
+)
+from .packing import (
+    pack_context,
+    PackResult
+)
+from .single_flight import (
+    SingleFlight,
+    get_single_flight
+)
+from .prompts import (
+    build_prompt_parts,
+    format_context_messages,
+    is_identity_question
 )
 
 __all__ = [
@@ -29,8 +45,18 @@ __all__ = [
     'ContextElement',
     'ConversationMessage',
     'MCPModelResponse',
+    'MCPModelStream',
     'MCPModelAdapter',
     'GeminiAdapter',
     'MCPModelRegistry',
-    'MCPModelFactory'
+    'MCPModelFactory',
+    'ModelCatalog',
+    'FakeAdapter',
+    'pack_context',
+    'PackResult',
+    'SingleFlight',
+    'get_single_flight',
+    'build_prompt_parts',
+    'format_context_messages',
+    'is_identity_question'
 ]
\ No newline at end of file
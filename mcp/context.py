@@ -9,9 +9,25 @@ from typing import Dict, List, Any, Optional, Union
 from dataclasses import dataclass, field
 import json
 import time
+import sys
 from enum import Enum
 import os
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Slotted dataclasses (no per-instance __dict__) where supported
+_DATACLASS_OPTIONS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+# Version of the to_bytes() layout
+SERIALIZATION_VERSION = 1
+
+# Leading byte of to_bytes() output, naming the encoding that follows
+_MSGPACK_FORMAT = b"M"
+_JSON_FORMAT = b"J"
+
 class ContextType(Enum):
     """Enum defining supported context types."""
     CONVERSATION = "conversation"
@@ -24,7 +40,11 @@ class ContextType(Enum):
     MULTIMODAL = "multimodal"
 
 
-@dataclass
+# Value -> member lookup, cheaper than calling ContextType(value)
+_CONTEXT_TYPES = {context_type.value: context_type for context_type in ContextType}
+
+
+@dataclass(**_DATACLASS_OPTIONS)
 class ContextMetadata:
     """Metadata for context elements."""
     created_at: float = field(default_factory=time.time)
@@ -34,7 +54,7 @@ class ContextMetadata:
     mime_type: str = "text/plain"
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class ContextElement:
     """A single piece of context."""
     content: Any
@@ -62,7 +82,7 @@ class ContextElement:
         }
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class ConversationMessage:
     """A message in a conversation."""
     role: str  # "user", "assistant", "system", etc.
@@ -72,7 +92,14 @@ class ConversationMessage:
 
 
 class MCPContext:
-    """Main context container for Model Context Protocol."""
+    """
+    Main context container for Model Context Protocol.
+    
+    Conversation messages are kept once, in conversation_history; elements
+    hold everything else (instructions, documents, memory, tool results).
+    """
+    
+    __slots__ = ("elements", "conversation_history", "user_id", "session_id")
     
     def __init__(self):
         self.elements: List[ContextElement] = []
@@ -91,16 +118,7 @@ class MCPContext:
     
     def add_conversation_message(self, role: str, content: str) -> None:
         """Add a message to the conversation history."""
-        message = ConversationMessage(role, content)
-        self.conversation_history.append(message)
-        
-        # Also add as a context element
-        metadata = ContextMetadata(source="conversation")
-        self.add_element(
-            {"role": role, "content": content},
-            ContextType.CONVERSATION,
-            metadata
-        )
+        self.conversation_history.append(ConversationMessage(role, content))
     
     def add_system_instruction(self, instruction: str) -> None:
         """Add a system instruction as context."""
@@ -183,41 +201,103 @@ class MCPContext:
         """Convert the context to JSON format."""
         return json.dumps(self.to_dict())
     
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the context compactly, for persisting or caching it between turns.
+        
+        Fields are written positionally and encoded with msgpack when it is
+        installed, JSON otherwise; from_bytes reads either.
+        """
+        payload = [
+            SERIALIZATION_VERSION,
+            self.user_id,
+            self.session_id,
+            [[m.role, m.content, m.timestamp, m.message_id] for m in self.conversation_history],
+            [
+                [e.type.value, e.content, e.metadata.created_at, e.metadata.source,
+                 e.metadata.importance, e.metadata.ttl, e.metadata.mime_type]
+                for e in self.elements
+            ]
+        ]
+        if msgpack is not None:
+            try:
+                return _MSGPACK_FORMAT + msgpack.packb(payload, use_bin_type=True, default=str)
+            except (TypeError, ValueError, OverflowError):
+                # Content msgpack can't represent (e.g. very large integers)
+                pass
+        return _JSON_FORMAT + json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'MCPContext':
+        """Create a context instance from to_bytes() output."""
+        encoding, body = data[:1], data[1:]
+        if encoding == _MSGPACK_FORMAT:
+            if msgpack is None:
+                raise ValueError("msgpack is required to read this serialized context")
+            payload = msgpack.unpackb(body, raw=False, strict_map_key=False)
+        elif encoding == _JSON_FORMAT:
+            payload = json.loads(body)
+        else:
+            raise ValueError("Unrecognized serialized context format")
+        
+        version, user_id, session_id, messages, elements = payload
+        if version != SERIALIZATION_VERSION:
+            raise ValueError(f"Unsupported serialized context version: {version}")
+        
+        context = cls()
+        context.user_id = user_id
+        context.session_id = session_id
+        context.conversation_history = [ConversationMessage(*message) for message in messages]
+        context.elements = [
+            ContextElement(content, _CONTEXT_TYPES[type_value],
+                           ContextMetadata(created_at, source, importance, ttl, mime_type))
+            for type_value, content, created_at, source, importance, ttl, mime_type in elements
+        ]
+        return context
+    
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'MCPContext':
         """Create a context instance from dictionary data."""
         context = cls()
+        now = time.time()
         
         # Load user and session IDs
         context.user_id = data.get("user_id")
         context.session_id = data.get("session_id")
         
         # Load conversation history
-        for msg_data in data.get("conversation_history", []):
-            msg = ConversationMessage(
-                role=msg_data["role"],
-                content=msg_data["content"],
-                timestamp=msg_data.get("timestamp", time.time()),
-                message_id=msg_data.get("message_id", str(int(time.time() * 1000)))
-            )
-            context.conversation_history.append(msg)
+        history = context.conversation_history
+        for msg_data in data.get("conversation_history", ()):
+            history.append(ConversationMessage(
+                msg_data["role"],
+                msg_data["content"],
+                msg_data.get("timestamp", now),
+                msg_data.get("message_id") or str(int(now * 1000))
+            ))
         
         # Load context elements
-        for element_data in data.get("elements", []):
-            metadata = ContextMetadata(
-                created_at=element_data["metadata"].get("created_at", time.time()),
-                source=element_data["metadata"].get("source", "unknown"),
-                importance=element_data["metadata"].get("importance", 5),
-                ttl=element_data["metadata"].get("ttl"),
-                mime_type=element_data["metadata"].get("mime_type", "text/plain")
-            )
-            
-            element = ContextElement(
-                content=element_data["content"],
-                type=ContextType(element_data["type"]),
-                metadata=metadata
-            )
-            context.elements.append(element)
+        for element_data in data.get("elements", ()):
+            type_ = _CONTEXT_TYPES[element_data["type"]]
+            if type_ is ContextType.CONVERSATION and isinstance(element_data["content"], dict):
+                # Older serializations stored every message a second time as an element
+                if not data.get("conversation_history"):
+                    history.append(ConversationMessage(
+                        element_data["content"].get("role", "user"),
+                        element_data["content"].get("content", "")
+                    ))
+                continue
+            meta = element_data["metadata"]
+            context.elements.append(ContextElement(
+                element_data["content"],
+                type_,
+                ContextMetadata(
+                    meta.get("created_at", now),
+                    meta.get("source", "unknown"),
+                    meta.get("importance", 5),
+                    meta.get("ttl"),
+                    meta.get("mime_type", "text/plain")
+                )
+            ))
         
         return context
     
@@ -0,0 +1,246 @@
+"""
+Offline stand-in for Gemini, for load tests and local benchmarks.
+
+FakeGenerativeModel implements the parts of genai.GenerativeModel the app
+uses: generate_content / generate_content_async (streamed or not) and chat
+sessions from start_chat(). Responses are deterministic for a given input and
+FAKE_MODEL_SEED; latency, completion size and error rate are configurable, so
+throughput runs are reproducible without spending API quota.
+
+Setting MODEL_BACKEND=fake swaps it in for get_ai_response, the Excel agent
+and the "gemini" MCP adapter (see FakeAdapter in mcp.model_adapter).
+"""
+
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from token_accounting import count_tokens
+
+# Set to "fake" to serve every model call from FakeGenerativeModel
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "gemini").lower()
+USE_FAKE_MODEL = MODEL_BACKEND == "fake"
+
+# Median latency of a fake call, in milliseconds
+FAKE_MODEL_LATENCY_MS = float(os.getenv("FAKE_MODEL_LATENCY_MS", "800"))
+
+# Latency distribution: "fixed", "uniform" or "lognormal"
+FAKE_MODEL_LATENCY_DISTRIBUTION = os.getenv("FAKE_MODEL_LATENCY_DISTRIBUTION", "lognormal").lower()
+
+# Spread of the distribution: +/- fraction for uniform, sigma for lognormal
+FAKE_MODEL_LATENCY_SPREAD = float(os.getenv("FAKE_MODEL_LATENCY_SPREAD", "0.5"))
+
+# Completion tokens each fake response reports
+FAKE_MODEL_COMPLETION_TOKENS = int(os.getenv("FAKE_MODEL_COMPLETION_TOKENS", "200"))
+
+# Fraction of calls that fail, and the status code they fail with (503 is retried)
+FAKE_MODEL_ERROR_RATE = float(os.getenv("FAKE_MODEL_ERROR_RATE", "0"))
+FAKE_MODEL_ERROR_CODE = int(os.getenv("FAKE_MODEL_ERROR_CODE", "503"))
+
+# Chunks a streamed fake response is split into
+FAKE_MODEL_STREAM_CHUNKS = int(os.getenv("FAKE_MODEL_STREAM_CHUNKS", "8"))
+
+# Response template; {prompt} is the start of the final user turn, {model} the model name
+FAKE_MODEL_RESPONSE = os.getenv("FAKE_MODEL_RESPONSE", "This is a simulated response to: {prompt}")
+
+# Seed for responses, latencies and errors
+FAKE_MODEL_SEED = int(os.getenv("FAKE_MODEL_SEED", "0"))
+
+_FILLER_WORDS = (
+    "the", "model", "context", "study", "plan", "data", "result", "answer", "example", "value",
+    "section", "summary", "point", "question", "detail", "step", "topic", "review", "note", "list"
+)
+
+
+class FakeModelError(Exception):
+    """Simulated model failure, carrying a status code like google.api_core errors."""
+
+    def __init__(self, code: int):
+        super().__init__(f"{code} Simulated model error")
+        self.code = code
+
+
+def _texts(contents: Any) -> List[str]:
+    """Collect the text parts of generate_content-style contents."""
+    if contents is None:
+        return []
+    if isinstance(contents, str):
+        return [contents]
+    if isinstance(contents, dict):
+        if "parts" in contents:
+            return _texts(contents["parts"])
+        return [str(contents.get("text", ""))]
+    if isinstance(contents, (list, tuple)):
+        return [text for item in contents for text in _texts(item)]
+    parts = getattr(contents, "parts", None)
+    if parts is not None:
+        return _texts(list(parts))
+    return [str(getattr(contents, "text", contents))]
+
+
+def _final_turn(contents: Any) -> List[str]:
+    """Text of the last turn: the last message of a message list, or the whole prompt."""
+    if isinstance(contents, (list, tuple)) and contents and not isinstance(contents[-1], str):
+        return _texts(contents[-1])
+    return _texts(contents)
+
+
+def _usage_metadata(prompt_tokens: int, completion_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=completion_tokens,
+        total_token_count=prompt_tokens + completion_tokens
+    )
+
+
+class FakeResponse:
+    """A generate_content response (or one streamed chunk) from the fake model."""
+
+    def __init__(self, text: str, usage_metadata: Optional[SimpleNamespace] = None):
+        self.text = text
+        self.parts = [SimpleNamespace(text=text)]
+        self.usage_metadata = usage_metadata
+
+
+class FakeStream:
+    """Async iterable of response chunks, spreading the call's latency across them."""
+
+    def __init__(self, chunks: List[FakeResponse], delay: float):
+        self._chunks = chunks
+        self._delay = delay
+
+    async def _iterate(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._delay)
+            yield chunk
+
+    def __aiter__(self):
+        return self._iterate()
+
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel that never leaves the process."""
+
+    def __init__(self,
+                 model_name: str = "gemini-2.0-flash",
+                 generation_config: Optional[Dict[str, Any]] = None,
+                 latency_ms: float = None,
+                 distribution: str = None,
+                 spread: float = None,
+                 completion_tokens: int = None,
+                 error_rate: float = None,
+                 error_code: int = None,
+                 stream_chunks: int = None,
+                 template: str = None,
+                 seed: int = None):
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self._generation_config = generation_config or {}
+        self.latency_ms = FAKE_MODEL_LATENCY_MS if latency_ms is None else latency_ms
+        self.distribution = FAKE_MODEL_LATENCY_DISTRIBUTION if distribution is None else distribution
+        self.spread = FAKE_MODEL_LATENCY_SPREAD if spread is None else spread
+        self.completion_tokens = FAKE_MODEL_COMPLETION_TOKENS if completion_tokens is None else completion_tokens
+        self.error_rate = FAKE_MODEL_ERROR_RATE if error_rate is None else error_rate
+        self.error_code = FAKE_MODEL_ERROR_CODE if error_code is None else error_code
+        self.stream_chunks = max(1, FAKE_MODEL_STREAM_CHUNKS if stream_chunks is None else stream_chunks)
+        self.template = FAKE_MODEL_RESPONSE if template is None else template
+        self.seed = FAKE_MODEL_SEED if seed is None else seed
+        # Errors draw from one seeded stream, so retries of the same input can succeed
+        self._error_rng = random.Random(self.seed)
+        self._error_lock = threading.Lock()
+
+    def _rng(self, contents: Any) -> random.Random:
+        raw = json.dumps(_texts(contents), ensure_ascii=False)
+        digest = hashlib.sha256(f"{self.seed}:{self.model_name}:{raw}".encode('utf-8')).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    def latency(self, rng: random.Random) -> float:
+        """Draw the latency of one call, in seconds."""
+        median = self.latency_ms / 1000.0
+        if median <= 0:
+            return 0.0
+        if self.distribution == "uniform":
+            return max(0.0, median * rng.uniform(1 - self.spread, 1 + self.spread))
+        if self.distribution == "lognormal":
+            return median * rng.lognormvariate(0, self.spread)
+        return median
+
+    def _respond(self, contents: Any):
+        """Work out the outcome of a call: (latency, text, usage_metadata) or a FakeModelError."""
+        rng = self._rng(contents)
+        latency = self.latency(rng)
+        with self._error_lock:
+            failed = self.error_rate > 0 and self._error_rng.random() < self.error_rate
+        if failed:
+            return latency, FakeModelError(self.error_code), None
+
+        prompt = re.sub(r"\s+", " ", " ".join(_final_turn(contents))).strip()
+        text = self.template.format(prompt=prompt[:200], model=self.model_name)
+        filler = self.completion_tokens - len(text.split())
+        if filler > 0:
+            text += "\n\n" + " ".join(rng.choice(_FILLER_WORDS) for _ in range(filler))
+        prompt_tokens = count_tokens("\n".join(_texts(contents)))
+        return latency, text, _usage_metadata(prompt_tokens, self.completion_tokens)
+
+    def _chunks(self, text: str, usage_metadata: SimpleNamespace) -> List[FakeResponse]:
+        words = text.split(" ")
+        size = max(1, -(-len(words) // self.stream_chunks))
+        pieces = [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+        pieces = [piece + " " for piece in pieces[:-1]] + pieces[-1:]
+        chunks = [FakeResponse(piece) for piece in pieces]
+        # Like Gemini, the final chunk carries the usage for the whole call
+        chunks[-1].usage_metadata = usage_metadata
+        return chunks
+
+    async def generate_content_async(self, contents: Any, stream: bool = False, **kwargs) -> Any:
+        """Async generate_content; with stream=True returns an async iterable of chunks."""
+        latency, text, usage_metadata = self._respond(contents)
+        if stream:
+            if isinstance(text, Exception):
+                await asyncio.sleep(latency)
+                raise text
+            chunks = self._chunks(text, usage_metadata)
+            return FakeStream(chunks, latency / len(chunks))
+        await asyncio.sleep(latency)
+        if isinstance(text, Exception):
+            raise text
+        return FakeResponse(text, usage_metadata)
+
+    def generate_content(self, contents: Any, stream: bool = False, **kwargs) -> FakeResponse:
+        """Blocking generate_content (not streamed)."""
+        latency, text, usage_metadata = self._respond(contents)
+        time.sleep(latency)
+        if isinstance(text, Exception):
+            raise text
+        return FakeResponse(text, usage_metadata)
+
+    def start_chat(self, history: Optional[List[Any]] = None) -> "FakeChatSession":
+        return FakeChatSession(self, history)
+
+
+class FakeChatSession:
+    """Chat session over the fake model; each message is answered with the history as context."""
+
+    def __init__(self, model: FakeGenerativeModel, history: Optional[List[Any]] = None):
+        self.model = model
+        self.history = list(history or [])
+
+    def _record(self, content: Any, response: FakeResponse) -> None:
+        self.history.append({"role": "user", "parts": _texts(content)})
+        self.history.append({"role": "model", "parts": [response.text]})
+
+    async def send_message_async(self, content: Any, **kwargs) -> FakeResponse:
+        response = await self.model.generate_content_async(self.history + [{"role": "user", "parts": _texts(content)}])
+        self._record(content, response)
+        return response
+
+    def send_message(self, content: Any, **kwargs) -> FakeResponse:
+        response = self.model.generate_content(self.history + [{"role": "user", "parts": _texts(content)}])
+        self._record(content, response)
+        return response
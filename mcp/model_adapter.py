@@ -5,10 +5,14 @@ This module provides adapters for different AI models to work with the Model Con
 It enables a consistent interface for interacting with various models while using MCP contexts.
 """
 
-from typing import Dict, List, Any, Optional, Union, Callable
+from typing import Dict, List, Any, Optional, Union, Callable, AsyncIterator
 import json
 import os
+import time
 import asyncio
+import threading
+import itertools
+import contextlib
 from abc import ABC, abstractmethod
 
 try:
@@ -17,6 +21,103 @@ except ImportError:
     genai = None
 
 from .context import MCPContext, ContextType
+from .prompts import format_context_messages, append_user_part
+from .response_cache import get_response_cache, make_cache_keys
+from .single_flight import get_single_flight, shared_usage
+from .fake_model import FakeGenerativeModel, USE_FAKE_MODEL
+from .packing import pack_context, summarize_removed, CONTEXT_TOKEN_BUDGET
+
+from model_scheduler import (
+    call_model, get_model_scheduler, estimate_tokens, is_retryable, model_priority, ModelOverloaded,
+    MODEL_CALL_RETRIES
+)
+from token_accounting import usage_for_call, usage_from_metadata, StreamTokenCounter
+from request_metrics import observe
+from request_logging import get_logger
+
+context_log = get_logger("context")
+
+# Seconds a discovered model list is served before it is refreshed in the background
+GEMINI_MODEL_LIST_TTL = int(os.getenv("GEMINI_MODEL_LIST_TTL", "3600"))
+
+
+class ModelCatalog:
+    """
+    Cached list of the model names the API offers.
+
+    The first lookup fetches the list. Later lookups return the cached list
+    immediately; once it is older than the TTL a single background thread
+    refreshes it, and the old list stays in use if the refresh fails.
+    """
+    
+    def __init__(self, list_models: Callable[[], List[str]], ttl: float = GEMINI_MODEL_LIST_TTL):
+        self._list_models = list_models
+        self.ttl = ttl
+        self._models: Optional[List[str]] = None
+        self._fetched_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+    
+    def _fetch(self) -> None:
+        try:
+            models = list(self._list_models())
+            print(f"Available Gemini models: {models}")
+        except Exception as e:
+            print(f"Warning: Could not retrieve available models: {e}")
+            models = None
+        with self._lock:
+            if models is not None:
+                self._models = models
+            elif self._models is None:
+                # Nothing cached yet: remember the failure so callers don't retry on every request
+                self._models = []
+            self._fetched_at = time.monotonic()
+            self._refreshing = False
+    
+    def models(self) -> List[str]:
+        """Return the cached model names, fetching them on first use."""
+        with self._lock:
+            models = self._models
+            stale = models is not None and time.monotonic() - self._fetched_at > self.ttl
+            start_refresh = stale and not self._refreshing
+            if start_refresh:
+                self._refreshing = True
+        
+        if models is None:
+            self._fetch()
+            return self._models
+        if start_refresh:
+            threading.Thread(target=self._fetch, name="gemini-model-catalog", daemon=True).start()
+        return models
+    
+    def invalidate(self) -> None:
+        """Forget the cached list so the next lookup fetches it again."""
+        with self._lock:
+            self._models = None
+            self._fetched_at = 0.0
+
+
+_configured_api_key = None
+_gemini_catalog = None
+_gemini_lock = threading.Lock()
+
+def configure_gemini(api_key: str) -> None:
+    """Configure the genai library, skipping the call when the key hasn't changed."""
+    global _configured_api_key
+    with _gemini_lock:
+        if _configured_api_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_api_key = api_key
+
+
+def get_gemini_catalog() -> ModelCatalog:
+    """Get the process-wide Gemini model catalog."""
+    global _gemini_catalog
+    if _gemini_catalog is None:
+        with _gemini_lock:
+            if _gemini_catalog is None:
+                _gemini_catalog = ModelCatalog(lambda: [model.name for model in genai.list_models()])
+    return _gemini_catalog
 
 
 class MCPModelResponse:
@@ -25,10 +126,13 @@ class MCPModelResponse:
     def __init__(self, 
                  text: str, 
                  raw_response: Any = None,
-                 usage_metrics: Dict[str, int] = None):
+                 usage_metrics: Dict[str, int] = None,
+                 error: Optional[Exception] = None):
         self.text = text
         self.raw_response = raw_response
         self.usage_metrics = usage_metrics or {}
+        # Set when the call failed; text then holds a message that is safe to show users
+        self.error = error
     
     @property
     def content(self) -> str:
@@ -36,6 +140,39 @@ class MCPModelResponse:
         return self.text
 
 
+class MCPModelStream:
+    """
+    Streamed response from a model call.
+    
+    Iterate with ``async for`` to receive text chunks as they arrive. Once the
+    iteration finishes, ``text`` holds the full response and ``usage_metrics``
+    holds the final token accounting for the call.
+    """
+    
+    def __init__(self, 
+                 chunks: AsyncIterator[str], 
+                 finalize: Callable[[str], Dict[str, int]]):
+        self._chunks = chunks
+        self._finalize = finalize
+        self.text = ""
+        self.usage_metrics: Dict[str, int] = {}
+        self.done = False
+    
+    def __aiter__(self):
+        return self._iterate()
+    
+    async def _iterate(self):
+        parts = []
+        async for chunk in self._chunks:
+            if not chunk:
+                continue
+            parts.append(chunk)
+            yield chunk
+        self.text = "".join(parts)
+        self.usage_metrics = self._finalize(self.text)
+        self.done = True
+
+
 class MCPModelAdapter(ABC):
     """Base adapter class for model providers."""
     
@@ -50,18 +187,88 @@ class MCPModelAdapter(ABC):
     def format_context_for_model(self, context: MCPContext) -> Any:
         """Format the context in a way the specific model can understand."""
         pass
+    
+    def stream_with_context(self, 
+                            prompt: str, 
+                            context: MCPContext) -> MCPModelStream:
+        """
+        Stream a response using the given prompt and context.
+        
+        Adapters without native streaming fall back to a single chunk holding
+        the full response.
+        """
+        result = {}
+        
+        async def single_chunk():
+            response = await self.generate_with_context(prompt, context)
+            result["usage_metrics"] = response.usage_metrics
+            yield response.text
+        
+        return MCPModelStream(single_chunk(), lambda text: result.get("usage_metrics", {}))
+    
+    async def generate_batch(self, 
+                             prompts: List[str], 
+                             contexts: Union[MCPContext, List[MCPContext]],
+                             concurrency: Optional[int] = None,
+                             priority: Optional[int] = None) -> List[MCPModelResponse]:
+        """
+        Generate responses for independent prompts concurrently.
+        
+        Calls fan out together and queue on the shared model-call scheduler, so
+        N prompts take about one round-trip of wall-clock time instead of N.
+        A failing item doesn't fail the batch.
+        
+        Args:
+            prompts: Prompts to generate responses for
+            contexts: One context per prompt, or a single context shared by all of them
+            concurrency: Maximum calls from this batch in flight at once (default: no extra limit)
+            priority: Scheduler priority for the calls (default: the caller's priority)
+            
+        Returns:
+            list: One MCPModelResponse per prompt, in prompt order; failed items have ``error`` set
+        """
+        if isinstance(contexts, MCPContext):
+            contexts = [contexts] * len(prompts)
+        if len(contexts) != len(prompts):
+            raise ValueError(f"generate_batch got {len(prompts)} prompts but {len(contexts)} contexts")
+        
+        semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        
+        async def generate_item(prompt, context):
+            try:
+                if semaphore is None:
+                    return await self.generate_with_context(prompt, context)
+                async with semaphore:
+                    return await self.generate_with_context(prompt, context)
+            except Exception as e:
+                return MCPModelResponse(
+                    text="",
+                    usage_metrics={"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                    error=e
+                )
+        
+        # Tasks created inside the block inherit its priority
+        with model_priority(priority) if priority is not None else contextlib.nullcontext():
+            return list(await asyncio.gather(*(
+                generate_item(prompt, context) for prompt, context in zip(prompts, contexts)
+            )))
 
 
 class GeminiAdapter(MCPModelAdapter):
     """Adapter for Google's Gemini models."""
     
-    def __init__(self, model_name: str = "gemini-2.0-flash"):
+    def __init__(self, model_name: str = "gemini-2.0-flash", context_budget: int = CONTEXT_TOKEN_BUDGET):
         """
         Initialize the Gemini adapter with the appropriate model.
         
         Note: As of May 2025, the recommended model is gemini-2.0-flash for
         fast, efficient responses with good performance and lower latency.
+        
+        Args:
+            model_name: Preferred Gemini model
+            context_budget: Token budget the context is packed into for each call
         """
+        self.context_budget = context_budget
         if genai is None:
             raise ImportError("Google GenerativeAI package is not installed. "
                              "Install with: pip install google-generativeai")
@@ -71,61 +278,12 @@ class GeminiAdapter(MCPModelAdapter):
         if not api_key:
             raise ValueError("GOOGLE_API_KEY environment variable must be set")
         
-        # Configure the genai library with the API key
-        genai.configure(api_key=api_key)
+        # Configure the genai library with the API key (once per process)
+        configure_gemini(api_key)
         
-        # The preferred models in order of preference
-        # Note that Google's API sometimes returns model names with a "models/" prefix
-        preferred_models = [
-            "gemini-2.0-flash",
-            "models/gemini-2.0-flash",
-            "models/gemini-2.0-flash-001", 
-            "gemini-1.5-flash",
-            "models/gemini-1.5-flash", 
-            "models/gemini-1.5-flash-latest",
-            "models/gemini-1.5-flash-001"
-        ]
-        
-        # Try to get available models
-        self.available_models = []
-        try:
-            self.available_models = [model.name for model in genai.list_models()]
-            print(f"Available Gemini models: {self.available_models}")
-        except Exception as e:
-            print(f"Warning: Could not retrieve available models: {e}")
-        
-        # Check if the requested model is available (with or without "models/" prefix)
-        self.model_name = model_name
-        requested_with_prefix = f"models/{model_name}"
-        
-        if self.available_models:
-            # If the model name doesn't exist as specified, check if it exists with the "models/" prefix
-            if model_name not in self.available_models and requested_with_prefix not in self.available_models:
-                # Find the first available model from our preferred list
-                found_model = False
-                for preferred in preferred_models:
-                    if preferred in self.available_models:
-                        self.model_name = preferred
-                        print(f"Model '{model_name}' not found, using '{self.model_name}' instead")
-                        found_model = True
-                        break
-                
-                # If none of our preferred models are available, look for any viable Gemini model
-                if not found_model:
-                    # Check for good Gemini 2.0 or 1.5 models first
-                    viable_models = [
-                        m for m in self.available_models 
-                        if "gemini-2.0-flash" in m or "gemini-1.5-flash" in m or "gemini-2.0-pro" in m
-                    ]
-                    
-                    # If no viable models found, try any Gemini model
-                    if not viable_models:
-                        viable_models = [m for m in self.available_models if "gemini" in m]
-                    
-                    # Use the first available model from our filtered list
-                    if viable_models:
-                        self.model_name = viable_models[0]
-                        print(f"Model '{model_name}' not found, using '{self.model_name}' instead")
+        # Resolved against the catalog's current list, so later refreshes apply
+        self.requested_model = model_name
+        self.model_name = self._resolve_model_name(model_name)
         
         try:
             print(f"Initializing Gemini model: {self.model_name}")
@@ -152,99 +310,208 @@ class GeminiAdapter(MCPModelAdapter):
             if not fallback_attempted:
                 raise ValueError(f"Could not initialize any available Gemini model: {e}")
     
+    @property
+    def available_models(self) -> List[str]:
+        """Model names the API offers, read from the shared catalog so its refreshes apply."""
+        return get_gemini_catalog().models()
+    
+    def _resolve_model_name(self, model_name: str) -> str:
+        """Pick the model to use for a requested name from the currently available models."""
+        # The preferred models in order of preference
+        # Note that Google's API sometimes returns model names with a "models/" prefix
+        preferred_models = [
+            "gemini-2.0-flash",
+            "models/gemini-2.0-flash",
+            "models/gemini-2.0-flash-001", 
+            "gemini-1.5-flash",
+            "models/gemini-1.5-flash", 
+            "models/gemini-1.5-flash-latest",
+            "models/gemini-1.5-flash-001"
+        ]
+        
+        # Check if the requested model is available (with or without "models/" prefix)
+        available_models = self.available_models
+        if not available_models or model_name in available_models or f"models/{model_name}" in available_models:
+            return model_name
+        
+        # Find the first available model from our preferred list
+        resolved = next((preferred for preferred in preferred_models if preferred in available_models), None)
+        
+        # If none of our preferred models are available, look for any viable Gemini model
+        if resolved is None:
+            # Check for good Gemini 2.0 or 1.5 models first
+            viable_models = [
+                m for m in available_models 
+                if "gemini-2.0-flash" in m or "gemini-1.5-flash" in m or "gemini-2.0-pro" in m
+            ]
+            
+            # If no viable models found, try any Gemini model
+            if not viable_models:
+                viable_models = [m for m in available_models if "gemini" in m]
+            resolved = viable_models[0] if viable_models else model_name
+        
+        if resolved != model_name:
+            print(f"Model '{model_name}' not found, using '{resolved}' instead")
+        return resolved
+    
+    def _reresolve_if_missing(self, e: Exception) -> None:
+        """After a model-not-found error, switch to what the (refreshed) catalog now offers."""
+        error_message = str(e)
+        if "404" not in error_message or "not found" not in error_message:
+            return
+        model_name = self._resolve_model_name(self.requested_model)
+        if model_name != self.model_name:
+            try:
+                self.model = genai.GenerativeModel(model_name)
+                self.model_name = model_name
+            except Exception as init_error:
+                print(f"Switching to model {model_name} failed: {init_error}")
+    
     def format_context_for_model(self, context: MCPContext) -> List[Dict[str, Any]]:
-        """Format the context for Gemini."""
-        formatted_messages = []
+        """Format the context for Gemini, packed into the adapter's token budget."""
+        packed = pack_context(context, self.context_budget)
+        if packed.removed:
+            context_log.info("Packed context into token budget: %s", summarize_removed(packed))
+        return format_context_messages(packed.context)
+    
+    def _build_messages(self, prompt: str, context: MCPContext) -> List[Dict[str, Any]]:
+        """Format the context and append the current prompt as the final user turn."""
+        # Format conversation history
+        messages = self.format_context_for_model(context)
         
-        # Add system instructions
-        system_instructions = [
-            e.content for e in context.elements 
-            if e.type == ContextType.SYSTEM_INSTRUCTION
-        ]
+        # Add the current prompt to the last user turn, or as a new one
+        append_user_part(messages, prompt)
         
-        if system_instructions:
-            formatted_messages.append({
-                "role": "user",
-                "parts": [{"text": "System Instructions:\n" + "\n".join(system_instructions)}]
-            })
-            # Add model response to acknowledge system instructions
-            formatted_messages.append({
-                "role": "model",
-                "parts": [{"text": "I'll follow these instructions."}]
-            })
-        
-        # Add conversation history
-        for message in context.conversation_history:
-            formatted_messages.append({
-                "role": "user" if message.role == "user" else "model",
-                "parts": [{"text": message.content}]
-            })
-        
-        # Add document content if available
-        documents = [
-            e.content for e in context.elements 
-            if e.type == ContextType.DOCUMENT
-        ]
+        return messages
+    
+    def _usage(self, 
+               messages: List[Dict[str, Any]], 
+               text: str, 
+               response: Any = None, 
+               completion_tokens: Optional[int] = None) -> Dict[str, int]:
+        """Token usage reported by Gemini, or counted locally when it isn't."""
+        return usage_for_call(messages, text, response, completion_tokens)
+    
+    def _cache_keys(self, messages: List[Dict[str, Any]]):
+        """Response cache keys for the messages (also the single-flight identity of the call)."""
+        return make_cache_keys(self.model_name, messages, getattr(self.model, "_generation_config", None))
+    
+    def _friendly_error(self, e: Exception) -> str:
+        """Turn a generation error into a message that is safe to show users."""
+        # Try to provide helpful error information
+        error_message = str(e)
+        friendly_error = "I apologize, but I encountered an error processing your request."
         
-        if documents and formatted_messages:
-            document_text = "Document content:\n"
-            if len(documents) == 1:
-                document_text += documents[0]
-            else:
-                document_text += "\n\n" + "\n\n".join(documents)
-                
-            # Add document content as a separate message or append to the last message
-            if formatted_messages and formatted_messages[-1]["role"] == "user":
-                # Append to last user message
-                formatted_messages[-1]["parts"][0]["text"] += "\n\n" + document_text
-            else:
-                # Add as a new message
-                formatted_messages.append({
-                    "role": "user",
-                    "parts": [{"text": document_text}]
-                })
-        
-        # Add user memory if available
-        memory_data = [
-            e.content for e in context.elements 
-            if e.type == ContextType.USER_MEMORY
-        ]
+        # Handle specific error cases
+        if isinstance(e, ModelOverloaded):
+            friendly_error += " We're handling a lot of requests right now. Please try again in a moment."
+        elif "404" in error_message and "not found" in error_message:
+            friendly_error += " The AI model currently in use is not available. This might be due to API changes."
+            if self.available_models:
+                friendly_error += f" Available models: {', '.join(self.available_models[:5])}"
+        elif "quota" in error_message.lower() or "rate limit" in error_message.lower():
+            friendly_error += " We've reached our API quota limit. Please try again later."
+        
+        return friendly_error
+    
+    def stream_with_context(self, 
+                            prompt: str, 
+                            context: MCPContext) -> MCPModelStream:
+        """Stream a response from Gemini chunk by chunk as it is generated."""
+        messages = self._build_messages(prompt, context)
+        failed = {"error": False}
+        counter = StreamTokenCounter()
+        reported = {}
+        cache = get_response_cache()
+        cache_keys = self._cache_keys(messages) if cache else None
+        cached = cache.get(cache_keys) if cache else None
+        if cached is not None:
+            async def cached_chunk():
+                yield cached.text
+            return MCPModelStream(cached_chunk(), lambda text: cached.usage_metrics)
         
-        if memory_data and formatted_messages:
-            memory_text = "User memory:\n" + json.dumps(memory_data[0]) if memory_data else ""
-            if memory_text:
-                if formatted_messages and formatted_messages[-1]["role"] == "user":
-                    # Append to last user message
-                    formatted_messages[-1]["parts"][0]["text"] += "\n\n" + memory_text
-                else:
-                    # Add as a new message
-                    formatted_messages.append({
-                        "role": "user",
-                        "parts": [{"text": memory_text}]
-                    })
-        
-        return formatted_messages
+        async def chunks():
+            scheduler = get_model_scheduler()
+            tokens = estimate_tokens(messages)
+            streamed = False
+            try:
+                for attempt in itertools.count():
+                    try:
+                        # Hold the model-call slot for the whole stream
+                        async with scheduler.slot(self.model_name, tokens=tokens):
+                            started = time.perf_counter()
+                            first_chunk = True
+                            response = await self.model.generate_content_async(messages, stream=True)
+                            async for chunk in response:
+                                if first_chunk:
+                                    observe("gemini.first_chunk", time.perf_counter() - started)
+                                    first_chunk = False
+                                # The final chunk carries the usage for the whole call
+                                usage = usage_from_metadata(chunk)
+                                if usage is not None:
+                                    reported["usage"] = usage
+                                try:
+                                    text = chunk.text
+                                except Exception:
+                                    # Chunks without text parts (e.g. safety metadata) carry nothing to show
+                                    continue
+                                if text:
+                                    streamed = True
+                                    counter.add(text)
+                                    yield text
+                            observe("gemini.stream", time.perf_counter() - started)
+                        break
+                    except Exception as e:
+                        # Only a stream that failed before showing any output can be retried
+                        if streamed or attempt >= MODEL_CALL_RETRIES or not is_retryable(e):
+                            raise
+                        await scheduler.retry_backoff(self.model_name, attempt, e)
+            except Exception as e:
+                print(f"Error streaming content with Gemini: {e}")
+                self._reresolve_if_missing(e)
+                failed["error"] = True
+                yield self._friendly_error(e)
+        
+        def finalize(text: str) -> Dict[str, int]:
+            if failed["error"]:
+                return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            usage_metrics = reported.get("usage") or self._usage(messages, text, completion_tokens=counter.total)
+            if cache:
+                cache.put(cache_keys, text, usage_metrics)
+            return usage_metrics
+        
+        return MCPModelStream(chunks(), finalize)
     
     async def generate_with_context(self, 
                                   prompt: str, 
                                   context: MCPContext) -> MCPModelResponse:
         """Generate a response using Gemini with the given context."""
-        # Format conversation history
-        messages = self.format_context_for_model(context)
-        
-        # Add the current prompt as a user message
-        if not messages or messages[-1]["role"] != "user":
-            messages.append({
-                "role": "user",
-                "parts": [{"text": prompt}]
-            })
-        else:
-            # Append to the last user message if it exists
-            messages[-1]["parts"][0]["text"] += "\n\n" + prompt
+        messages = self._build_messages(prompt, context)
+        cache = get_response_cache()
+        cache_keys = self._cache_keys(messages)
+        if cache:
+            cached = cache.get(cache_keys)
+            if cached is not None:
+                return MCPModelResponse(text=cached.text, usage_metrics=cached.usage_metrics)
         
+        # Identical calls already in flight (double submits, client retries) share one generation
+        response, shared = await get_single_flight().do(
+            cache_keys.exact, lambda: self._generate(messages, cache_keys if cache else None)
+        )
+        if shared:
+            return MCPModelResponse(text=response.text, raw_response=response.raw_response,
+                                    usage_metrics=shared_usage(response.usage_metrics), error=response.error)
+        return response
+    
+    async def _generate(self, messages: List[Dict[str, Any]], cache_keys=None) -> MCPModelResponse:
+        """Call Gemini for formatted messages and store the result in the response cache."""
         try:
-            # Call the model with the formatted messages
-            response = await self.model.generate_content_async(messages)
+            # Call the model with the formatted messages, through the shared scheduler
+            response = await call_model(
+                lambda: self.model.generate_content_async(messages),
+                model=self.model_name,
+                tokens=estimate_tokens(messages)
+            )
             
             # Extract text from response
             if hasattr(response, "text"):
@@ -254,58 +521,118 @@ class GeminiAdapter(MCPModelAdapter):
             else:
                 text = str(response)
             
-            # Estimate tokens (actual usage depends on model implementation)
-            total_chars = sum(len(m["parts"][0]["text"]) for m in messages) + len(text)
-            estimated_tokens = total_chars // 4
-            
-            usage_metrics = {
-                "prompt_tokens": (total_chars - len(text)) // 4,
-                "completion_tokens": len(text) // 4,
-                "total_tokens": estimated_tokens
-            }
+            usage_metrics = self._usage(messages, text, response)
+            if cache_keys:
+                get_response_cache().put(cache_keys, text, usage_metrics)
             
             return MCPModelResponse(text=text, raw_response=response, usage_metrics=usage_metrics)
         
         except Exception as e:
             print(f"Error generating content with Gemini: {e}")
-            
-            # Try to provide helpful error information
-            error_message = str(e)
-            friendly_error = "I apologize, but I encountered an error processing your request."
-            
-            # Handle specific error cases
-            if "404" in error_message and "not found" in error_message:
-                friendly_error += " The AI model currently in use is not available. This might be due to API changes."
-                if self.available_models:
-                    friendly_error += f" Available models: {', '.join(self.available_models[:5])}"
-            elif "quota" in error_message.lower() or "rate limit" in error_message.lower():
-                friendly_error += " We've reached our API quota limit. Please try again later."
+            self._reresolve_if_missing(e)
             
             # Return a graceful error response
             return MCPModelResponse(
-                text=friendly_error,
+                text=self._friendly_error(e),
                 raw_response=None,
-                usage_metrics={"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+                usage_metrics={"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                error=e
             )
 
 
+class FakeAdapter(GeminiAdapter):
+    """
+    Gemini adapter driving the offline FakeGenerativeModel, for load tests.
+    
+    Everything except the model itself (context packing, caching, coalescing,
+    scheduling, token accounting) runs exactly as for Gemini.
+    """
+    
+    def __init__(self, 
+                 model_name: str = "gemini-2.0-flash", 
+                 context_budget: int = CONTEXT_TOKEN_BUDGET, 
+                 **fake_options):
+        """
+        Initialize the adapter around a fake model.
+        
+        Args:
+            model_name: Model name to impersonate (rate limits configured for it apply)
+            context_budget: Token budget the context is packed into for each call
+            **fake_options: FakeGenerativeModel overrides (latency_ms, error_rate, ...)
+        """
+        self.context_budget = context_budget
+        self.requested_model = self.model_name = model_name
+        self.model = FakeGenerativeModel(model_name, **fake_options)
+    
+    @property
+    def available_models(self) -> List[str]:
+        return [self.model_name]
+    
+    def _cache_keys(self, messages: List[Dict[str, Any]]):
+        # Kept apart from real Gemini responses in a shared cache
+        return make_cache_keys(f"fake/{self.model_name}", messages, self.model._generation_config)
+
+
 class MCPModelRegistry:
-    """Registry of available model adapters."""
+    """
+    Registry of available model adapters.
+    
+    Adapters hold no per-request state, so one instance per (name, config) is
+    created and shared by the whole process.
+    """
     
     _adapters = {}
+    _instances = {}
+    _lock = threading.Lock()
     
     @classmethod
     def register(cls, name: str, adapter_class: type) -> None:
         """Register a model adapter."""
-        cls._adapters[name] = adapter_class
+        with cls._lock:
+            cls._adapters[name] = adapter_class
+            # Drop instances of a replaced adapter class
+            for key in [key for key in cls._instances if key[0] == name]:
+                del cls._instances[key]
     
     @classmethod
     def get(cls, name: str, **kwargs) -> MCPModelAdapter:
-        """Get a model adapter by name."""
+        """Get the shared adapter for a name and configuration, creating it on first use."""
         if name not in cls._adapters:
             raise ValueError(f"Model '{name}' not registered")
         
-        return cls._adapters[name](**kwargs)
+        key = (name, tuple(sorted(kwargs.items())))
+        try:
+            adapter = cls._instances.get(key)
+        except TypeError:
+            # Unhashable configuration: can't be pooled
+            return cls._adapters[name](**kwargs)
+        if adapter is not None:
+            return adapter
+        
+        # Built outside the lock: construction may list models over the network, and
+        # other adapters must stay available meanwhile. A racing build is discarded.
+        adapter = cls._adapters[name](**kwargs)
+        with cls._lock:
+            return cls._instances.setdefault(key, adapter)
+    
+    @classmethod
+    def warm_up(cls, name: str, **kwargs) -> threading.Thread:
+        """Create the shared adapter in a background thread, e.g. at startup."""
+        def build():
+            try:
+                cls.get(name, **kwargs)
+            except Exception as e:
+                print(f"Warning: Could not prepare model adapter '{name}': {e}")
+        
+        thread = threading.Thread(target=build, name=f"warm-up-{name}", daemon=True)
+        thread.start()
+        return thread
+    
+    @classmethod
+    def clear_instances(cls) -> None:
+        """Drop all shared adapter instances."""
+        with cls._lock:
+            cls._instances.clear()
     
     @classmethod
     def list_available(cls) -> List[str]:
@@ -315,6 +642,7 @@ class MCPModelRegistry:
 
 # Register available adapters
 MCPModelRegistry.register("gemini", GeminiAdapter)
+MCPModelRegistry.register("fake", FakeAdapter)
 
 
 class MCPModelFactory:
@@ -322,5 +650,8 @@ class MCPModelFactory:
     
     @staticmethod
     def create(model_name: str = "gemini", **kwargs) -> MCPModelAdapter:
-        """Create a model adapter based on the model name."""
+        """Get the shared model adapter for the model name and configuration."""
+        # MODEL_BACKEND=fake serves Gemini requests offline
+        if model_name == "gemini" and USE_FAKE_MODEL:
+            model_name = "fake"
         return MCPModelRegistry.get(model_name, **kwargs)
\ No newline at end of file
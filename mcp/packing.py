@@ -0,0 +1,182 @@
+"""
+Token-budgeted context packing.
+
+A context can hold far more than is worth sending: long chat histories, large
+documents and user memory all grow without bound. pack_context fits a context
+into a token budget by ranking its parts by value - the element's importance,
+lowered with age for conversation messages - and removing the lowest-value
+parts first. Documents are truncated to fit rather than dropped when there is
+room for a useful part of them. System instructions are always kept.
+"""
+
+import os
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .context import MCPContext, ContextElement, ContextType, ConversationMessage
+
+from token_accounting import count_tokens_batch
+
+# Default token budget for the context sent with each model call
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "32000"))
+
+# Importance lost per step back in the conversation history
+RECENCY_DECAY = 0.25
+
+# Documents aren't truncated below this many tokens; they're dropped instead
+MIN_DOCUMENT_TOKENS = 256
+
+DEFAULT_IMPORTANCE = 5
+TRUNCATION_MARKER = "\n[... truncated to fit the context budget ...]"
+
+
+@dataclass
+class PackedItem:
+    """Something removed or shortened while packing."""
+    kind: str  # element type value, or "message"
+    source: str
+    tokens: int
+    action: str  # "dropped" or "truncated"
+    kept_tokens: int = 0
+
+
+@dataclass
+class PackResult:
+    """A packed context and a report of what didn't fit."""
+    context: MCPContext
+    tokens: int
+    budget: int
+    removed: List[PackedItem] = field(default_factory=list)
+
+    @property
+    def dropped_tokens(self) -> int:
+        return sum(item.tokens - item.kept_tokens for item in self.removed)
+
+
+@dataclass
+class _Unit:
+    kind: str
+    source: str
+    text: str
+    score: float
+    truncatable: bool
+    element: Optional[ContextElement] = None
+    message: Optional[ConversationMessage] = None
+    tokens: int = 0
+    # Elements that go when this unit is dropped
+    followers: List[ContextElement] = field(default_factory=list)
+
+
+def _element_text(element: ContextElement) -> str:
+    if isinstance(element.content, str):
+        return element.content
+    return json.dumps(element.content, default=str)
+
+
+def _collect_units(context: MCPContext) -> List[_Unit]:
+    units = []
+    memory_unit = None
+    for element in context.elements:
+        if element.type == ContextType.SYSTEM_INSTRUCTION:
+            score, truncatable = float("inf"), False
+        elif element.type == ContextType.DOCUMENT:
+            score, truncatable = element.metadata.importance, isinstance(element.content, str)
+        elif element.type == ContextType.USER_MEMORY:
+            # Only the first memory element is sent (see prompts.format_context_messages),
+            # so only it is counted; the others go with it so none moves up in its place
+            if memory_unit is not None:
+                memory_unit.followers.append(element)
+                continue
+            score, truncatable = element.metadata.importance, False
+        else:
+            # Other element types aren't sent to the model; conversation
+            # messages live in conversation_history
+            continue
+        units.append(_Unit(element.type.value, element.metadata.source, _element_text(element),
+                           score, truncatable, element=element))
+        if element.type == ContextType.USER_MEMORY:
+            memory_unit = units[-1]
+
+    history = context.conversation_history
+    for age, message in enumerate(reversed(history)):
+        units.append(_Unit("message", message.role, message.content,
+                           DEFAULT_IMPORTANCE - age * RECENCY_DECAY, False, message=message))
+    return units
+
+
+def _truncate(text: str, tokens: int, keep_tokens: int) -> str:
+    """Keep roughly the first keep_tokens tokens of text, cut at whitespace."""
+    keep_chars = max(0, len(text) * keep_tokens // max(tokens, 1) - len(TRUNCATION_MARKER))
+    cut = text.rfind(" ", 0, keep_chars)
+    if cut < keep_chars // 2:
+        cut = keep_chars
+    return text[:cut].rstrip() + TRUNCATION_MARKER
+
+
+def pack_context(context: MCPContext, budget: int = CONTEXT_TOKEN_BUDGET) -> PackResult:
+    """
+    Fit a context into a token budget.
+
+    Args:
+        context: The context to pack; it is not modified
+        budget: Maximum tokens for the packed context
+
+    Returns:
+        PackResult: The packed context (the original one if everything fits),
+        its token count and what was dropped or truncated
+    """
+    units = _collect_units(context)
+
+    # Tokens never outnumber characters in practice, so short contexts skip counting
+    total_chars = sum(len(unit.text) for unit in units)
+    if total_chars <= budget:
+        return PackResult(context, total_chars, budget)
+
+    for unit, tokens in zip(units, count_tokens_batch(unit.text for unit in units)):
+        unit.tokens = tokens
+    total = sum(unit.tokens for unit in units)
+    if total <= budget:
+        return PackResult(context, total, budget)
+
+    removed = []
+    dropped_ids = set()
+    replacements = {}
+    # Lowest value first; among equals, the largest goes first
+    for unit in sorted(units, key=lambda u: (u.score, -u.tokens)):
+        if total <= budget or unit.score == float("inf"):
+            break
+        excess = total - budget
+        if unit.truncatable and unit.tokens - excess >= MIN_DOCUMENT_TOKENS:
+            keep = unit.tokens - excess
+            replacements[id(unit.element)] = ContextElement(
+                _truncate(unit.text, unit.tokens, keep), unit.element.type, unit.element.metadata
+            )
+            removed.append(PackedItem(unit.kind, unit.source, unit.tokens, "truncated", keep))
+            total -= excess
+        else:
+            dropped_ids.add(id(unit.element if unit.element is not None else unit.message))
+            dropped_ids.update(id(element) for element in unit.followers)
+            removed.append(PackedItem(unit.kind, unit.source, unit.tokens, "dropped"))
+            total -= unit.tokens
+
+    packed = MCPContext()
+    packed.user_id = context.user_id
+    packed.session_id = context.session_id
+    packed.elements = [
+        replacements.get(id(element), element)
+        for element in context.elements if id(element) not in dropped_ids
+    ]
+    packed.conversation_history = [
+        message for message in context.conversation_history if id(message) not in dropped_ids
+    ]
+    return PackResult(packed, total, budget, removed)
+
+
+def summarize_removed(result: PackResult) -> Dict[str, Any]:
+    """Compact description of a pack's removals, for logs and metrics."""
+    summary = {"budget": result.budget, "tokens": result.tokens, "dropped_tokens": result.dropped_tokens}
+    for item in result.removed:
+        key = f"{item.kind}_{item.action}"
+        summary[key] = summary.get(key, 0) + 1
+    return summary
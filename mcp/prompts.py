@@ -0,0 +1,155 @@
+"""
+Prompt templates for chat turns and MCP model messages.
+
+Everything that does not depend on the request - the per-language instruction
+blocks, the identity keyword matcher and the fixed headers - is built once at
+import. Building a turn then only picks the right precompiled blocks and adds
+the user's text as separate content parts, without rescanning or re-joining
+long strings.
+"""
+
+import re
+import json
+from typing import Any, Dict, List, Optional
+
+from .context import MCPContext, ContextType
+
+DEFAULT_LANGUAGE = 'en'
+
+LANGUAGE_INSTRUCTIONS = {
+    'en': "Please respond in English.",
+    'pl': "Proszę odpowiadać w języku polskim.",
+    'az': "Zəhmət olmasa Azərbaycan dilində cavab verin."
+}
+
+# Identity information (only used when the user asks about it)
+IDENTITY_INFO = {
+    'en': "Your name is Liya. You are an AI assistant created by LightYearAI, powered by Google's Gemini model. If asked about your creator, founder, or who made you, mention that you were developed by LightYearAI.",
+    'pl': "Nazywasz się Liya. Jesteś asystentem AI stworzonym przez LightYearAI, opartym na modelu Gemini od Google. Jeśli zapytają o twojego twórcę, założyciela lub kto cię stworzył, wspomnij, że zostałaś stworzona przez LightYearAI.",
+    'az': "Sizin adınız Liya-dır. Siz Google-ın Gemini modeli ilə işləyən LightYearAI tərəfindən yaradılmış AI köməkçisisiniz. Əgər yaradıcınız, təsisçiniz və ya sizi kimin yaratdığı haqqında soruşsalar, LightYearAI tərəfindən yaradıldığınızı qeyd edin."
+}
+
+# Keeps responses natural and free of AI disclaimers
+NATURAL_INSTRUCTIONS = {
+    'en': "Never mention that you are an AI, language model, or chatbot. Do not use disclaimers about your abilities or limitations. Respond as a friendly, knowledgeable assistant in a natural, casual, and human-like way.",
+    'pl': "Nigdy nie wspominaj, że jesteś AI, modelem językowym lub chatbotem. Nie używaj zastrzeżeń dotyczących swoich możliwości lub ograniczeń. Odpowiadaj jako przyjazny, kompetentny asystent w naturalny, swobodny i ludzki sposób.",
+    'az': "Heç vaxt süni intellekt, dil modeli və ya çatbot olduğunuzu qeyd etməyin. Bacarıq və məhdudiyyətləriniz barədə heç bir açıqlama verməyin. Cavablarınızı səmimi, bilikli və insan kimi təbii şəkildə verin."
+}
+
+IDENTITY_KEYWORDS = (
+    'your name', 'who are you', 'who made you', 'who created you',
+    'your creator', 'what are you called', 'what\'s your name',
+    'what is your name', 'kim olduğun', 'kim yaratdı', 'adın nədir',
+    'kim seni yarattı', 'kim jesteś', 'kto cię stworzył', 'jak się nazywasz',
+    'twój twórca', 'twoje imię', 'nazywasz się', 'founder', 'made by',
+    'developed by', 'company', 'LightYearAI', 'Liya', 'your identity'
+)
+
+# One alternation over all keywords: a single case-insensitive scan per prompt
+IDENTITY_PATTERN = re.compile(
+    '|'.join(re.escape(keyword) for keyword in sorted(IDENTITY_KEYWORDS, key=len, reverse=True)),
+    re.IGNORECASE
+)
+
+SYSTEM_INSTRUCTIONS_HEADER = "System Instructions:\n"
+SYSTEM_ACKNOWLEDGEMENT = "I'll follow these instructions."
+DOCUMENT_HEADER = "Document content:\n"
+USER_MEMORY_HEADER = "User memory:\n"
+
+
+def _build_language_blocks(language):
+    identity = IDENTITY_INFO.get(language, IDENTITY_INFO[DEFAULT_LANGUAGE])
+    natural = NATURAL_INSTRUCTIONS.get(language, NATURAL_INSTRUCTIONS[DEFAULT_LANGUAGE])
+    instruction = LANGUAGE_INSTRUCTIONS.get(language, LANGUAGE_INSTRUCTIONS[DEFAULT_LANGUAGE])
+    return {
+        'prefix': f"{natural}\n\n",
+        'identity_prefix': f"{identity}\n\n{natural}\n\n",
+        'suffix': f"\n\n{instruction}",
+        'system': f"\n\n{natural}\n\n{instruction}\n\nUser request: ",
+        'identity_system': f"\n\n{identity}\n\n{natural}\n\n{instruction}\n\nUser request: "
+    }
+
+_LANGUAGE_BLOCKS = {language: _build_language_blocks(language) for language in LANGUAGE_INSTRUCTIONS}
+
+
+def is_identity_question(prompt: str) -> bool:
+    """Check whether the prompt asks about the assistant's name or creator."""
+    return bool(prompt) and IDENTITY_PATTERN.search(prompt) is not None
+
+
+def build_prompt_parts(prompt: str, language: Optional[str] = None,
+                       system_prompt: Optional[str] = None) -> List[str]:
+    """
+    Build the content parts for a chat turn.
+
+    Args:
+        prompt: The user's prompt
+        language: Response language code; unknown codes fall back to English
+        system_prompt: Optional task instructions placed before the request
+
+    Returns:
+        List of text parts, ready to pass to generate_content/send_message
+    """
+    blocks = _LANGUAGE_BLOCKS.get(language) or _LANGUAGE_BLOCKS[DEFAULT_LANGUAGE]
+    identity = is_identity_question(prompt)
+
+    if system_prompt:
+        return [system_prompt, blocks['identity_system' if identity else 'system'], prompt]
+    return [blocks['identity_prefix' if identity else 'prefix'], prompt, blocks['suffix']]
+
+
+def append_user_part(messages: List[Dict[str, Any]], text: str) -> None:
+    """Add text to the last user turn as a new part, or start a new user turn."""
+    if messages and messages[-1]["role"] == "user":
+        messages[-1]["parts"].append({"text": "\n\n" + text})
+    else:
+        messages.append({"role": "user", "parts": [{"text": text}]})
+
+
+def format_context_messages(context: MCPContext) -> List[Dict[str, Any]]:
+    """
+    Format an MCP context as Gemini-style chat messages.
+
+    Args:
+        context: The MCP context
+
+    Returns:
+        List of {"role", "parts"} messages
+    """
+    # One pass over the elements instead of one filter per type
+    system_instructions = []
+    documents = []
+    memory_data = []
+    for element in context.elements:
+        if element.type == ContextType.SYSTEM_INSTRUCTION:
+            system_instructions.append(element.content)
+        elif element.type == ContextType.DOCUMENT:
+            documents.append(element.content)
+        elif element.type == ContextType.USER_MEMORY:
+            memory_data.append(element.content)
+
+    messages = []
+    if system_instructions:
+        messages.append({
+            "role": "user",
+            "parts": [{"text": SYSTEM_INSTRUCTIONS_HEADER + "\n".join(system_instructions)}]
+        })
+        # Model turn acknowledging the system instructions
+        messages.append({"role": "model", "parts": [{"text": SYSTEM_ACKNOWLEDGEMENT}]})
+
+    for message in context.conversation_history:
+        messages.append({
+            "role": "user" if message.role == "user" else "model",
+            "parts": [{"text": message.content}]
+        })
+
+    if documents and messages:
+        if len(documents) == 1:
+            append_user_part(messages, DOCUMENT_HEADER + documents[0])
+        else:
+            append_user_part(messages, DOCUMENT_HEADER + "\n\n" + "\n\n".join(documents))
+
+    if memory_data and messages:
+        append_user_part(messages, USER_MEMORY_HEADER + json.dumps(memory_data[0]))
+
+    return messages
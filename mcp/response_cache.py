@@ -0,0 +1,329 @@
+"""
+Response cache for model calls.
+
+Responses are keyed by a hash of the normalized message list together with
+the model name and generation config, so a request is answered from the cache
+only when the model would have seen the same input. Entries live in an
+in-memory LRU and, when RESPONSE_CACHE_DB is set, in a SQLite file shared by
+all worker processes.
+
+With RESPONSE_CACHE_APPROXIMATE enabled, a request whose context matches a
+cached one exactly and whose final user text is nearly the same (estimated
+Jaccard similarity of word shingles, via MinHash) also gets the cached
+response. The approximate index is kept in memory only.
+
+Hits report zero billable tokens in their usage metrics; the tokens the
+original call used are kept under "cached_total_tokens".
+"""
+
+import os
+import re
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Any, Dict, List, Optional
+
+from request_logging import get_logger
+
+# Set to "false" to send every request to the model
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() != "false"
+
+# Responses kept in the in-memory tier
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+
+# Seconds a cached response may be served
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(24 * 60 * 60)))
+
+# Path of the SQLite tier; empty keeps the cache in memory only
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB", "")
+
+# Rows kept in the SQLite tier
+RESPONSE_CACHE_DB_MAX_ROWS = int(os.getenv("RESPONSE_CACHE_DB_MAX_ROWS", "20000"))
+
+# Set to "true" to also serve responses for near-identical final user turns
+RESPONSE_CACHE_APPROXIMATE = os.getenv("RESPONSE_CACHE_APPROXIMATE", "false").lower() == "true"
+
+# Estimated Jaccard similarity an approximate match needs
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.9"))
+
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+_ROWS_PER_BAND = MINHASH_PERMUTATIONS // MINHASH_BANDS
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed seed: signatures must agree across processes and restarts
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(MINHASH_PERMUTATIONS)]
+
+_WHITESPACE = re.compile(r'\s+')
+_WORD = re.compile(r'\w+')
+
+log = get_logger("response_cache")
+
+CacheKeys = namedtuple("CacheKeys", ["exact", "context", "final_text"])
+CachedResponse = namedtuple("CachedResponse", ["text", "usage_metrics", "match"])
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(' ', str(text)).strip()
+
+
+def _digest(value: Any) -> str:
+    raw = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def make_cache_keys(model_name: str, messages: List[Dict[str, Any]], config: Any = None) -> CacheKeys:
+    """
+    Build the cache keys for a model call.
+
+    Args:
+        model_name: Model the messages are sent to
+        messages: Gemini-style {"role", "parts"} messages
+        config: Generation config, anything JSON-serializable (or str()-able)
+
+    Returns:
+        CacheKeys: exact key, key of everything but the final user text, and that text
+    """
+    normalized = [
+        [message["role"], [_normalize(part.get("text", "")) for part in message["parts"]]]
+        for message in messages
+    ]
+    final_text = ""
+    context = normalized
+    if normalized and normalized[-1][0] == "user" and normalized[-1][1]:
+        final_text = normalized[-1][1][-1]
+        context = normalized[:-1] + [["user", normalized[-1][1][:-1]]]
+
+    exact = _digest([model_name, config, normalized])
+    return CacheKeys(exact, _digest([model_name, config, context]), final_text)
+
+
+def minhash_signature(text: str) -> List[int]:
+    """MinHash signature over the word 3-shingles of a text (case-insensitive)."""
+    words = _WORD.findall(text.lower())
+    shingles = {' '.join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big')
+              for s in shingles]
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def estimate_similarity(signature_a: List[int], signature_b: List[int]) -> float:
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    matches = sum(1 for a, b in zip(signature_a, signature_b) if a == b)
+    return matches / MINHASH_PERMUTATIONS
+
+
+class _SQLiteTier:
+    """Responses stored in a SQLite file."""
+
+    def __init__(self, path: str, ttl: float, max_rows: int):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, usage TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT text, usage, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def put(self, key: str, text: str, usage_metrics: Dict[str, int], created_at: float) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, text, usage, created_at) VALUES (?, ?, ?, ?)",
+                (key, text, json.dumps(usage_metrics), created_at)
+            )
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._prune()
+            self._db.commit()
+
+    def _prune(self) -> None:
+        self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY created_at DESC LIMIT ?)", (self.max_rows,)
+        )
+
+
+class ResponseCache:
+    """Two-tier cache of model responses with optional approximate matching."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttl: float = RESPONSE_CACHE_TTL,
+                 db_path: Optional[str] = RESPONSE_CACHE_DB or None,
+                 approximate: bool = RESPONSE_CACHE_APPROXIMATE,
+                 similarity: float = RESPONSE_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.approximate = approximate
+        self.similarity = similarity
+        self._entries = OrderedDict()  # exact key -> (text, usage_metrics, created_at)
+        self._lock = threading.Lock()
+        self._disk = None
+        if db_path:
+            try:
+                self._disk = _SQLiteTier(db_path, ttl, RESPONSE_CACHE_DB_MAX_ROWS)
+            except sqlite3.Error as e:
+                print(f"[RESPONSE CACHE] SQLite tier disabled, could not open {db_path}: {e}")
+
+        # Approximate index: (context key, band, band values) -> exact keys,
+        # plus the signature of every indexed entry
+        self._bands = {}
+        self._signatures = {}
+
+    def get(self, keys: CacheKeys) -> Optional[CachedResponse]:
+        """Return the cached response for a call, or None on a miss."""
+        entry = self._get_exact(keys.exact)
+        if entry is not None:
+            log.debug("Exact hit %s", keys.exact[:12])
+            return self._hit(entry, "exact")
+
+        if self.approximate and keys.final_text:
+            exact_key = self._find_similar(keys)
+            if exact_key is not None:
+                entry = self._get_exact(exact_key)
+                if entry is not None:
+                    log.debug("Approximate hit %s for %s", exact_key[:12], keys.exact[:12])
+                    return self._hit(entry, "approximate")
+        return None
+
+    def put(self, keys: CacheKeys, text: str, usage_metrics: Dict[str, int]) -> None:
+        """Store a model response under the call's keys."""
+        if not text:
+            return
+        created_at = time.time()
+        self._remember(keys.exact, (text, dict(usage_metrics), created_at))
+        if self._disk is not None:
+            try:
+                self._disk.put(keys.exact, text, usage_metrics, created_at)
+            except sqlite3.Error as e:
+                print(f"[RESPONSE CACHE] Could not write entry {keys.exact[:12]}: {e}")
+        if self.approximate and keys.final_text:
+            self._index(keys)
+
+    def _hit(self, entry, match: str) -> CachedResponse:
+        text, usage_metrics, _ = entry
+        return CachedResponse(text, {
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0,
+            "cache_hit": 1,
+            "cached_total_tokens": usage_metrics.get("total_tokens", 0)
+        }, match)
+
+    def _get_exact(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[2] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    return entry
+                del self._entries[key]
+
+        if self._disk is not None:
+            try:
+                entry = self._disk.get(key)
+            except sqlite3.Error as e:
+                print(f"[RESPONSE CACHE] Could not read entry {key[:12]}: {e}")
+                entry = None
+            if entry is not None:
+                self._remember(key, entry)
+                return entry
+        return None
+
+    def _remember(self, key: str, entry) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._unindex(evicted)
+
+    def _band_keys(self, context_key: str, signature: List[int]):
+        for band in range(MINHASH_BANDS):
+            start = band * _ROWS_PER_BAND
+            yield (context_key, band, tuple(signature[start:start + _ROWS_PER_BAND]))
+
+    def _index(self, keys: CacheKeys) -> None:
+        signature = minhash_signature(keys.final_text)
+        band_keys = list(self._band_keys(keys.context, signature))
+        with self._lock:
+            if keys.exact not in self._entries:
+                return
+            self._signatures[keys.exact] = (signature, band_keys)
+            for band_key in band_keys:
+                self._bands.setdefault(band_key, set()).add(keys.exact)
+
+    def _unindex(self, exact_key: str) -> None:
+        # Called with the lock held
+        indexed = self._signatures.pop(exact_key, None)
+        if indexed is None:
+            return
+        for band_key in indexed[1]:
+            bucket = self._bands.get(band_key)
+            if bucket is not None:
+                bucket.discard(exact_key)
+                if not bucket:
+                    del self._bands[band_key]
+
+    def _find_similar(self, keys: CacheKeys) -> Optional[str]:
+        signature = minhash_signature(keys.final_text)
+        best_key, best_score = None, self.similarity
+        with self._lock:
+            candidates = set()
+            for band_key in self._band_keys(keys.context, signature):
+                candidates.update(self._bands.get(band_key, ()))
+            for candidate in candidates:
+                score = estimate_similarity(signature, self._signatures[candidate][0])
+                if score >= best_score:
+                    best_key, best_score = candidate, score
+        return best_key
+
+    def clear(self) -> None:
+        """Drop the in-memory tier and approximate index."""
+        with self._lock:
+            self._entries.clear()
+            self._bands.clear()
+            self._signatures.clear()
+
+
+# Process-wide cache instance
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Get the process-wide response cache, or None when caching is disabled."""
+    global _CACHE
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = ResponseCache()
+    return _CACHE
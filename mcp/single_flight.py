@@ -0,0 +1,84 @@
+"""
+Single-flight de-duplication of identical in-flight model calls.
+
+A double-click or a frontend retry issues the same call again while the first
+one is still running. Concurrent calls with the same key share one in-flight
+task: the first caller starts it, later callers wait for its result instead of
+paying for a second generation. The shared task is shielded, so a caller that
+disconnects doesn't cancel the call for the others.
+
+Keys are only held while a call is in flight; completed results are the
+response cache's business.
+"""
+
+import json
+import asyncio
+import hashlib
+import weakref
+from typing import Any, Awaitable, Callable, Tuple
+
+from request_metrics import increment
+
+
+def make_flight_key(*values: Any) -> str:
+    """Hash arbitrary JSON-like values (message lists, model names) into a flight key."""
+    raw = json.dumps(values, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """Shares one in-flight task between concurrent calls with the same key."""
+
+    def __init__(self):
+        self._flights = {}
+
+    def _forget(self, key, task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run factory() unless a call with the same key is already running.
+
+        Args:
+            key: Identity of the call, e.g. from make_flight_key
+            factory: Zero-argument function returning the awaitable to run
+
+        Returns:
+            tuple: (result, shared) where shared is True if another caller's call was joined
+        """
+        task = self._flights.get(key)
+        shared = task is not None
+        if shared:
+            increment("model_calls_coalesced_total")
+        else:
+            task = asyncio.ensure_future(factory())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task), shared
+
+
+# One registry per event loop; tasks can't be awaited from another loop
+_registries = weakref.WeakKeyDictionary()
+
+def get_single_flight() -> SingleFlight:
+    """Get the single-flight registry for the running event loop."""
+    loop = asyncio.get_running_loop()
+    registry = _registries.get(loop)
+    if registry is None:
+        registry = _registries[loop] = SingleFlight()
+    return registry
+
+
+def shared_usage(usage_metrics: dict) -> dict:
+    """Usage metrics for a caller that joined another caller's call: nothing to bill."""
+    return {
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "coalesced": 1,
+        "shared_total_tokens": (usage_metrics or {}).get("total_tokens", 0)
+    }
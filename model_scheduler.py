@@ -0,0 +1,385 @@
+"""
+Scheduler for outbound model calls.
+
+Every Gemini call in the worker goes through one scheduler on the shared event
+loop, which
+
+- bounds the number of calls in flight (MODEL_CALL_CONCURRENCY),
+- applies per-model token-bucket limits on requests and tokens per minute,
+- hands free slots to waiting calls by priority, so interactive chat goes
+  ahead of batch work (proofreading chunks, agents) and background jobs,
+- retries rate-limit and server errors with exponential backoff and full
+  jitter, pausing the model for the backoff period so queued calls don't
+  run into the same limit, and
+- sheds load when the queue is full or a call has waited too long, dropping
+  the lowest-priority work first with ModelOverloaded.
+
+Queue depth and in-flight calls are exported as gauges on /metrics, retries
+and shed calls as counters.
+
+Usage:
+    response = await call_model(lambda: model.generate_content_async(prompt),
+                                model="gemini-2.0-flash", tokens=len(prompt) // 4)
+
+    with model_priority(PRIORITY_BACKGROUND):
+        ...  # calls made here wait behind interactive ones
+"""
+
+import os
+import json
+import time
+import random
+import bisect
+import asyncio
+import weakref
+import itertools
+import contextlib
+import contextvars
+
+from async_runtime import run_async
+from request_metrics import observe, span, set_gauge, increment
+
+# Maximum number of concurrent outbound model calls per worker process
+MODEL_CALL_CONCURRENCY = int(os.getenv("MODEL_CALL_CONCURRENCY", "8"))
+
+# Default per-model limits for each worker process (0 = unlimited)
+MODEL_RATE_LIMIT_RPM = int(os.getenv("MODEL_RATE_LIMIT_RPM", "0"))
+MODEL_RATE_LIMIT_TPM = int(os.getenv("MODEL_RATE_LIMIT_TPM", "0"))
+
+# Per-model overrides, e.g. {"gemini-2.0-flash": {"rpm": 1000, "tpm": 1000000}}
+MODEL_RATE_LIMITS = json.loads(os.getenv("MODEL_RATE_LIMITS", "") or "{}")
+
+# Retries after a rate-limit (429) or server (5xx) error
+MODEL_CALL_RETRIES = int(os.getenv("MODEL_CALL_RETRIES", "3"))
+
+# Backoff before retry n is uniform in [0, min(max, base * 2**n)] seconds
+MODEL_RETRY_BASE_DELAY = float(os.getenv("MODEL_RETRY_BASE_DELAY", "0.5"))
+MODEL_RETRY_MAX_DELAY = float(os.getenv("MODEL_RETRY_MAX_DELAY", "8"))
+
+# Calls allowed to wait for a slot; beyond this the lowest-priority waiter is shed
+MODEL_QUEUE_MAX_DEPTH = int(os.getenv("MODEL_QUEUE_MAX_DEPTH", "64"))
+
+# Seconds a call may wait for a slot before it is shed
+MODEL_QUEUE_TIMEOUT = float(os.getenv("MODEL_QUEUE_TIMEOUT", "30"))
+MODEL_BACKGROUND_QUEUE_TIMEOUT = float(os.getenv("MODEL_BACKGROUND_QUEUE_TIMEOUT", "300"))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch", PRIORITY_BACKGROUND: "background"}
+
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+_RETRYABLE_MESSAGES = ("429", "quota", "rate limit", "resource exhausted", "503", "unavailable",
+                       "500 internal", "deadline exceeded")
+
+_priority = contextvars.ContextVar("model_call_priority", default=PRIORITY_INTERACTIVE)
+
+
+class ModelOverloaded(RuntimeError):
+    """A model call was shed because the scheduler is saturated."""
+
+
+@contextlib.contextmanager
+def model_priority(priority):
+    """Run model calls made in this block (and tasks started from it) at a priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def normalize_model_name(model):
+    """Strip the "models/" prefix the API sometimes adds, so limits match either form."""
+    model = str(model or "gemini")
+    return model[len("models/"):] if model.startswith("models/") else model
+
+
+def estimate_tokens(content):
+    """Cheap token estimate for rate limiting (4 characters per token)."""
+    if isinstance(content, str):
+        return len(content) // 4
+    if isinstance(content, dict):
+        return sum(estimate_tokens(part.get("text", "")) for part in content.get("parts", []))
+    if isinstance(content, (list, tuple)):
+        return sum(estimate_tokens(item) for item in content)
+    return 0
+
+
+def is_retryable(error):
+    """Check whether an error is a rate-limit or transient server error."""
+    if isinstance(error, ModelOverloaded):
+        return False
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    message = str(error).lower()
+    return any(marker in message for marker in _RETRYABLE_MESSAGES)
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    return random.uniform(0, min(MODEL_RETRY_MAX_DELAY, MODEL_RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+class TokenBucket:
+    """Token bucket holding up to one minute's worth of a per-minute rate."""
+
+    __slots__ = ("capacity", "tokens", "rate", "updated")
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount tokens are available (amounts above capacity wait for a full bucket)."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def consume(self, amount, now):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "model", "tokens", "future")
+
+    def __init__(self, priority, seq, model, tokens, future):
+        self.priority = priority
+        self.seq = seq
+        self.model = model
+        self.tokens = tokens
+        self.future = future
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class ModelScheduler:
+    """Priority scheduler for model calls on one event loop."""
+
+    def __init__(self, concurrency=MODEL_CALL_CONCURRENCY, max_queue=MODEL_QUEUE_MAX_DEPTH,
+                 rate_limits=None, default_rpm=MODEL_RATE_LIMIT_RPM, default_tpm=MODEL_RATE_LIMIT_TPM):
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.rate_limits = MODEL_RATE_LIMITS if rate_limits is None else rate_limits
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.active = 0
+        self._queue = []  # waiters sorted by (priority, seq)
+        self._seq = itertools.count()
+        self._buckets = {}  # model -> (requests bucket or None, tokens bucket or None)
+        self._paused_until = {}  # model -> monotonic time after a rate-limit error
+        self._wakeup = None
+
+    # ----- rate limits -----
+
+    def _buckets_for(self, model):
+        buckets = self._buckets.get(model)
+        if buckets is None:
+            limits = self.rate_limits.get(model, {})
+            rpm = limits.get("rpm", self.default_rpm)
+            tpm = limits.get("tpm", self.default_tpm)
+            buckets = self._buckets[model] = (TokenBucket(rpm) if rpm else None,
+                                              TokenBucket(tpm) if tpm else None)
+        return buckets
+
+    def _wait_time(self, model, tokens, now):
+        wait = max(0.0, self._paused_until.get(model, 0.0) - now)
+        requests, token_bucket = self._buckets_for(model)
+        if requests is not None:
+            wait = max(wait, requests.wait_time(1, now))
+        if token_bucket is not None and tokens:
+            wait = max(wait, token_bucket.wait_time(tokens, now))
+        return wait
+
+    def pause(self, model, seconds):
+        """Hold back calls to a model, e.g. after it answered 429."""
+        model = normalize_model_name(model)
+        self._paused_until[model] = max(self._paused_until.get(model, 0.0), time.monotonic() + seconds)
+
+    # ----- slots -----
+
+    def _start(self, model, tokens, now):
+        self.active += 1
+        requests, token_bucket = self._buckets_for(model)
+        if requests is not None:
+            requests.consume(1, now)
+        if token_bucket is not None and tokens:
+            token_bucket.consume(tokens, now)
+
+    @staticmethod
+    def _overloaded(priority, reason):
+        increment("model_calls_shed_total", priority=PRIORITY_NAMES.get(priority, priority))
+        return ModelOverloaded(f"The AI service is busy right now ({reason}). Please try again in a moment.")
+
+    def _shed(self, waiter, reason):
+        error = self._overloaded(waiter.priority, reason)
+        if not waiter.future.done():
+            waiter.future.set_exception(error)
+
+    async def acquire(self, model, priority=None, tokens=0):
+        """Wait for a slot (and rate-limit budget) to call a model."""
+        model = normalize_model_name(model)
+        priority = _priority.get() if priority is None else priority
+        now = time.monotonic()
+        if not self._queue and self.active < self.concurrency and self._wait_time(model, tokens, now) == 0:
+            self._start(model, tokens, now)
+            self._update_gauges()
+            return
+
+        if len(self._queue) >= self.max_queue:
+            lowest = self._queue[-1]
+            if lowest.priority <= priority:
+                raise self._overloaded(priority, "queue full")
+            self._queue.pop()
+            self._shed(lowest, "queue full")
+        waiter = _Waiter(priority, next(self._seq), model, tokens, asyncio.get_running_loop().create_future())
+        bisect.insort(self._queue, waiter)
+        self._dispatch()
+
+        timeout = MODEL_BACKGROUND_QUEUE_TIMEOUT if priority >= PRIORITY_BACKGROUND else MODEL_QUEUE_TIMEOUT
+        try:
+            await asyncio.wait_for(waiter.future, timeout or None)
+        except asyncio.TimeoutError:
+            self._remove(waiter)
+            raise self._overloaded(priority, "waited too long")
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # The slot was granted just as we were cancelled
+                self.release()
+            else:
+                self._remove(waiter)
+            raise
+
+    def release(self):
+        """Give back a slot taken by acquire()."""
+        self.active -= 1
+        self._dispatch()
+
+    def _remove(self, waiter):
+        try:
+            self._queue.remove(waiter)
+        except ValueError:
+            pass
+        self._update_gauges()
+
+    def _dispatch(self):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+
+        now = time.monotonic()
+        delay = None
+        blocked = set()
+        i = 0
+        while i < len(self._queue) and self.active < self.concurrency:
+            waiter = self._queue[i]
+            if waiter.future.done():
+                self._queue.pop(i)
+                continue
+            if waiter.model in blocked:
+                # Later waiters for a blocked model must not take its budget first
+                i += 1
+                continue
+            wait = self._wait_time(waiter.model, waiter.tokens, now)
+            if wait > 0:
+                delay = wait if delay is None else min(delay, wait)
+                blocked.add(waiter.model)
+                i += 1
+                continue
+            self._queue.pop(i)
+            self._start(waiter.model, waiter.tokens, now)
+            waiter.future.set_result(None)
+
+        if delay is not None and self.active < self.concurrency:
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+        self._update_gauges()
+
+    def _update_gauges(self):
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for waiter in self._queue:
+            name = PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))
+            depth[name] = depth.get(name, 0) + 1
+        for name, count in depth.items():
+            set_gauge("model_queue_depth", count, priority=name)
+        set_gauge("model_calls_in_flight", self.active)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, model, priority=None, tokens=0):
+        """Hold a call slot for the duration of the block (e.g. a whole stream)."""
+        waited = time.perf_counter()
+        await self.acquire(model, priority, tokens)
+        observe("gemini.queue", time.perf_counter() - waited)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def retry_backoff(self, model, attempt, error):
+        """Count a retry, pause the model if it was rate limited and sleep the backoff."""
+        delay = backoff_delay(attempt)
+        increment("model_call_retries_total", model=normalize_model_name(model))
+        print(f"[MODEL SCHEDULER] Retry {attempt + 1} for {model} in {delay:.2f}s after: {error}")
+        if getattr(error, "code", None) == 429 or "429" in str(error) or "quota" in str(error).lower():
+            self.pause(model, delay)
+        await asyncio.sleep(delay)
+
+    async def call(self, call, model, priority=None, tokens=0, retries=MODEL_CALL_RETRIES):
+        """
+        Run a model call through the scheduler, retrying transient errors.
+
+        Args:
+            call: Zero-argument function returning an awaitable; called again on each retry
+            model: Model name the rate limits apply to
+            priority: PRIORITY_*; defaults to the current model_priority()
+            tokens: Estimated tokens for the tokens-per-minute limit
+            retries: Retries after rate-limit or server errors
+
+        Returns:
+            Whatever the call's awaitable returns
+        """
+        for attempt in itertools.count():
+            async with self.slot(model, priority, tokens):
+                try:
+                    with span("gemini"):
+                        return await call()
+                except Exception as e:
+                    if attempt >= retries or not is_retryable(e):
+                        raise
+                    error = e
+            await self.retry_backoff(model, attempt, error)
+
+
+# One scheduler per event loop; asyncio futures can't be shared across loops
+_schedulers = weakref.WeakKeyDictionary()
+
+def get_model_scheduler():
+    """Get the scheduler for the running event loop."""
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _schedulers[loop] = ModelScheduler()
+    return scheduler
+
+
+async def call_model(call, model="gemini", priority=None, tokens=0, retries=MODEL_CALL_RETRIES):
+    """Run a model call through the running loop's scheduler; see ModelScheduler.call."""
+    return await get_model_scheduler().call(call, model, priority, tokens, retries)
+
+
+def model_slot(model="gemini", priority=None, tokens=0):
+    """Async context manager holding a model call slot; see ModelScheduler.slot."""
+    return get_model_scheduler().slot(model, priority, tokens)
+
+
+def call_model_sync(call, model="gemini", priority=None, tokens=0, retries=MODEL_CALL_RETRIES):
+    """Run a model call through the shared loop's scheduler from sync code."""
+    return run_async(call_model(call, model, priority, tokens, retries))
@@ -6,6 +6,7 @@ It handles extraction of text from different file types, content analysis, and P
 """
 
 import os
+import asyncio
 import uuid
 import tempfile
 from pathlib import Path
@@ -17,6 +18,8 @@ import docx
 import pdfplumber
 import fitz  # PyMuPDF
 
+from extraction_cache import cached_extractor, UncachedText
+
 # Presentation creation library
 from pptx import Presentation
 from pptx.util import Inches, Pt
@@ -30,7 +33,11 @@ MAX_BULLET_POINTS_PER_SLIDE = 5
 MIN_WORDS_FOR_BULLET = 3
 MAX_WORDS_FOR_TITLE = 8
 
+# Bump when extract_text_from_file's output changes to invalidate cached extractions
+EXTRACTOR_VERSION = "2"
+
 
+@cached_extractor("presentation_builder", EXTRACTOR_VERSION, key_args=("file_type",))
 def extract_text_from_file(file_path, file_type=None):
     """
     Extract text content from a file based on its type.
@@ -66,7 +73,7 @@ def extract_text_from_file(file_path, file_type=None):
                     return f.read()
             except Exception as e:
                 print(f"Error reading txt file: {str(e)}")
-                return "Error extracting text from file."
+                return UncachedText("Error extracting text from file.")
     
     elif file_type == 'docx':
         try:
@@ -74,7 +81,7 @@ def extract_text_from_file(file_path, file_type=None):
             return '\n'.join([paragraph.text for paragraph in doc.paragraphs if paragraph and paragraph.text])
         except Exception as e:
             print(f"Error extracting text from docx: {str(e)}")
-            return "Error extracting text from DOCX file."
+            return UncachedText("Error extracting text from DOCX file.")
     
     elif file_type == 'pdf':
         # Try with pdfplumber first
@@ -122,11 +129,11 @@ def extract_text_from_file(file_path, file_type=None):
                 
                 extracted_text = '\n'.join(text)
                 if not extracted_text or len(extracted_text.strip()) < 10:
-                    return "Could not extract meaningful text from the PDF file."
+                    return UncachedText("Could not extract meaningful text from the PDF file.")
                 return extracted_text
             except Exception as mupdf_err:
                 print(f"PyMuPDF extraction failed: {str(mupdf_err)}")
-                return "Error extracting text from PDF file."
+                return UncachedText("Error extracting text from PDF file.")
     
     else:
         raise ValueError(f"Unsupported file type: {file_type}")
@@ -1706,6 +1713,34 @@ def generate_presentation_from_text(text, model=None, title=None, tone="professi
         return presentation_path, presentation_filename
 
 
+async def _generate_content_batch(model, prompts):
+    """
+    Call a GenAI model's generate_content for each prompt concurrently.
+
+    Calls run in threads and queue on the shared model-call scheduler like
+    MCPModelAdapter.generate_batch.
+
+    Args:
+        model: GenAI model with a generate_content method
+        prompts (list): Prompts to send
+
+    Returns:
+        list: One MCPModelResponse per prompt, in prompt order; failed items have ``error`` set
+    """
+    from mcp.model_adapter import MCPModelResponse
+    from model_scheduler import call_model, PRIORITY_BATCH
+
+    async def generate_item(prompt):
+        try:
+            response = await call_model(lambda: asyncio.to_thread(model.generate_content, prompt),
+                                        priority=PRIORITY_BATCH)
+            return MCPModelResponse(text=getattr(response, 'text', '') or '', usage_metrics={})
+        except Exception as e:
+            return MCPModelResponse(text="", usage_metrics={}, error=e)
+
+    return list(await asyncio.gather(*(generate_item(prompt) for prompt in prompts)))
+
+
 def enhance_slide_content_with_ai(slides, model=None):
     """
     Enhance slide content with AI-generated content when available
@@ -1713,7 +1748,8 @@ def enhance_slide_content_with_ai(slides, model=None):
     
     Args:
         slides (list): List of slide data dictionaries
-        model: Optional GenAI model to use for enhancement
+        model: Optional GenAI model or MCP adapter that writes the new bullet points;
+            enhancement is skipped without one
         
     Returns:
         list: Enhanced slides list
@@ -1722,6 +1758,13 @@ def enhance_slide_content_with_ai(slides, model=None):
         return slides
         
     try:
+        from mcp.model_adapter import MCPModelAdapter
+        from mcp.context import MCPContextFactory
+        from async_runtime import run_async
+        from model_scheduler import PRIORITY_BATCH
+
+        pending = []
+        prompts = []
         for i, slide in enumerate(slides):
             title = slide.get('title', '')
             points = slide.get('points', [])
@@ -1740,7 +1783,8 @@ def enhance_slide_content_with_ai(slides, model=None):
                 continue
                 
             # If we found placeholder content, generate real content with AI
-            prompt = f"""
+            pending.append(i)
+            prompts.append(f"""
             Generate 4 specific, factual bullet points about the topic: "{title}"
             
             Rules:
@@ -1755,20 +1799,30 @@ def enhance_slide_content_with_ai(slides, model=None):
             Oceans absorb 30% of CO2 emissions, causing 26% increase in acidity.
             Over 1 million species face extinction within decades from habitat loss.
             Extreme weather events have increased 46% since 2000.
-            """
-            
-            try:
-                response = model.generate_content(prompt)
-                if response and hasattr(response, 'text') and response.text:
-                    # Get the generated bullet points
-                    new_points = [p.strip() for p in response.text.strip().split('\n') if p.strip()]
-                    
-                    # Update slide with new content if we got good results
-                    if len(new_points) >= 3:
-                        slide['points'] = new_points
-                    print(f"Successfully enhanced slide {i+1}: {title}")
-            except Exception as e:
-                print(f"Error enhancing slide {i+1}: {str(e)}")
+            """)
+        
+        if not prompts:
+            return slides
+        
+        # All placeholder slides are generated in one concurrent batch
+        if isinstance(model, MCPModelAdapter):
+            responses = run_async(model.generate_batch(prompts, MCPContextFactory.create(), priority=PRIORITY_BATCH))
+        else:
+            responses = run_async(_generate_content_batch(model, prompts))
+        
+        for i, response in zip(pending, responses):
+            title = slides[i].get('title', '')
+            if response.error is not None:
+                print(f"Error enhancing slide {i+1}: {str(response.error)}")
+                continue
+            if response.text:
+                # Get the generated bullet points
+                new_points = [p.strip() for p in response.text.strip().split('\n') if p.strip()]
+                
+                # Update slide with new content if we got good results
+                if len(new_points) >= 3:
+                    slides[i]['points'] = new_points
+                print(f"Successfully enhanced slide {i+1}: {title}")
                     
         return slides
     except Exception as e:
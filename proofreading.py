@@ -0,0 +1,334 @@
+"""
+Map-reduce proofreading for documents of any length.
+
+The text is split into chunks on paragraph and sentence boundaries, each chunk
+carrying a little overlap from the previous one for context. Chunks are
+proofread concurrently through the MCP model adapter and the per-chunk
+corrections are merged into one result whose offsets point into the original
+text.
+"""
+
+import os
+import re
+import json
+import bisect
+import asyncio
+from dataclasses import dataclass
+from typing import List
+
+from model_scheduler import PRIORITY_BATCH
+
+# Characters of new text per chunk (the overlap comes on top of this)
+PROOFREAD_CHUNK_CHARS = int(os.getenv("PROOFREAD_CHUNK_CHARS", "4000"))
+
+# Characters of preceding text repeated at the start of each chunk for context
+PROOFREAD_CHUNK_OVERLAP = int(os.getenv("PROOFREAD_CHUNK_OVERLAP", "200"))
+
+# Chunks of one document proofread at the same time
+PROOFREAD_CONCURRENCY = int(os.getenv("PROOFREAD_CONCURRENCY", "4"))
+
+# Safety cap on the amount of text proofread per request
+PROOFREAD_MAX_CHARS = int(os.getenv("PROOFREAD_MAX_CHARS", "200000"))
+
+PROOFREAD_INSTRUCTION = """
+            You are a professional proofreader and editor. Please carefully proofread the following text and identify ANY errors or improvements.
+            Look for:
+            - Spelling errors
+            - Grammar mistakes
+            - Punctuation issues
+            - Awkward phrasing
+            - Run-on sentences
+            - Inconsistencies
+
+            The text may be one section of a longer document and can start or end mid-thought.
+            Quote each "original" exactly as it appears in the text.
+
+            Format your response as a JSON with the following structure:
+            {
+                "corrected_text": "The full corrected text with all errors fixed",
+                "corrections": [
+                    {
+                        "original": "original text with error",
+                        "corrected": "corrected text",
+                        "explanation": "detailed explanation of why this needed correction"
+                    }
+                ]
+            }
+
+            If there are truly no errors at all (which is rare), return an empty list for "corrections".
+            """
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+_SENTENCE_END = re.compile(r'(?<=[.!?])["\')\]]*\s+')
+
+
+@dataclass
+class TextChunk:
+    """A slice of the source text; [core_start, end) is new text, [start, core_start) is overlap."""
+    index: int
+    start: int
+    core_start: int
+    end: int
+    text: str
+
+
+def _last_boundary(bounds, lo, hi):
+    """Largest boundary b with lo < b <= hi, or None."""
+    i = bisect.bisect_right(bounds, hi)
+    if i and bounds[i - 1] > lo:
+        return bounds[i - 1]
+    return None
+
+
+def _first_boundary(bounds, lo, hi):
+    """Smallest boundary b with lo <= b < hi, or None."""
+    i = bisect.bisect_left(bounds, lo)
+    if i < len(bounds) and bounds[i] < hi:
+        return bounds[i]
+    return None
+
+
+def chunk_text(text, max_chars=PROOFREAD_CHUNK_CHARS, overlap=PROOFREAD_CHUNK_OVERLAP) -> List[TextChunk]:
+    """
+    Split text into chunks, preferring paragraph and then sentence boundaries.
+
+    Args:
+        text (str): Text to split
+        max_chars (int): Maximum characters of new text per chunk
+        overlap (int): Maximum characters repeated from the previous chunk
+
+    Returns:
+        list[TextChunk]: Chunks in document order; their cores cover the text exactly once
+    """
+    if len(text) <= max_chars:
+        return [TextChunk(0, 0, 0, len(text), text)]
+
+    paragraphs = sorted({m.end() for m in _PARAGRAPH_BREAK.finditer(text)})
+    sentences = sorted({m.end() for m in _SENTENCE_END.finditer(text)})
+
+    chunks = []
+    core_start = 0
+    while core_start < len(text):
+        limit = core_start + max_chars
+        if limit >= len(text):
+            end = len(text)
+        else:
+            end = (_last_boundary(paragraphs, core_start + max_chars // 2, limit)
+                   or _last_boundary(sentences, core_start, limit))
+            if end is None:
+                # No sentence ends in range: cut at the last whitespace, or hard cut
+                space = max(text.rfind(' ', core_start + 1, limit), text.rfind('\n', core_start + 1, limit))
+                end = space + 1 if space > core_start else limit
+
+        start = core_start
+        if core_start > 0 and overlap > 0:
+            start = _first_boundary(sentences, core_start - overlap, core_start)
+            if start is None:
+                start = max(0, core_start - overlap)
+
+        chunks.append(TextChunk(len(chunks), start, core_start, end, text[start:end]))
+        core_start = end
+    return chunks
+
+
+def parse_proofread_response(response, text):
+    """
+    Parse a proofreading response into corrected_text and corrections.
+
+    Args:
+        response (str): Raw model output, ideally JSON
+        text (str): Text that was proofread, used as the fallback corrected text
+
+    Returns:
+        dict: {'corrected_text': str, 'corrections': list}
+    """
+    json_start = response.find('{')
+    json_end = (response.rfind('}') + 1)
+    if ((json_start >= 0) and (json_end > json_start)):
+        try:
+            result = json.loads(response[json_start:json_end])
+            corrections = result.get('corrections') or []
+            return {
+                'corrected_text': result.get('corrected_text') or text,
+                'corrections': [c for c in corrections if isinstance(c, dict)]
+            }
+        except (ValueError, AttributeError) as e:
+            print(f"Error parsing JSON from AI response: {e}")
+
+    # Fall back to parsing "original:/corrected:/explanation:" lines
+    corrections = []
+    lines = response.split('\n')
+    for i, line in enumerate(lines):
+        if (("original:" in line.lower()) and ((i + 1) < len(lines)) and ("corrected:" in lines[(i + 1)].lower())):
+            explanation = ""
+            if (((i + 2) < len(lines)) and ("explanation:" in lines[(i + 2)].lower())):
+                explanation = lines[(i + 2)].split(":", 1)[1].strip()
+            corrections.append({
+                "original": line.split(":", 1)[1].strip(),
+                "corrected": lines[(i + 1)].split(":", 1)[1].strip(),
+                "explanation": explanation
+            })
+    return {'corrected_text': text, 'corrections': corrections}
+
+
+def merge_chunk_results(text, chunks, results):
+    """
+    Merge per-chunk proofreading results into a single result.
+
+    Each correction is located in its chunk and given an 'offset' into the
+    original text ('offset' is None when the quoted original can't be found).
+    Corrections found twice because of the overlap are kept once. With more
+    than one chunk the corrected text is rebuilt by applying the located
+    corrections to the original text.
+
+    Args:
+        text (str): The full original text
+        chunks (list[TextChunk]): Chunks from chunk_text
+        results (list[dict | None]): Parsed result per chunk, None if the chunk failed
+
+    Returns:
+        dict: {'corrected_text': str, 'corrections': list}
+    """
+    located = {}
+    unlocated = []
+    seen_unlocated = set()
+
+    for chunk, result in zip(chunks, results):
+        if not result:
+            continue
+        cursor = 0
+        for correction in result['corrections']:
+            original = str(correction.get('original') or '')
+            index = chunk.text.find(original, cursor) if original else -1
+            if index < 0 and original:
+                index = chunk.text.find(original)
+            if index >= 0:
+                cursor = index + len(original)
+                offset = chunk.start + index
+                located.setdefault((offset, original), dict(correction, offset=offset, chunk=chunk.index))
+            else:
+                key = (original, correction.get('corrected'))
+                if key not in seen_unlocated:
+                    seen_unlocated.add(key)
+                    unlocated.append(dict(correction, offset=None, chunk=chunk.index))
+
+    corrections = sorted(located.values(), key=lambda c: c['offset'])
+
+    if len(chunks) == 1 and results[0]:
+        corrected_text = results[0]['corrected_text']
+    else:
+        pieces = []
+        position = 0
+        for correction in corrections:
+            if correction['offset'] < position:
+                # Overlaps an edit already applied
+                continue
+            pieces.append(text[position:correction['offset']])
+            pieces.append(str(correction.get('corrected', correction['original'])))
+            position = correction['offset'] + len(correction['original'])
+        pieces.append(text[position:])
+        corrected_text = ''.join(pieces)
+
+    return {'corrected_text': corrected_text, 'corrections': corrections + unlocated}
+
+
+async def proofread_with_mcp(text, user_id=None, session_id=None,
+                             max_chars=PROOFREAD_CHUNK_CHARS, overlap=PROOFREAD_CHUNK_OVERLAP,
+                             concurrency=PROOFREAD_CONCURRENCY):
+    """
+    Proofread a whole document through the MCP adapter, chunk by chunk.
+
+    Args:
+        text (str): Text to proofread
+        user_id (str, optional): User the request is made for
+        session_id (str, optional): Session ID for the MCP context
+        max_chars (int): Characters of new text per chunk
+        overlap (int): Characters of overlap between chunks
+        concurrency (int): Chunks proofread at the same time
+
+    Returns:
+        dict: corrected_text, corrections, tokens_used, chunks, truncated and
+            failed_chunks (1-based numbers of chunks left unproofread)
+
+    Raises:
+        RuntimeError: If no chunk could be proofread
+    """
+    from mcp.model_adapter import MCPModelFactory
+    from mcp.context import MCPContextFactory
+    from agents.utils import load_user_memory_into_mcp_context, extract_metrics_from_mcp_response
+
+    truncated = len(text) > PROOFREAD_MAX_CHARS
+    if truncated:
+        text = text[:PROOFREAD_MAX_CHARS]
+    chunks = chunk_text(text, max_chars, overlap)
+
+    # Shared part of the context is built once; each chunk adds its own text
+    base_context = MCPContextFactory.create("proofread")
+    if user_id:
+        base_context.set_user_id(user_id)
+        try:
+            await asyncio.to_thread(load_user_memory_into_mcp_context, base_context, user_id, session_id)
+        except Exception as e:
+            print(f"Warning: Failed to load user memory: {e}")
+    if session_id:
+        base_context.set_session_id(session_id)
+    base_context.add_system_instruction(PROOFREAD_INSTRUCTION)
+
+    model_adapter = MCPModelFactory.create(model_name="gemini")
+    contexts = []
+    for chunk in chunks:
+        context = MCPContextFactory.create()
+        context.user_id = base_context.user_id
+        context.session_id = base_context.session_id
+        context.elements = list(base_context.elements)
+        context.add_conversation_message("user", chunk.text)
+        contexts.append(context)
+
+    print(f"[PROOFREAD] Proofreading {len(text)} characters in {len(chunks)} chunk(s)")
+    # Multi-chunk documents queue behind interactive chat turns
+    responses = await model_adapter.generate_batch(
+        ["Please proofread this text"] * len(chunks), contexts,
+        concurrency=max(1, concurrency),
+        priority=PRIORITY_BATCH if len(chunks) > 1 else None
+    )
+
+    tokens_used = 0
+    results = []
+    failed_chunks = []
+    for chunk, response_obj in zip(chunks, responses):
+        if response_obj.error is not None:
+            print(f"[PROOFREAD] Chunk {chunk.index + 1}/{len(chunks)} failed: {response_obj.error}")
+            results.append(None)
+            failed_chunks.append(chunk.index + 1)
+            continue
+        tokens_used += extract_metrics_from_mcp_response(response_obj).get('total_tokens', 0)
+        results.append(parse_proofread_response(response_obj.text, chunk.text))
+
+    if len(failed_chunks) == len(chunks):
+        raise RuntimeError(f"Proofreading failed: {responses[0].error}")
+
+    merged = merge_chunk_results(text, chunks, results)
+    merged.update({'tokens_used': tokens_used, 'chunks': len(chunks), 'truncated': truncated,
+                   'failed_chunks': failed_chunks})
+    return merged
+
+
+def proofread_warning(result):
+    """
+    Describe what part of the text a proofread result does not cover.
+
+    Args:
+        result (dict): Result from proofread_with_mcp
+
+    Returns:
+        str | None: Message for the user, or None if the whole text was proofread
+    """
+    notes = []
+    if result.get('failed_chunks'):
+        notes.append(f"{len(result['failed_chunks'])} of {result['chunks']} parts of the text could not be "
+                     f"proofread and are left unchanged")
+    if result.get('truncated'):
+        notes.append(f"only the first {PROOFREAD_MAX_CHARS} characters were proofread")
+    if not notes:
+        return None
+    return "Proofreading is incomplete: " + "; ".join(notes) + "."
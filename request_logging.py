@@ -0,0 +1,233 @@
+"""
+Structured request logging.
+
+Replaces ad-hoc print() debugging on the request hot path with category
+loggers that share a few properties:
+
+- Every record carries the request's correlation ID (taken from the
+  X-Request-ID header or generated), which is also returned in the response.
+- Debug output is off by default and enabled per request, either by sampling
+  (LOG_DEBUG_SAMPLE_RATE) or for whole categories (LOG_DEBUG_CATEGORIES).
+  Disabled debug calls return before a log record is even created.
+- User content (messages, documents, session dumps) is wrapped with
+  user_content(), which formats at most LOG_MAX_CONTENT_BYTES of it unless
+  debug is enabled for the current request.
+- Output is one JSON object per line (LOG_FORMAT=json) or plain text.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import re
+import random
+import logging
+import reprlib
+import contextvars
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# "json" for log aggregation, "text" for local development
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+# Fraction of requests that get debug logging for every category
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0"))
+
+# Categories with debug logging on for every request, e.g. "session,upload"
+LOG_DEBUG_CATEGORIES = frozenset(
+    c.strip() for c in os.getenv("LOG_DEBUG_CATEGORIES", "").split(",") if c.strip()
+)
+
+# Largest amount of user content formatted into a record outside debug requests
+LOG_MAX_CONTENT_BYTES = int(os.getenv("LOG_MAX_CONTENT_BYTES", "256"))
+
+ROOT_LOGGER_NAME = "lightyear"
+
+# Incoming IDs are only accepted if they can't break a log line
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._\-]{1,64}$')
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_debug_sampled = contextvars.ContextVar("debug_sampled", default=False)
+
+
+def get_request_id():
+    """Return the current request's correlation ID, or None outside a request."""
+    return _request_id.get()
+
+
+def start_request(request_id=None, debug=None):
+    """
+    Mark the start of a request in the current context.
+
+    Args:
+        request_id (str, optional): Incoming correlation ID; generated if missing
+        debug (bool, optional): Force debug logging on or off; sampled if None
+
+    Returns:
+        str: The request ID in effect
+    """
+    if not request_id or not _REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    _request_id.set(request_id)
+    if debug is None:
+        debug = LOG_DEBUG_SAMPLE_RATE > 0 and random.random() < LOG_DEBUG_SAMPLE_RATE
+    _debug_sampled.set(bool(debug))
+    return request_id
+
+
+def debug_enabled(category=None):
+    """Check whether debug output is on for this request (and category)."""
+    return _debug_sampled.get() or (category is not None and category in LOG_DEBUG_CATEGORIES)
+
+
+class _ContentRepr(reprlib.Repr):
+    def __init__(self, max_chars):
+        super().__init__()
+        self.maxstring = max_chars
+        self.maxother = max_chars
+        self.maxdict = 20
+        self.maxlist = 20
+        self.maxlevel = 3
+
+
+class UserContent:
+    """Lazily formatted user content that is size-capped unless debugging."""
+
+    __slots__ = ("value", "category")
+
+    def __init__(self, value, category=None):
+        self.value = value
+        self.category = category
+
+    def __str__(self):
+        value = self.value
+        if debug_enabled(self.category):
+            return str(value)
+
+        limit = LOG_MAX_CONTENT_BYTES
+        if isinstance(value, str):
+            # Slice before encoding so only a bounded prefix is ever touched
+            head = value[:limit].encode("utf-8")[:limit].decode("utf-8", errors="ignore")
+            if len(head) < len(value):
+                return f"{head}...(+{len(value) - len(head)} chars)"
+            return head
+        # reprlib bounds nested containers and long strings without formatting them whole
+        text = _ContentRepr(limit).repr(value)
+        return text if len(text) <= limit else text[:limit] + "..."
+
+    __repr__ = __str__
+
+
+def user_content(value, category=None):
+    """Wrap user-provided content for logging; see UserContent."""
+    return UserContent(value, category)
+
+
+class CategoryLogger(logging.LoggerAdapter):
+    """Logger for one category whose debug output is gated per request."""
+
+    def __init__(self, category):
+        super().__init__(logging.getLogger(f"{ROOT_LOGGER_NAME}.{category}"), {})
+        self.category = category
+
+    def debug(self, msg, *args, **kwargs):
+        # Cheap gate first: no record is built for requests without debug.
+        # Sampled requests bypass LOG_LEVEL, which applies to everything else.
+        if debug_enabled(self.category):
+            msg, kwargs = self.process(msg, kwargs)
+            self.logger._log(logging.DEBUG, msg, args, **kwargs)
+
+    def debug_enabled(self):
+        return debug_enabled(self.category)
+
+    def process(self, msg, kwargs):
+        extra = kwargs.setdefault("extra", {})
+        extra.setdefault("category", self.category)
+        return msg, kwargs
+
+
+_loggers = {}
+
+def get_logger(category):
+    """Get the logger for a category, e.g. get_logger("session")."""
+    logger = _loggers.get(category)
+    if logger is None:
+        logger = _loggers.setdefault(category, CategoryLogger(category))
+    return logger
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the correlation ID to every record."""
+
+    def filter(self, record):
+        record.request_id = _request_id.get() or "-"
+        if not hasattr(record, "category"):
+            record.category = record.name.rsplit(".", 1)[-1]
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "category": getattr(record, "category", record.name),
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_configured = False
+
+def configure_logging(stream=None):
+    """Install the handler on the application's root logger (idempotent)."""
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("[%(levelname)s] [%(request_id)s] [%(category)s] %(message)s"))
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(handler)
+    root.propagate = False
+    _configured = True
+
+
+def init_request_logging(app):
+    """
+    Configure logging and register the per-request hooks on a Flask app.
+
+    Call this before other before_request handlers are registered so they
+    already see the request's correlation ID.
+    """
+    from flask import request, g
+
+    configure_logging()
+    log = get_logger("request")
+
+    @app.before_request
+    def _start_request_logging():
+        g.request_started = time.perf_counter()
+        g.request_id = start_request(request.headers.get("X-Request-ID"))
+
+    @app.after_request
+    def _finish_request_logging(response):
+        request_id = get_request_id()
+        if request_id:
+            response.headers["X-Request-ID"] = request_id
+        started = getattr(g, "request_started", None)
+        if started is not None and not request.path.startswith("/static/"):
+            log.info("%s %s -> %s in %.1f ms", request.method, request.path,
+                     response.status_code, (time.perf_counter() - started) * 1000)
+        return response
@@ -0,0 +1,213 @@
+"""
+In-process request phase timing.
+
+A span times one phase of work (a Firestore read, context building, a Gemini
+call) and records it in a histogram keyed by the current route and the phase
+name. The route comes from a context variable set at the start of each
+request, so helpers deep in the call stack - including coroutines on the
+shared event loop - are attributed to the request that triggered them.
+
+Histograms use fixed buckets and are exported in the Prometheus text format,
+together with a few process-wide gauges and counters (set_gauge, increment).
+Recording a span costs two perf_counter() calls and a short locked update, so
+it is meant to stay on in production.
+"""
+
+import os
+import time
+import bisect
+import hmac
+import threading
+import functools
+import contextvars
+import asyncio
+
+# Bucket upper bounds in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Bearer token that lets a Prometheus scraper read /metrics without an admin session
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+METRIC_NAME = "lightyear_phase_duration_seconds"
+
+# Label for spans recorded outside a request (background jobs, startup)
+NO_ROUTE = "-"
+
+_current_route = contextvars.ContextVar("metrics_route", default=NO_ROUTE)
+
+
+class Histogram:
+    """Cumulative-bucket duration histogram."""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(DURATION_BUCKETS) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(DURATION_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+_histograms = {}
+_gauges = {}  # (name, labels) -> value
+_counters = {}  # (name, labels) -> value
+_lock = threading.Lock()
+
+
+def observe(phase, seconds, route=None):
+    """Record a duration for a phase under the current (or given) route."""
+    key = (route or _current_route.get(), phase)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+
+class span:
+    """
+    Time a block of work as a phase of the current request.
+
+    Usage:
+        with span("firestore.chat_history"):
+            history = get_chat_history(user_id, 'study')
+
+        async with span("gemini"):
+            response = await model.generate_content_async(...)
+    """
+
+    __slots__ = ("phase", "started")
+
+    def __init__(self, phase):
+        self.phase = phase
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.phase, time.perf_counter() - self.started)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def timed(phase):
+    """Decorator recording every call of a sync or async function as a phase."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(phase):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge, e.g. set_gauge("model_queue_depth", 3, priority="interactive")."""
+    with _lock:
+        _gauges[(name, tuple(sorted(labels.items())))] = value
+
+
+def increment(name, amount=1, **labels):
+    """Add to a counter, e.g. increment("model_call_retries_total", model="gemini-2.0-flash")."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def set_route(route):
+    """Attribute spans in the current context to a route."""
+    _current_route.set(route or NO_ROUTE)
+
+
+def snapshot():
+    """Return {(route, phase): (bucket_counts, sum, count)} for all histograms."""
+    with _lock:
+        return {key: (list(h.counts), h.total, h.count) for key, h in _histograms.items()}
+
+
+def reset():
+    """Drop all recorded histograms, gauges and counters."""
+    with _lock:
+        _histograms.clear()
+        _gauges.clear()
+        _counters.clear()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def render_prometheus():
+    """Render all histograms in the Prometheus text exposition format."""
+    lines = [
+        f"# HELP {METRIC_NAME} Time spent per request phase, by route.",
+        f"# TYPE {METRIC_NAME} histogram"
+    ]
+    for (route, phase), (counts, total, count) in sorted(snapshot().items()):
+        labels = f'route="{_label(route)}",phase="{_label(phase)}"'
+        cumulative = 0
+        for bound, bucket_count in zip(DURATION_BUCKETS, counts):
+            cumulative += bucket_count
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{METRIC_NAME}_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f'{METRIC_NAME}_sum{{{labels}}} {total:.6f}')
+        lines.append(f'{METRIC_NAME}_count{{{labels}}} {count}')
+
+    with _lock:
+        series = [("gauge", dict(_gauges)), ("counter", dict(_counters))]
+    for metric_type, values in series:
+        previous = None
+        for (name, labels), value in sorted(values.items()):
+            full_name = f"lightyear_{name}"
+            if name != previous:
+                lines.append(f"# TYPE {full_name} {metric_type}")
+                previous = name
+            label_text = ",".join(f'{key}="{_label(val)}"' for key, val in labels)
+            lines.append(f"{full_name}{{{label_text}}} {value}" if label_text else f"{full_name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_token_valid(authorization_header):
+    """Check an Authorization header against METRICS_TOKEN (disabled when unset)."""
+    if not METRICS_TOKEN or not authorization_header:
+        return False
+    return hmac.compare_digest(authorization_header, f"Bearer {METRICS_TOKEN}")
+
+
+def init_request_metrics(app):
+    """Register hooks that set the route label and time each whole request."""
+    from flask import request, g
+
+    @app.before_request
+    def _start_request_metrics():
+        # The URL rule keeps the label set bounded (no IDs from the path)
+        rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        set_route(rule)
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _finish_request_metrics(response):
+        started = getattr(g, "metrics_started", None)
+        if started is not None:
+            observe("request", time.perf_counter() - started)
+        return response
@@ -1259,6 +1259,9 @@ class LiyaAgent {
             case 'proofread':
                 // Handle proofread response with corrections
                 let responseContent = `<p>I've proofread your text. Here are my corrections:</p>`;
+                if (data.warning) {
+                    responseContent += `<div class="alert alert-warning">${data.warning}</div>`;
+                }
                 
                 // Add corrections if there are any
                 if (data.corrections && data.corrections.length > 0) {
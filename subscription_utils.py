@@ -1,13 +1,17 @@
 import os
 import json
 import time
+import threading
 from datetime import datetime, timedelta
 import stripe
 import firebase_admin
 from firebase_admin import firestore, auth
-import tiktoken
 from flask import session, g, flash, jsonify
 
+from request_metrics import timed
+import token_accounting
+import write_behind
+
 # Initialize Stripe with the API key
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY", "")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
@@ -24,6 +28,12 @@ TOTAL_MONTHLY_BUDGET_TOKENS = 2000000  # 2 million tokens total monthly budget
 # Global variable for the Firestore client
 _db = None
 
+# In-process cache of each user's plan and today's token usage, used by the
+# before_request hook so page loads don't hit Firestore on every request.
+USAGE_CACHE_TTL_SECONDS = int(os.getenv("USAGE_CACHE_TTL_SECONDS", "60"))
+_usage_cache = {}
+_usage_cache_lock = threading.Lock()
+
 def get_db():
     """Get the Firestore database client, initializing it if necessary."""
     global _db
@@ -41,15 +51,10 @@ def get_db():
 def count_tokens(text, model="gpt-4"):
     """
     Count the number of tokens in a text string.
-    Using tiktoken for more accurate token counting.
+    Uses the process-wide tiktoken encoder from token_accounting (GPT-4's
+    encoding as an approximation for Gemini); the model argument is ignored.
     """
-    try:
-        encoding = tiktoken.encoding_for_model("gpt-4")  # Using GPT-4 encoding as an approximation for Gemini
-        return len(encoding.encode(text))
-    except Exception as e:
-        print(f"Error counting tokens: {e}")
-        # Fallback to approximate token count (1 token ≈ 4 chars for English text)
-        return len(text) // 4
+    return token_accounting.count_tokens(text)
 
 def get_user_subscription(user_id):
     """Get the subscription status of a user."""
@@ -103,6 +108,8 @@ def get_user_daily_token_usage(user_id):
     
     today = datetime.now().strftime('%Y-%m-%d')
     
+    # Commit this process's queued increments first so the read includes them
+    write_behind.flush_pending(f"token_usage/{user_id}/")
     usage_doc = db.collection('token_usage').document(user_id).collection('daily').document(today).get()
     
     if not usage_doc.exists:
@@ -110,6 +117,75 @@ def get_user_daily_token_usage(user_id):
     
     return usage_doc.to_dict().get('tokens_used', 0)
 
+def get_cached_plan_and_usage(user_id):
+    """
+    Get the user's plan and today's token usage, served from an in-process TTL cache.
+
+    Returns:
+        tuple: (plan, tokens_used)
+    """
+    if not user_id:
+        return 'free', 0
+
+    now = time.time()
+    today = datetime.now().strftime('%Y-%m-%d')
+
+    with _usage_cache_lock:
+        entry = _usage_cache.get(user_id)
+        if entry and entry['expires_at'] > now and entry['date'] == today:
+            return entry['plan'], entry['tokens_used']
+
+    subscription = get_user_subscription(user_id) or {}
+    plan = subscription.get('plan', 'free')
+    tokens_used = get_user_daily_token_usage(user_id)
+    if isinstance(tokens_used, dict):
+        tokens_used = tokens_used.get('tokens_used', 0)
+
+    with _usage_cache_lock:
+        _usage_cache[user_id] = {
+            'plan': plan,
+            'tokens_used': tokens_used,
+            'date': today,
+            'expires_at': now + USAGE_CACHE_TTL_SECONDS
+        }
+
+    return plan, tokens_used
+
+def invalidate_user_usage_cache(user_id=None):
+    """Drop the cached plan/usage for a user, or for everyone if no user is given."""
+    with _usage_cache_lock:
+        if user_id is None:
+            _usage_cache.clear()
+        else:
+            _usage_cache.pop(user_id, None)
+
+def _add_cached_usage(user_id, tokens_used):
+    """
+    Add tokens to a cached entry so the navbar stays current without a re-read.
+
+    Returns:
+        int | None: Today's cached usage before the addition, or None if not cached
+    """
+    today = datetime.now().strftime('%Y-%m-%d')
+    with _usage_cache_lock:
+        entry = _usage_cache.get(user_id)
+        if entry is None:
+            return None
+        if entry['date'] != today:
+            # The day rolled over; let the next lookup re-read from Firestore
+            _usage_cache.pop(user_id, None)
+            return None
+        previous = entry['tokens_used']
+        entry['tokens_used'] += tokens_used
+        return previous
+
+def _set_cached_plan(user_id, plan):
+    """Update the cached plan after a subscription change."""
+    with _usage_cache_lock:
+        entry = _usage_cache.get(user_id)
+        if entry is not None:
+            entry['plan'] = plan
+
 def increment_user_token_usage(user_id, tokens_used):
     """Increment the user's token usage for today and update monthly totals."""
     if not user_id:
@@ -122,54 +198,27 @@ def increment_user_token_usage(user_id, tokens_used):
     today = datetime.now().strftime('%Y-%m-%d')
     current_month = datetime.now().strftime('%Y-%m')
     
-    # Update daily usage
-    daily_ref = db.collection('token_usage').document(user_id).collection('daily').document(today)
-    
-    # Use transactions to safely update the token count
-    @firestore.transactional
-    def update_daily_usage(transaction, doc_ref):
-        doc = doc_ref.get(transaction=transaction)
-        if doc.exists:
-            current_usage = doc.to_dict().get('tokens_used', 0)
-            transaction.update(doc_ref, {
-                'tokens_used': current_usage + tokens_used,
-                'last_updated': firestore.SERVER_TIMESTAMP
-            })
-        else:
-            transaction.set(doc_ref, {
-                'tokens_used': tokens_used,
-                'date': today,
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'last_updated': firestore.SERVER_TIMESTAMP
-            })
-    
-    # Update monthly usage for organization-wide tracking
-    monthly_ref = db.collection('token_usage_monthly').document(current_month)
-    
-    @firestore.transactional
-    def update_monthly_usage(transaction, doc_ref):
-        doc = doc_ref.get(transaction=transaction)
-        if doc.exists:
-            current_usage = doc.to_dict().get('tokens_used', 0)
-            transaction.update(doc_ref, {
-                'tokens_used': current_usage + tokens_used,
-                'last_updated': firestore.SERVER_TIMESTAMP
-            })
-        else:
-            transaction.set(doc_ref, {
-                'tokens_used': tokens_used,
-                'month': current_month,
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'last_updated': firestore.SERVER_TIMESTAMP
-            })
-    
-    # Execute transactions
-    transaction = db.transaction()
-    update_daily_usage(transaction, daily_ref)
-    
-    transaction = db.transaction()
-    update_monthly_usage(transaction, monthly_ref)
+    # Keep the before_request cache in step with the write queued below
+    previous_usage = _add_cached_usage(user_id, tokens_used)
 
+    # Daily usage, and monthly usage for organization-wide tracking. Increments
+    # are atomic server-side, so they can be queued and batched off the request path
+    daily = {
+        'tokens_used': write_behind.increment(tokens_used),
+        'date': today,
+        'last_updated': write_behind.SERVER_TIMESTAMP
+    }
+    if previous_usage == 0:
+        # No usage recorded today yet, so this write creates the document
+        daily['created_at'] = write_behind.SERVER_TIMESTAMP
+    write_behind.write(f"token_usage/{user_id}/daily/{today}", daily, merge=True)
+    write_behind.write(f"token_usage_monthly/{current_month}", {
+        'tokens_used': write_behind.increment(tokens_used),
+        'month': current_month,
+        'last_updated': write_behind.SERVER_TIMESTAMP
+    }, merge=True)
+
+@timed("token_limit_check")
 def check_user_token_limit(user_id):
     """
     Check if the user has exceeded their token limit.
@@ -185,16 +234,13 @@ def check_user_token_limit(user_id):
         # If DB connection isn't available, allow usage to prevent blocking users
         return True, FREE_PLAN_DAILY_LIMIT
     
-    # Get user's subscription status
-    subscription = get_user_subscription(user_id)
-    plan = subscription.get('plan', 'free')
+    # Plan and current usage come from the usage cache, which already counts this
+    # process's queued increments that Firestore hasn't seen yet
+    plan, current_usage = get_cached_plan_and_usage(user_id)
     
     # Get daily limit based on plan
     daily_limit = FREE_PLAN_DAILY_LIMIT if plan == 'free' else PAID_PLAN_DAILY_LIMIT
     
-    # Get current usage
-    current_usage = get_user_daily_token_usage(user_id)
-    
     # Check if total monthly budget has been exceeded
     current_month = datetime.now().strftime('%Y-%m')
     monthly_usage_doc = db.collection('token_usage_monthly').document(current_month).get()
@@ -218,6 +264,7 @@ def check_user_token_limit(user_id):
     remaining = daily_limit - current_usage
     return remaining > 0, remaining
 
+@timed("token_tracking")
 def track_token_usage_for_api_call(user_id, prompt, response_text, estimated_tokens=None):
     """
     Track token usage for an API call, counting both prompt and response tokens.
@@ -238,15 +285,16 @@ def track_token_usage_for_api_call(user_id, prompt, response_text, estimated_tok
     if estimated_tokens is not None:
         total_tokens = estimated_tokens
     else:
-        # Count tokens in the request
-        prompt_tokens = count_tokens(prompt)
-        
-        # Count tokens in the response
-        response_tokens = count_tokens(response_text)
+        # Count tokens in the request and the response in one batch
+        prompt_tokens, response_tokens = token_accounting.count_tokens_batch([prompt, response_text])
         
         # Total tokens used in this call
         total_tokens = prompt_tokens + response_tokens
     
+    # Nothing to bill (e.g. a response served from the cache)
+    if not total_tokens:
+        return 0
+    
     # Log the usage
     increment_user_token_usage(user_id, total_tokens)
     
@@ -344,6 +392,7 @@ def handle_stripe_webhook(payload, signature):
                     'subscription_status': 'active',
                     'subscription_updated_at': firestore.SERVER_TIMESTAMP
                 })
+                _set_cached_plan(user_id, 'premium')
                 
                 # Process referral if this user was referred
                 user_data = user_doc.to_dict()
@@ -376,6 +425,7 @@ def handle_stripe_webhook(payload, signature):
                     update_data['plan'] = 'free'
                 
                 db.collection('users').document(user_id).update(update_data)
+                _set_cached_plan(user_id, update_data['plan'])
         
         elif event['type'] == 'customer.subscription.deleted':
             subscription = event['data']['object']
@@ -393,6 +443,7 @@ def handle_stripe_webhook(payload, signature):
                     'subscription_status': 'canceled',
                     'subscription_updated_at': firestore.SERVER_TIMESTAMP
                 })
+                _set_cached_plan(user_id, 'free')
                 
         return {'success': True}
     except Exception as e:
@@ -426,6 +477,9 @@ def reset_all_daily_token_usage():
     # Commit the batch
     batch.commit()
     
+    # Every user's usage was reset, so cached counts are stale
+    invalidate_user_usage_cache()
+    
     return True
 
 def get_admin_dashboard_data():
@@ -0,0 +1,75 @@
+import threading
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+import pytest
+from flask import Flask
+
+from agents import utils
+
+
+def interaction(text, seconds):
+    doc = MagicMock()
+    doc.to_dict.return_value = {'user_input': text, 'timestamp': datetime.fromtimestamp(seconds, timezone.utc)}
+    return doc
+
+
+class SlowQuery:
+    """Interactions query whose stream() waits until every session is being read."""
+
+    def __init__(self, docs, barrier):
+        self.docs = docs
+        self.barrier = barrier
+
+    def stream(self):
+        self.barrier.wait(timeout=2)
+        return self.docs
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = MagicMock()
+    monkeypatch.setattr(utils.fb_utils, 'db', db)
+    return db
+
+
+def add_sessions(db, sessions):
+    barrier = threading.Barrier(len(sessions))
+    session_docs = []
+    for docs in sessions:
+        session_doc = MagicMock()
+        (session_doc.reference.collection.return_value.order_by.return_value
+         .limit.return_value) = SlowQuery(docs, barrier)
+        session_docs.append(session_doc)
+    sessions_query = (db.collection.return_value.document.return_value.collection.return_value
+                      .order_by.return_value.limit.return_value)
+    sessions_query.stream.return_value = session_docs
+    return sessions_query
+
+
+def test_sessions_are_read_concurrently_and_merged_newest_first(db):
+    add_sessions(db, [
+        [interaction('a3', 30), interaction('a1', 10)],
+        [interaction('b4', 40), interaction('b2', 20)],
+        [interaction('c5', 50)],
+    ])
+
+    entries = utils.get_agent_memory('user1', limit=4)
+
+    assert [entry['user_input'] for entry in entries] == ['c5', 'b4', 'a3', 'b2']
+
+
+def test_memory_is_cached_for_the_request(db):
+    sessions_query = add_sessions(db, [[interaction('a1', 10)]])
+
+    with Flask(__name__).app_context():
+        first = utils.get_agent_memory('user1')
+        assert utils.get_agent_memory('user1') == first
+        assert sessions_query.stream.call_count == 1
+
+        utils._forget_request_memory('user1')
+        utils.get_agent_memory('user1')
+        assert sessions_query.stream.call_count == 2
+
+    utils.get_agent_memory('user1')
+    assert sessions_query.stream.call_count == 3
@@ -0,0 +1,54 @@
+import asyncio
+import contextvars
+
+import pytest
+
+from async_runtime import run_async, iterate_async, async_to_sync
+
+
+def test_run_async_reuses_one_loop():
+    async def current_loop():
+        return asyncio.get_running_loop()
+
+    assert run_async(current_loop()) is run_async(current_loop())
+
+
+def test_context_variables_are_carried_over():
+    var = contextvars.ContextVar('var', default=None)
+    var.set('request-1')
+
+    async def read():
+        return var.get()
+
+    assert run_async(read()) == 'request-1'
+
+
+def test_exceptions_propagate_and_nested_calls_fail():
+    async def boom():
+        raise ValueError('bad')
+
+    with pytest.raises(ValueError):
+        run_async(boom())
+
+    async def nested():
+        async def inner():
+            return 1
+        return run_async(inner())
+
+    with pytest.raises(RuntimeError):
+        run_async(nested())
+
+
+def test_iterate_async_and_async_to_sync():
+    async def numbers():
+        for i in range(3):
+            yield i
+
+    assert list(iterate_async(numbers())) == [0, 1, 2]
+
+    @async_to_sync
+    async def add(a, b):
+        return a + b
+
+    assert add(2, 3) == 5
+
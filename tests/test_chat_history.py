@@ -0,0 +1,93 @@
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+import pytest
+
+import firebase_utils
+from firebase_utils import ChatTailCache
+
+
+def make_doc(doc_id, content, seconds):
+    doc = MagicMock()
+    doc.id = doc_id
+    doc.to_dict.return_value = {
+        'content': content, 'role': 'user', 'chat_type': 'study',
+        'timestamp': datetime.fromtimestamp(seconds, timezone.utc)
+    }
+    return doc
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = MagicMock()
+    monkeypatch.setattr(firebase_utils, 'db', db)
+    monkeypatch.setattr(firebase_utils, '_chat_tail_cache', ChatTailCache())
+    monkeypatch.setattr(firebase_utils.write_behind, 'write', lambda *args, **kwargs: None)
+    return db
+
+
+def history_query(db):
+    return (db.collection.return_value.document.return_value.collection.return_value
+            .where.return_value.order_by.return_value.order_by.return_value)
+
+
+def test_query_is_filtered_ordered_and_limited_in_firestore(db):
+    query = history_query(db)
+    query.limit.return_value.stream.return_value = [make_doc('m3', 'third', 30), make_doc('m2', 'second', 20)]
+
+    messages = firebase_utils.get_chat_history('user1', 'study', limit=2)
+
+    assert [m['content'] for m in messages] == ['second', 'third']
+    assert messages[0]['timestamp_value'] == 20
+    where = db.collection.return_value.document.return_value.collection.return_value.where
+    where.assert_called_with('chat_type', '==', 'study')
+    where.return_value.order_by.assert_called_with('timestamp', direction='DESCENDING')
+    # Ties on time are broken by the (queue-ordered) document ID
+    where.return_value.order_by.return_value.order_by.assert_called_with('__name__', direction='DESCENDING')
+    query.limit.assert_called_with(2)
+
+
+def test_tail_cache_serves_repeat_reads_and_new_messages(db, monkeypatch):
+    query = history_query(db)
+    query.limit.return_value.stream.return_value = [make_doc('m1', 'first', 10)]
+
+    assert len(firebase_utils.get_chat_history('user1', 'study', limit=5)) == 1
+    firebase_utils.save_chat_message('user1', 'study', 'reply', 'assistant')
+    messages = firebase_utils.get_chat_history('user1', 'study', limit=5)
+
+    # The first read found the whole history, so the cache answers from then on
+    assert [m['content'] for m in messages] == ['first', 'reply']
+    assert query.limit.return_value.stream.call_count == 1
+
+    # The cached message carries the time that is written to Firestore
+    written = {}
+    monkeypatch.setattr(firebase_utils.write_behind, 'write', lambda path, data, merge=False: written.update(data))
+    firebase_utils.save_chat_message('user1', 'study', 'again', 'user')
+    cached = firebase_utils.get_chat_history('user1', 'study', limit=5)[-1]
+    assert firebase_utils.write_behind._decode(written, None)['timestamp'] == cached['timestamp']
+
+
+def test_cursor_pages_skip_the_cache(db):
+    history_ref = db.collection.return_value.document.return_value.collection.return_value
+    cursor = history_ref.document.return_value.get.return_value
+    cursor.exists = True
+    query = history_query(db)
+    query.start_after.return_value.limit.return_value.stream.return_value = [make_doc('m1', 'first', 10)]
+
+    messages = firebase_utils.get_chat_history('user1', 'study', limit=1, before='m2')
+
+    history_ref.document.assert_called_with('m2')
+    query.start_after.assert_called_with(cursor)
+    assert [m['id'] for m in messages] == ['m1']
+
+
+def test_tail_cache_trims_and_only_answers_when_sure():
+    cache = ChatTailCache(tail=3)
+    cache.put('u', 'study', [{'content': str(i)} for i in range(5)], complete=False)
+    assert [m['content'] for m in cache.get('u', 'study', 2)] == ['3', '4']
+    assert cache.get('u', 'study', 4) is None
+
+    cache.put('v', 'study', [{'content': 'only'}], complete=True)
+    assert len(cache.get('v', 'study', 50)) == 1
+    cache.invalidate('v')
+    assert cache.get('v', 'study', 50) is None
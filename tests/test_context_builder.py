@@ -0,0 +1,62 @@
+import asyncio
+import threading
+
+import firebase_utils
+from agents import utils
+from mcp.context import ContextType
+
+
+def test_sources_load_concurrently_and_are_timed(monkeypatch):
+    # Each source blocks until the other has started, so a sequential build would time out
+    barrier = threading.Barrier(2)
+
+    def memory(user_id, session_id, limit):
+        barrier.wait(timeout=2)
+        return [{'user_input': 'earlier question', 'agent_response': 'earlier answer'}]
+
+    def history(user_id, chat_type):
+        barrier.wait(timeout=2)
+        return [{'role': 'user', 'content': 'hello'}, {'role': 'assistant', 'content': 'hi there'}]
+
+    monkeypatch.setattr(utils, 'get_agent_memory', memory)
+    monkeypatch.setattr(firebase_utils, 'get_chat_history', history)
+    monkeypatch.setattr(utils, 'SUMMARY_ENABLED', False)
+
+    timings = {}
+    context = asyncio.run(utils.build_mcp_context(
+        "next question", user_id="u1", context_type="study", load_history=True, timings=timings
+    ))
+
+    assert set(timings) == {'memory', 'history'}
+    assert len([e for e in context.elements if e.type == ContextType.USER_MEMORY]) == 1
+    assert [m.content for m in context.conversation_history] == ["hello", "hi there", "next question"]
+
+
+def test_history_already_fetched_is_reused(monkeypatch):
+    def unexpected(*args):
+        raise AssertionError("history fetched twice")
+
+    monkeypatch.setattr(utils, 'get_agent_memory', lambda *args: [])
+    monkeypatch.setattr(firebase_utils, 'get_chat_history', unexpected)
+    monkeypatch.setattr(utils, 'SUMMARY_ENABLED', False)
+
+    timings = {}
+    context = asyncio.run(utils.build_mcp_context(
+        "question", user_id="u1", chat_history=[{'role': 'user', 'content': 'before'}],
+        load_history=True, timings=timings
+    ))
+
+    assert 'history' not in timings
+    assert [m.content for m in context.conversation_history] == ["before", "question"]
+
+
+def test_failed_source_does_not_fail_the_build(monkeypatch):
+    def broken(*args):
+        raise RuntimeError("firestore unavailable")
+
+    monkeypatch.setattr(utils, 'get_agent_memory', lambda *args: [])
+    monkeypatch.setattr(firebase_utils, 'get_chat_history', broken)
+
+    context = asyncio.run(utils.build_mcp_context("question", user_id="u1", load_history=True))
+
+    assert [m.content for m in context.conversation_history] == ["question"]
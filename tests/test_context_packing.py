@@ -0,0 +1,81 @@
+import pytest
+
+import token_accounting
+from mcp.context import ConversationMessage, MCPContext
+from mcp.packing import TRUNCATION_MARKER, pack_context
+from mcp.prompts import format_context_messages
+
+
+@pytest.fixture(autouse=True)
+def char_tokens(monkeypatch):
+    # Count one token per four characters, independent of tiktoken data
+    monkeypatch.setattr(token_accounting, '_encoder', None)
+    monkeypatch.setattr(token_accounting, '_encoder_loaded', True)
+
+
+def build_context(messages=20, document_words=2000):
+    context = MCPContext()
+    context.add_system_instruction("You are a helpful study assistant.")
+    for i in range(messages):
+        role = "user" if i % 2 == 0 else "assistant"
+        context.conversation_history.append(ConversationMessage(role, f"message {i} " + "word " * 40))
+    context.add_document("lorem " * document_words)
+    context.add_user_memory({"preferences": {"tone": "friendly"}})
+    return context
+
+
+def test_context_within_budget_is_returned_unchanged():
+    context = build_context(messages=2, document_words=10)
+    result = pack_context(context, budget=10000)
+    assert result.context is context
+    assert not result.removed
+
+
+def test_oldest_messages_go_first_and_system_instructions_stay():
+    context = build_context(document_words=200)
+    result = pack_context(context, budget=800)
+
+    assert result.tokens <= 800
+    kept = [m.content.split()[1] for m in result.context.conversation_history]
+    assert kept == [str(i) for i in range(20 - len(kept), 20)]
+    assert all(item.kind == "message" and item.action == "dropped" for item in result.removed)
+    assert result.context.elements[0].content == "You are a helpful study assistant."
+    # The original context is left alone
+    assert len(context.conversation_history) == 20
+
+
+def test_oversized_document_is_truncated_and_latest_message_kept():
+    context = build_context(messages=4, document_words=20000)
+    result = pack_context(context, budget=4000)
+
+    assert result.tokens <= 4000
+    actions = [(item.kind, item.action) for item in result.removed]
+    assert actions == [("message", "dropped")] * 3 + [("document", "truncated")]
+    assert [m.content.split()[1] for m in result.context.conversation_history] == ["3"]
+
+    messages = format_context_messages(result.context)
+    document_part = next(part["text"] for m in messages for part in m["parts"]
+                         if part["text"].startswith("Document content:"))
+    assert document_part.endswith(TRUNCATION_MARKER)
+    assert result.dropped_tokens > 0
+
+
+def test_only_the_memory_that_is_sent_is_counted():
+    context = build_context(messages=2, document_words=10)
+    for i in range(5):
+        context.add_user_memory({"facts": [f"fact {i} " + "detail " * 200]})
+    result = pack_context(context, budget=300)
+
+    # The extra memory isn't sent, so it doesn't push anything out
+    assert not result.removed
+    assert result.tokens <= 300
+
+
+def test_dropping_memory_drops_the_unsent_memory_too():
+    context = build_context(messages=2, document_words=10)
+    context.add_user_memory({"facts": ["second " * 200]})
+    result = pack_context(context, budget=10)
+
+    assert ("user_memory", "dropped") in [(item.kind, item.action) for item in result.removed]
+    messages = format_context_messages(result.context)
+    assert not any(part["text"].startswith("User memory") for m in messages for part in m["parts"])
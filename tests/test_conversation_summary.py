@@ -0,0 +1,83 @@
+import asyncio
+
+from conversation_summary import ConversationSummarizer, SummaryStore
+
+
+class MemoryStore(SummaryStore):
+    def __init__(self, record=None):
+        super().__init__()
+        self.record = record
+        self.saved = []
+
+    def _load(self, user_id, chat_type):
+        return self.record
+
+    def save(self, user_id, chat_type, record):
+        self.saved.append(record)
+        self._remember((user_id, chat_type), dict(record))
+
+
+def history(count, start=1):
+    return [
+        {'id': f'm{i:03d}', 'role': 'user' if i % 2 else 'assistant', 'content': f'message {i}',
+         'timestamp_value': float(i)}
+        for i in range(start, start + count)
+    ]
+
+
+def test_short_histories_are_replayed_verbatim():
+    summarizer = ConversationSummarizer(store=MemoryStore(), trigger=10, recent=4)
+    messages = history(6)
+    assert summarizer.compact_history('u1', 'study', messages) == (None, messages)
+
+    # Histories without timestamps (e.g. sent by the client) are left alone
+    untimed = [{'role': 'user', 'content': 'hi'}] * 30
+    assert summarizer.compact_history('u1', 'study', untimed) == (None, untimed)
+
+
+def test_long_history_schedules_compaction_and_stays_bounded(monkeypatch):
+    summarizer = ConversationSummarizer(store=MemoryStore(), trigger=10, recent=4)
+    scheduled = []
+    monkeypatch.setattr(summarizer, 'schedule', lambda *args: scheduled.append(args))
+
+    summary, recent = summarizer.compact_history('u1', 'study', history(25))
+
+    assert summary is None
+    assert [m['timestamp_value'] for m in recent] == [float(i) for i in range(16, 26)]
+    [(user_id, chat_type, record, to_compact)] = scheduled
+    assert record is None and len(to_compact) == 21
+
+
+def test_compaction_folds_messages_into_the_stored_summary():
+    prompts = []
+
+    async def generate(instruction, text):
+        prompts.append(text)
+        return "User is studying biology."
+
+    store = MemoryStore({'summary': 'User likes cells.', 'covered_until': 10.0, 'message_count': 10})
+    summarizer = ConversationSummarizer(store=store, generate=generate, trigger=10, recent=4)
+
+    record = asyncio.run(summarizer.compact('u1', 'study', store.get('u1', 'study'), history(6, start=11)))
+
+    assert record == {'summary': 'User is studying biology.', 'covered_until': 16.0, 'covered_id': 'm016',
+                      'message_count': 16}
+    assert prompts[0].startswith("Existing summary:\nUser likes cells.")
+    assert "User: message 11" in prompts[0]
+
+    # Later turns only replay messages the summary doesn't cover
+    summary, recent = summarizer.compact_history('u1', 'study', history(8, start=10))
+    assert summary == 'User is studying biology.'
+    assert [m['timestamp_value'] for m in recent] == [17.0]
+
+
+def test_messages_sharing_a_time_are_not_split_by_the_summary():
+    store = MemoryStore({'summary': 'Earlier.', 'covered_until': 5.0, 'covered_id': 'b', 'message_count': 2})
+    summarizer = ConversationSummarizer(store=store, trigger=10, recent=4)
+    # Same commit time: only the ID says which were summarized
+    tied = [{'id': doc_id, 'role': 'user', 'content': doc_id, 'timestamp_value': 5.0} for doc_id in 'abcd']
+
+    summary, recent = summarizer.compact_history('u1', 'study', tied)
+
+    assert summary == 'Earlier.'
+    assert [m['id'] for m in recent] == ['c', 'd']
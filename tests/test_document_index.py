@@ -0,0 +1,94 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import document_index
+from document_index import DocumentIndex, DocumentIndexStore, build_document_excerpt, retrieve_chunks
+
+TOPICS = ["photosynthesis chlorophyll sunlight", "mitochondria respiration energy",
+          "volcano magma eruption", "parliament election democracy"]
+
+
+def make_document(paragraphs=40):
+    return "\n\n".join(
+        f"Section {i}. " + " ".join([TOPICS[i % len(TOPICS)]] * 20) + " filler text about the course."
+        for i in range(paragraphs)
+    )
+
+
+@pytest.fixture
+def index_store(tmp_path, monkeypatch):
+    store = DocumentIndexStore(root_dir=str(tmp_path), use_embeddings=False)
+    monkeypatch.setattr(document_index, '_INDEX_STORE', store)
+    return store
+
+
+def test_bm25_ranks_matching_chunks_first():
+    text = make_document()
+    index = DocumentIndex.build(text, max_chars=800, overlap=0)
+    selected = index.rank("How does magma cause an eruption?", k=3)
+
+    assert len(selected) == 3
+    assert all("magma" in text[index.spans[i][0]:index.spans[i][1]] for i in selected)
+    assert selected == sorted(selected)
+
+
+def test_unmatched_query_spreads_chunks_over_the_document():
+    index = DocumentIndex.build(make_document(), max_chars=800, overlap=0)
+    selected = index.rank("summarize this", k=4)
+    assert len(selected) == 4
+    assert selected[0] == 0 and selected[-1] >= len(index.spans) // 2
+
+
+def test_excerpt_is_much_smaller_than_the_document(index_store, monkeypatch):
+    monkeypatch.setattr(document_index, 'DOCUMENT_RETRIEVAL_MIN_CHARS', 1000)
+    text = make_document(paragraphs=200)
+
+    excerpt = build_document_excerpt(text, "mitochondria and respiration", k=4)
+    assert len(excerpt) * 5 < len(text)
+    assert "mitochondria" in excerpt and "volcano" not in excerpt
+
+    assert build_document_excerpt("short document", "anything") == "short document"
+
+
+def test_index_is_saved_and_reloaded(index_store, tmp_path):
+    text = make_document()
+    chunks = retrieve_chunks(text, "election", k=2)
+    assert chunks and all("election" in chunk.text for chunk in chunks)
+
+    reloaded = DocumentIndexStore(root_dir=str(tmp_path), use_embeddings=False)
+    content_hash = next(p.stem for p in tmp_path.iterdir() if p.suffix == ".json")
+    assert reloaded.get(content_hash).spans == index_store.get(content_hash).spans
+
+
+def test_embeddings_mix_into_ranking(tmp_path):
+    vocabulary = ["photosynthesis", "mitochondria", "volcano", "parliament"]
+
+    def embed(texts, task_type):
+        # Bag-of-topic vectors stand in for a real embedding model
+        return [[text.lower().count(word) for word in vocabulary] for text in texts]
+
+    store = DocumentIndexStore(root_dir=str(tmp_path), use_embeddings=True, embed=embed)
+    text = make_document()
+    index = store.build("a" * 64, text)
+    assert index.embeddings.shape == (len(index.spans), 4)
+    assert np.allclose(np.linalg.norm(index.embeddings, axis=1), 1.0)
+
+    # No BM25 term overlap: only the embedding can find the volcano chunks
+    selected = index.rank("eruptions", k=2, query_embedding=store.embed_query("volcano"))
+    assert all("volcano" in text[index.spans[i][0]:index.spans[i][1]] for i in selected)
+
+
+def test_sweep_removes_indexes_of_removed_documents(index_store, tmp_path):
+    retrieve_chunks(make_document(), "election", k=2)
+    retrieve_chunks(make_document(10), "volcano", k=2)
+    hashes = sorted({p.stem for p in tmp_path.iterdir()})
+    hours_ago = time.time() - 3600
+    for path in tmp_path.iterdir():
+        os.utime(path, (hours_ago, hours_ago))
+
+    assert index_store.sweep({hashes[0]}, max_age=60) >= 1
+    assert {p.stem for p in tmp_path.iterdir()} == {hashes[0]}
+    assert index_store.get(hashes[1]) is None
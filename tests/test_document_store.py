@@ -0,0 +1,90 @@
+import os
+import time
+
+import pytest
+
+import document_store
+from document_store import DocumentStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DocumentStore(root_dir=str(tmp_path), cache_max_bytes=1024)
+
+
+def test_put_and_get_roundtrip(store):
+    record = store.put('file1', 'Hello wörld', {'filename': 'a.pdf'})
+    assert record['content_length'] == len('Hello wörld')
+    assert store.get('file1') == 'Hello wörld'
+    assert store.get_record('file1')['metadata'] == {'filename': 'a.pdf'}
+
+
+def test_identical_content_shares_blob(store, tmp_path):
+    first = store.put('file1', 'same text')
+    second = store.put('file2', 'same text')
+    assert first['content_hash'] == second['content_hash']
+    assert len(list((tmp_path / 'blobs').iterdir())) == 1
+
+
+def test_reads_from_disk_when_not_cached(tmp_path):
+    DocumentStore(root_dir=str(tmp_path)).put('file1', 'x' * 5000)
+    # A fresh instance has an empty LRU tier and must read the blob via mmap
+    fresh = DocumentStore(root_dir=str(tmp_path))
+    assert fresh.get('file1') == 'x' * 5000
+    assert fresh.get_prefix('file1', 10) == 'x' * 10
+
+
+def test_lru_tier_respects_byte_budget(store):
+    store.put('file1', 'a' * 600)
+    store.put('file2', 'b' * 600)
+    assert store._cache_bytes <= store.cache_max_bytes
+    # Evicted entries are still served from disk
+    assert store.get('file1') == 'a' * 600
+
+
+def test_unknown_and_invalid_ids(store):
+    assert store.get('missing') is None
+    assert store.get('../etc/passwd') is None
+    with pytest.raises(ValueError):
+        store.put('../escape', 'text')
+
+
+def test_delete_removes_blob_only_when_unreferenced(store, tmp_path):
+    store.put('file1', 'same text')
+    store.put('file2', 'same text')
+
+    assert store.delete('file1')
+    assert store.get('file2') == 'same text'
+    assert len(list((tmp_path / 'blobs').iterdir())) == 1
+
+    assert store.delete('file2')
+    assert list((tmp_path / 'blobs').iterdir()) == []
+    assert not store.delete('file2')
+
+
+def test_sweep_removes_expired_documents_and_their_blobs(tmp_path, monkeypatch):
+    store = DocumentStore(root_dir=str(tmp_path), retention_seconds=60)
+    store.put('old', 'old text')
+    store.put('new', 'new text')
+    hours_ago = time.time() - 3600
+    for path in (tmp_path / 'ids' / 'old.json', tmp_path / 'blobs' / f"{store.get_record('old')['content_hash']}.txt"):
+        os.utime(path, (hours_ago, hours_ago))
+    swept = []
+    monkeypatch.setattr(document_store, '_sweep_hooks', [lambda live, max_age: swept.append((live, max_age))])
+
+    assert store.sweep() == 2
+
+    assert store.get('old') is None
+    assert store.get('new') == 'new text'
+    assert len(list((tmp_path / 'blobs').iterdir())) == 1
+    assert swept == [({store.get_record('new')['content_hash']}, 60)]
+
+
+def test_reading_a_document_keeps_it(tmp_path):
+    store = DocumentStore(root_dir=str(tmp_path), retention_seconds=60)
+    store.put('file1', 'text')
+    hours_ago = time.time() - 3600
+    os.utime(tmp_path / 'ids' / 'file1.json', (hours_ago, hours_ago))
+
+    assert store.get('file1') == 'text'
+    assert store.sweep() == 0
@@ -0,0 +1,106 @@
+import os
+import time
+
+import pytest
+
+import extraction_cache
+from extraction_cache import ExtractionCache, cached_extractor, UncachedText, FILENAME_PLACEHOLDER
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ExtractionCache(root_dir=str(tmp_path / 'cache'), max_bytes=1000)
+    monkeypatch.setattr(extraction_cache, '_CACHE', cache)
+    return cache
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_identical_bytes_hit_the_cache(cache, tmp_path):
+    calls = []
+
+    @cached_extractor('test', '1')
+    def extract(file_path):
+        calls.append(file_path)
+        return 'extracted'
+
+    first = write(tmp_path / 'a.txt', b'same bytes')
+    second = write(tmp_path / 'b.txt', b'same bytes')
+    assert extract(first) == 'extracted'
+    assert extract(second) == 'extracted'
+    assert calls == [first]
+
+    # Different content misses
+    assert extract(write(tmp_path / 'c.txt', b'other bytes')) == 'extracted'
+    assert len(calls) == 2
+
+
+def test_version_and_key_args_change_the_key(cache, tmp_path):
+    calls = []
+
+    def make(version):
+        @cached_extractor('test', version, key_args=('mode',))
+        def extract(file_path, mode=None):
+            calls.append((version, mode))
+            return f'{version}-{mode}'
+        return extract
+
+    path = write(tmp_path / 'a.txt', b'data')
+    assert make('1')(path) == '1-None'
+    assert make('2')(path) == '2-None'
+    assert make('2')(path, mode='x') == '2-x'
+    assert make('2')(path, 'x') == '2-x'
+    assert len(calls) == 3
+
+
+def test_empty_results_are_not_cached(cache, tmp_path):
+    calls = []
+
+    @cached_extractor('test', '1')
+    def extract(file_path):
+        calls.append(file_path)
+        return ''
+
+    path = write(tmp_path / 'a.txt', b'data')
+    extract(path)
+    extract(path)
+    assert len(calls) == 2
+
+
+def test_failures_are_not_cached(cache, tmp_path):
+    calls = []
+
+    @cached_extractor('test', '1')
+    def extract(file_path):
+        calls.append(file_path)
+        return UncachedText('Error processing file')
+
+    path = write(tmp_path / 'a.txt', b'data')
+    assert extract(path) == 'Error processing file'
+    extract(path)
+    assert len(calls) == 2
+
+
+def test_cached_text_gets_each_files_own_name(cache, tmp_path):
+    @cached_extractor('test', '1')
+    def extract(file_path):
+        return f'Filename: {FILENAME_PLACEHOLDER}'
+
+    assert extract(write(tmp_path / 'first.csv', b'same bytes')) == 'Filename: first.csv'
+    assert extract(write(tmp_path / 'second.csv', b'same bytes')) == 'Filename: second.csv'
+
+
+def test_lru_eviction_keeps_recent_entries(cache):
+    cache.put('old', 'a' * 400)
+    cache.put('recent', 'b' * 400)
+    # Make 'old' clearly the least recently used
+    past = time.time() - 100
+    os.utime(cache._path('old'), (past, past))
+    cache.put('new', 'c' * 400)
+
+    assert cache.get('old') is None
+    assert cache.get('recent') == 'b' * 400
+    assert cache.get('new') == 'c' * 400
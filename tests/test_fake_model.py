@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from mcp.context import MCPContextFactory
+from mcp.fake_model import FakeGenerativeModel, FakeModelError
+from mcp.model_adapter import FakeAdapter
+from token_accounting import usage_from_metadata
+
+
+def test_fake_responses_are_deterministic():
+    first = FakeGenerativeModel(latency_ms=0, completion_tokens=30, seed=7)
+    second = FakeGenerativeModel(latency_ms=0, completion_tokens=30, seed=7)
+
+    response = first.generate_content(["Explain photosynthesis"])
+    assert response.text == second.generate_content(["Explain photosynthesis"]).text
+    assert response.text.startswith("This is a simulated response to: Explain photosynthesis")
+    assert len(response.text.split()) == 30
+    assert usage_from_metadata(response)["completion_tokens"] == 30
+    assert first.generate_content(["Something else"]).text != response.text
+
+
+def test_latency_distributions():
+    rng = FakeGenerativeModel()._rng("x")
+    assert FakeGenerativeModel(latency_ms=100, distribution="fixed").latency(rng) == 0.1
+    for _ in range(20):
+        assert 0.05 <= FakeGenerativeModel(latency_ms=100, distribution="uniform", spread=0.5).latency(rng) <= 0.15
+        assert FakeGenerativeModel(latency_ms=100, distribution="lognormal").latency(rng) > 0
+
+
+def test_error_rate_and_chat_history():
+    failing = FakeGenerativeModel(latency_ms=0, error_rate=1.0, error_code=429)
+    with pytest.raises(FakeModelError) as error:
+        failing.generate_content("hi")
+    assert error.value.code == 429
+
+    chat = FakeGenerativeModel(latency_ms=0).start_chat(history=[{"role": "user", "parts": ["earlier"]}])
+    response = asyncio.run(chat.send_message_async(["next question"]))
+    assert "next question" in response.text
+    assert len(chat.history) == 3
+
+
+def test_fake_adapter_generates_and_streams():
+    adapter = FakeAdapter(latency_ms=1, completion_tokens=40, stream_chunks=4)
+    context = MCPContextFactory.create()
+    context.add_conversation_message("user", "Tell me about stars")
+
+    response = asyncio.run(adapter.generate_with_context("Be brief", context))
+    assert response.error is None
+    assert response.usage_metrics["completion_tokens"] == 40
+
+    async def consume():
+        stream = adapter.stream_with_context("Stream it", context)
+        chunks = [chunk async for chunk in stream]
+        return chunks, stream
+
+    chunks, stream = asyncio.run(consume())
+    assert len(chunks) == 4
+    assert stream.usage_metrics["completion_tokens"] == 40
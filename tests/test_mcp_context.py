@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+import mcp.context
+from mcp.context import ContextType, MCPContext
+
+
+def build_context():
+    context = MCPContext()
+    context.set_user_id("user-1")
+    context.add_system_instruction("You are a helpful assistant.")
+    context.add_document("Chapter one", importance=8)
+    context.add_user_memory({"preferences": {"level": "beginner"}, 3: "numeric key"})
+    context.add_conversation_message("user", "Hello!")
+    context.add_conversation_message("assistant", "Hi there")
+    return context
+
+
+def assert_same(restored, original):
+    assert restored.to_dict() == original.to_dict()
+
+
+def test_messages_are_stored_once():
+    context = build_context()
+    assert len(context.conversation_history) == 2
+    assert all(e.type != ContextType.CONVERSATION for e in context.elements)
+    with pytest.raises(AttributeError):
+        context.extra = 1
+
+
+def test_bytes_round_trip_with_msgpack():
+    original = build_context()
+    data = original.to_bytes()
+    assert data[:1] == b"M"
+    assert len(data) < len(original.to_json())
+    restored = MCPContext.from_bytes(data)
+    assert restored.to_dict()["conversation_history"] == original.to_dict()["conversation_history"]
+    assert restored.elements[2].content[3] == "numeric key"
+
+
+def test_bytes_round_trip_without_msgpack(monkeypatch):
+    monkeypatch.setattr(mcp.context, "msgpack", None)
+    original = MCPContext()
+    original.add_document("Notes")
+    original.add_conversation_message("user", "Question?")
+    data = original.to_bytes()
+    assert data[:1] == b"J"
+    assert_same(MCPContext.from_bytes(data), original)
+
+
+def test_from_dict_reads_older_serializations():
+    legacy = {
+        "user_id": "user-1",
+        "session_id": None,
+        "conversation_history": [{"role": "user", "content": "Hello!", "timestamp": 1.0, "message_id": "1"}],
+        "elements": [
+            {"content": "Be nice", "type": "system_instruction",
+             "metadata": {"created_at": 1.0, "source": "system", "importance": 10, "ttl": None,
+                          "mime_type": "text/plain"}},
+            {"content": {"role": "user", "content": "Hello!"}, "type": "conversation",
+             "metadata": {"created_at": 1.0, "source": "conversation", "importance": 5, "ttl": None,
+                          "mime_type": "text/plain"}}
+        ]
+    }
+    context = MCPContext.from_json(json.dumps(legacy))
+    assert [m.content for m in context.conversation_history] == ["Hello!"]
+    assert [e.type for e in context.elements] == [ContextType.SYSTEM_INSTRUCTION]
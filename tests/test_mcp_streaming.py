@@ -0,0 +1,34 @@
+import asyncio
+
+from mcp.context import MCPContext
+from mcp.model_adapter import MCPModelAdapter, MCPModelResponse, MCPModelStream
+
+
+class EchoAdapter(MCPModelAdapter):
+    def format_context_for_model(self, context):
+        return []
+
+    async def generate_with_context(self, prompt, context):
+        return MCPModelResponse(text=f"echo: {prompt}", usage_metrics={'total_tokens': 7})
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_stream_collects_text_and_finalizes_usage():
+    async def chunks():
+        for part in ["Hel", "", "lo"]:
+            yield part
+
+    stream = MCPModelStream(chunks(), lambda text: {'total_tokens': len(text)})
+    assert asyncio.run(collect(stream)) == ["Hel", "lo"]
+    assert stream.done
+    assert stream.text == "Hello"
+    assert stream.usage_metrics == {'total_tokens': 5}
+
+
+def test_default_stream_falls_back_to_single_chunk():
+    stream = EchoAdapter().stream_with_context("hi", MCPContext())
+    assert asyncio.run(collect(stream)) == ["echo: hi"]
+    assert stream.usage_metrics == {'total_tokens': 7}
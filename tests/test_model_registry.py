@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from mcp.context import MCPContextFactory
+import mcp.model_adapter as model_adapter
+from mcp.model_adapter import GeminiAdapter, MCPModelAdapter, MCPModelRegistry, MCPModelResponse, ModelCatalog
+
+
+class CountingAdapter(MCPModelAdapter):
+    created = 0
+
+    def __init__(self, model_name="default"):
+        CountingAdapter.created += 1
+        self.model_name = model_name
+
+    def format_context_for_model(self, context):
+        return []
+
+    async def generate_with_context(self, prompt, context):
+        return MCPModelResponse(text=prompt)
+
+
+def test_registry_shares_one_adapter_per_config():
+    CountingAdapter.created = 0
+    MCPModelRegistry.register("counting", CountingAdapter)
+
+    first = MCPModelRegistry.get("counting")
+    assert MCPModelRegistry.get("counting") is first
+    other = MCPModelRegistry.get("counting", model_name="other")
+    assert other is not first and other.model_name == "other"
+    assert MCPModelRegistry.get("counting", model_name="other") is other
+    assert CountingAdapter.created == 2
+
+    # Re-registering replaces the pooled instances
+    MCPModelRegistry.register("counting", CountingAdapter)
+    assert MCPModelRegistry.get("counting") is not first
+
+
+def test_registry_lock_is_free_while_an_adapter_builds():
+    started, release = threading.Event(), threading.Event()
+
+    class SlowAdapter(CountingAdapter):
+        def __init__(self, model_name="default"):
+            started.set()
+            release.wait(2)
+            super().__init__(model_name)
+
+    MCPModelRegistry.register("slow", SlowAdapter)
+    MCPModelRegistry.register("counting", CountingAdapter)
+    thread = MCPModelRegistry.warm_up("slow")
+    assert started.wait(1)
+    # Other adapters can be created while the slow one is still building
+    assert MCPModelRegistry.get("counting", model_name="during-warm-up").model_name == "during-warm-up"
+    release.set()
+    thread.join(2)
+    assert MCPModelRegistry.get("slow").model_name == "default"
+
+
+def test_gemini_adapter_resolves_models_from_the_current_catalog(monkeypatch):
+    catalog = ModelCatalog(lambda: ["models/gemini-1.5-flash"])
+    monkeypatch.setattr(model_adapter, "get_gemini_catalog", lambda: catalog)
+    adapter = GeminiAdapter.__new__(GeminiAdapter)
+
+    assert adapter._resolve_model_name("gemini-2.0-flash") == "models/gemini-1.5-flash"
+
+    # A refreshed catalog reaches existing (pooled) adapters
+    catalog._models = ["models/gemini-2.0-flash"]
+    assert adapter.available_models == ["models/gemini-2.0-flash"]
+    assert adapter._resolve_model_name("gemini-2.0-flash") == "gemini-2.0-flash"
+
+
+def test_catalog_fetches_once_then_refreshes_in_background():
+    calls = []
+    refreshed = threading.Event()
+
+    def list_models():
+        calls.append(1)
+        if len(calls) > 1:
+            refreshed.set()
+            return ["models/new"]
+        return ["models/old"]
+
+    catalog = ModelCatalog(list_models, ttl=0.05)
+    assert catalog.models() == ["models/old"]
+    assert catalog.models() == ["models/old"]
+    assert len(calls) == 1
+
+    time.sleep(0.06)
+    # Stale lookups still answer immediately from the cached list
+    assert catalog.models() == ["models/old"]
+    assert refreshed.wait(1)
+    time.sleep(0.01)
+    assert catalog.models() == ["models/new"]
+
+
+def test_catalog_keeps_old_list_when_refresh_fails():
+    results = [["models/a"]]
+
+    def list_models():
+        if results:
+            return results.pop()
+        raise RuntimeError("network down")
+
+    catalog = ModelCatalog(list_models, ttl=0)
+    assert catalog.models() == ["models/a"]
+    catalog._fetch()
+    assert catalog.models() == ["models/a"]
+
+
+class BatchAdapter(MCPModelAdapter):
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    def format_context_for_model(self, context):
+        return []
+
+    async def generate_with_context(self, prompt, context):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01 if prompt != "slow" else 0.03)
+        self.active -= 1
+        if prompt == "fail":
+            raise ValueError("bad prompt")
+        return MCPModelResponse(text=prompt.upper(), usage_metrics={"total_tokens": 1})
+
+
+def test_generate_batch_runs_concurrently_and_keeps_order():
+    adapter = BatchAdapter()
+    prompts = ["slow", "fail", "fast"]
+
+    responses = asyncio.run(adapter.generate_batch(prompts, MCPContextFactory.create()))
+
+    assert adapter.peak == 3
+    assert [response.text for response in responses] == ["SLOW", "", "FAST"]
+    assert isinstance(responses[1].error, ValueError)
+    assert responses[0].error is None and responses[2].error is None
+
+
+def test_generate_batch_limits_concurrency_and_checks_contexts():
+    adapter = BatchAdapter()
+    contexts = [MCPContextFactory.create() for _ in range(4)]
+
+    asyncio.run(adapter.generate_batch(["a", "b", "c", "d"], contexts, concurrency=2))
+    assert adapter.peak == 2
+
+    with pytest.raises(ValueError):
+        asyncio.run(adapter.generate_batch(["a", "b"], contexts))
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+import model_scheduler
+from model_scheduler import (
+    ModelOverloaded, ModelScheduler, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, TokenBucket,
+    is_retryable, model_priority
+)
+
+
+class RateLimited(Exception):
+    code = 429
+
+
+def test_concurrency_is_bounded():
+    scheduler = ModelScheduler(concurrency=2)
+    active = peak = 0
+
+    async def call():
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return "ok"
+
+    async def main():
+        return await asyncio.gather(*(scheduler.call(call, "m") for _ in range(6)))
+
+    assert asyncio.run(main()) == ["ok"] * 6
+    assert peak == 2
+
+
+def test_interactive_calls_go_before_background_ones():
+    scheduler = ModelScheduler(concurrency=1)
+    order = []
+
+    def call(name):
+        async def run():
+            order.append(name)
+            await asyncio.sleep(0.01)
+        return run
+
+    async def main():
+        first = asyncio.ensure_future(scheduler.call(call("first"), "m"))
+        await asyncio.sleep(0)
+        with model_priority(PRIORITY_BACKGROUND):
+            background = asyncio.ensure_future(scheduler.call(call("background"), "m"))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(scheduler.call(call("interactive"), "m"))
+        await asyncio.gather(first, background, interactive)
+
+    asyncio.run(main())
+    assert order == ["first", "interactive", "background"]
+
+
+def test_rate_limited_calls_are_retried(monkeypatch):
+    monkeypatch.setattr(model_scheduler, 'MODEL_RETRY_BASE_DELAY', 0.001)
+    scheduler = ModelScheduler()
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimited("429 Resource has been exhausted")
+        return "done"
+
+    async def not_found():
+        attempts.append(1)
+        raise ValueError("404 model not found")
+
+    assert asyncio.run(scheduler.call(flaky, "m")) == "done"
+    assert len(attempts) == 3
+
+    attempts.clear()
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.call(not_found, "m"))
+    assert len(attempts) == 1
+
+
+def test_full_queue_sheds_background_work_first():
+    scheduler = ModelScheduler(concurrency=1, max_queue=1)
+    release = None
+
+    async def hold():
+        await release.wait()
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        running = asyncio.ensure_future(scheduler.call(hold, "m"))
+        await asyncio.sleep(0)
+        background = asyncio.ensure_future(scheduler.call(hold, "m", priority=PRIORITY_BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(scheduler.call(hold, "m", priority=PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+
+        with pytest.raises(ModelOverloaded):
+            await background
+        with pytest.raises(ModelOverloaded):
+            await scheduler.call(hold, "m", priority=PRIORITY_BACKGROUND)
+
+        release.set()
+        await asyncio.gather(running, interactive)
+
+    asyncio.run(main())
+
+
+def test_token_bucket_and_retryable_errors():
+    bucket = TokenBucket(60)  # one per second
+    bucket.consume(60, now=bucket.updated)
+    assert bucket.wait_time(1, now=bucket.updated) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now=bucket.updated + 1) == 0
+
+    assert is_retryable(RateLimited())
+    assert is_retryable(Exception("503 The service is currently unavailable"))
+    assert not is_retryable(Exception("400 invalid argument"))
+    assert not is_retryable(ModelOverloaded("busy"))
@@ -0,0 +1,37 @@
+from mcp.context import MCPContext
+from mcp.prompts import (
+    IDENTITY_INFO, IDENTITY_KEYWORDS, LANGUAGE_INSTRUCTIONS, NATURAL_INSTRUCTIONS,
+    build_prompt_parts, format_context_messages, is_identity_question
+)
+
+
+def test_identity_matcher_agrees_with_keyword_scan():
+    prompts = ["What's YOUR NAME?", "who created you", "Kto cię stworzył?",
+               "tell me about liya", "Explain photosynthesis", ""]
+    for prompt in prompts:
+        expected = any(k.lower() in prompt.lower() for k in IDENTITY_KEYWORDS)
+        assert is_identity_question(prompt) == expected
+
+
+def test_prompt_parts_match_previous_layout():
+    natural, instruction = NATURAL_INSTRUCTIONS['pl'], LANGUAGE_INSTRUCTIONS['pl']
+    assert "".join(build_prompt_parts("Explain gravity", 'pl')) == \
+        f"{natural}\n\nExplain gravity\n\n{instruction}"
+
+    identity = IDENTITY_INFO['en']
+    en_natural, en_instruction = NATURAL_INSTRUCTIONS['en'], LANGUAGE_INSTRUCTIONS['en']
+    assert "".join(build_prompt_parts("who are you", 'xx', "Be brief.")) == \
+        f"Be brief.\n\n{identity}\n\n{en_natural}\n\n{en_instruction}\n\nUser request: who are you"
+
+
+def test_context_messages_use_separate_parts():
+    context = MCPContext()
+    context.add_system_instruction("Be helpful.")
+    context.add_conversation_message("user", "Summarize the file")
+    context.add_document("Document body")
+
+    messages = format_context_messages(context)
+    assert messages[0]["parts"][0]["text"] == "System Instructions:\nBe helpful."
+    assert messages[1]["role"] == "model"
+    assert [part["text"] for part in messages[-1]["parts"]] == \
+        ["Summarize the file", "\n\nDocument content:\nDocument body"]
@@ -0,0 +1,122 @@
+import asyncio
+import json
+
+import pytest
+
+from proofreading import (chunk_text, merge_chunk_results, parse_proofread_response, proofread_with_mcp,
+                         proofread_warning)
+from mcp.model_adapter import MCPModelAdapter, MCPModelResponse
+
+
+TEXT = "\n\n".join(
+    " ".join(f"Paragraph {p} sentence {s} has teh typo." for s in range(8))
+    for p in range(10)
+)
+
+
+def test_chunks_cover_text_on_sentence_boundaries():
+    chunks = chunk_text(TEXT, max_chars=500, overlap=100)
+    assert len(chunks) > 1
+    # Cores tile the text exactly once
+    assert "".join(TEXT[c.core_start:c.end] for c in chunks) == TEXT
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.core_start == previous.end
+        assert 0 < chunk.core_start - chunk.start <= 100
+        assert chunk.text == TEXT[chunk.start:chunk.end]
+        # Cuts land after a sentence end
+        assert TEXT[:chunk.core_start].rstrip().endswith('.')
+
+
+def test_short_text_is_a_single_chunk():
+    chunks = chunk_text("Short text.", max_chars=500)
+    assert len(chunks) == 1 and chunks[0].text == "Short text."
+
+
+def test_merge_maps_offsets_and_dedupes_overlap():
+    chunks = chunk_text(TEXT, max_chars=500, overlap=100)
+    results = [
+        {'corrected_text': '', 'corrections': [
+            {'original': 'teh', 'corrected': 'the', 'explanation': 'typo'}
+            for _ in range(chunk.text.count('teh'))
+        ] + [{'original': 'not in text', 'corrected': 'x'}]}
+        for chunk in chunks
+    ]
+    merged = merge_chunk_results(TEXT, chunks, results)
+    located = [c for c in merged['corrections'] if c['offset'] is not None]
+
+    assert len(located) == TEXT.count('teh')
+    assert all(TEXT[c['offset']:c['offset'] + 3] == 'teh' for c in located)
+    assert merged['corrected_text'] == TEXT.replace('teh', 'the')
+    # Unlocated corrections are reported once
+    assert [c['original'] for c in merged['corrections'] if c['offset'] is None] == ['not in text']
+
+
+def test_parse_falls_back_to_lines():
+    result = parse_proofread_response("original: teh\ncorrected: the\nexplanation: typo", "teh")
+    assert result == {'corrected_text': 'teh', 'corrections': [
+        {'original': 'teh', 'corrected': 'the', 'explanation': 'typo'}
+    ]}
+
+
+class FakeProofreader(MCPModelAdapter):
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    def format_context_for_model(self, context):
+        return []
+
+    async def generate_with_context(self, prompt, context):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        chunk = context.conversation_history[-1].content
+        corrections = [{'original': 'teh', 'corrected': 'the'}] * chunk.count('teh')
+        return MCPModelResponse(text=json.dumps({'corrections': corrections}),
+                                usage_metrics={'total_tokens': 10})
+
+
+def test_proofread_with_mcp_runs_chunks_concurrently(monkeypatch):
+    adapter = FakeProofreader()
+    monkeypatch.setattr('mcp.model_adapter.MCPModelFactory.create', lambda model_name: adapter)
+
+    result = asyncio.run(proofread_with_mcp(TEXT, max_chars=500, overlap=100, concurrency=3))
+
+    assert result['chunks'] > 3
+    assert adapter.peak == 3
+    assert result['tokens_used'] == 10 * result['chunks']
+    assert result['corrected_text'] == TEXT.replace('teh', 'the')
+    assert not result['truncated']
+    assert result['failed_chunks'] == []
+    assert proofread_warning(result) is None
+
+
+class FlakyProofreader(FakeProofreader):
+    def __init__(self, failing):
+        super().__init__()
+        self.failing = failing
+
+    async def generate_with_context(self, prompt, context):
+        if self.failing(context.conversation_history[-1].content):
+            raise RuntimeError("model unavailable")
+        return await super().generate_with_context(prompt, context)
+
+
+def test_failed_chunks_are_reported(monkeypatch):
+    adapter = FlakyProofreader(lambda chunk: chunk.startswith("Paragraph 0"))
+    monkeypatch.setattr('mcp.model_adapter.MCPModelFactory.create', lambda model_name: adapter)
+
+    result = asyncio.run(proofread_with_mcp(TEXT, max_chars=500, overlap=100))
+
+    assert result['failed_chunks'] and 1 in result['failed_chunks']
+    assert len(result['failed_chunks']) < result['chunks']
+    assert "could not be proofread" in proofread_warning(result)
+
+
+def test_all_chunks_failing_raises(monkeypatch):
+    adapter = FlakyProofreader(lambda chunk: True)
+    monkeypatch.setattr('mcp.model_adapter.MCPModelFactory.create', lambda model_name: adapter)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(proofread_with_mcp(TEXT, max_chars=500, overlap=100))
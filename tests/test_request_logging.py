@@ -0,0 +1,78 @@
+import io
+import json
+import logging
+
+from flask import Flask
+
+import request_logging
+from request_logging import (
+    JsonFormatter, RequestContextFilter, get_logger, init_request_logging,
+    start_request, user_content
+)
+
+
+class Exploding:
+    def __repr__(self):
+        raise AssertionError('formatted while debug was off')
+
+
+def capture(category):
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(RequestContextFilter())
+    logger = get_logger(category)
+    logger.logger.addHandler(handler)
+    logger.logger.setLevel(logging.INFO)
+    return logger, stream
+
+
+def records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_debug_is_gated_per_request_without_formatting():
+    log, stream = capture('test_gate')
+    start_request('req-1', debug=False)
+    log.debug('never shown %r', Exploding())
+    log.info('shown')
+
+    start_request('req-2', debug=True)
+    log.debug('sampled %s', 'yes')
+
+    lines = records(stream)
+    assert [(r['msg'], r['request_id'], r['level']) for r in lines] == [
+        ('shown', 'req-1', 'INFO'), ('sampled yes', 'req-2', 'DEBUG')
+    ]
+    assert lines[0]['category'] == 'test_gate'
+
+
+def test_user_content_is_capped_unless_debugging(monkeypatch):
+    monkeypatch.setattr(request_logging, 'LOG_MAX_CONTENT_BYTES', 16)
+    document = 'ż' * 10000
+
+    start_request(debug=False)
+    capped = str(user_content(document))
+    assert len(capped.split('...')[0].encode('utf-8')) <= 16
+    assert len(str(user_content({'content': document, 'file_id': 'x'}))) <= 19
+
+    start_request(debug=True)
+    assert str(user_content(document)) == document
+
+
+def test_invalid_request_ids_are_replaced():
+    assert start_request('abc-123') == 'abc-123'
+    assert start_request('bad id\ninjected') != 'bad id\ninjected'
+
+
+def test_flask_hooks_echo_request_id():
+    app = Flask(__name__)
+    init_request_logging(app)
+
+    @app.route('/ping')
+    def ping():
+        return 'pong'
+
+    client = app.test_client()
+    assert client.get('/ping', headers={'X-Request-ID': 'trace-42'}).headers['X-Request-ID'] == 'trace-42'
+    assert client.get('/ping').headers['X-Request-ID']
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from flask import Flask
+
+import request_metrics
+from request_metrics import init_request_metrics, render_prometheus, set_route, snapshot, span, timed
+
+
+@pytest.fixture(autouse=True)
+def clean_histograms():
+    request_metrics.reset()
+    yield
+    request_metrics.reset()
+
+
+def test_spans_are_recorded_per_route_and_phase():
+    set_route('/study/chat')
+    with span('firestore.chat_history'):
+        pass
+
+    @timed('gemini')
+    async def call_model():
+        await asyncio.sleep(0.01)
+
+    asyncio.run(call_model())
+
+    data = snapshot()
+    assert data[('/study/chat', 'firestore.chat_history')][2] == 1
+    counts, total, count = data[('/study/chat', 'gemini')]
+    assert count == 1 and total >= 0.01
+    assert sum(counts) == 1
+
+
+def test_prometheus_rendering_is_cumulative():
+    for seconds in (0.001, 0.2, 100):
+        request_metrics.observe('gemini', seconds, route='/x')
+    text = render_prometheus()
+    assert '# TYPE lightyear_phase_duration_seconds histogram' in text
+    assert 'lightyear_phase_duration_seconds_bucket{route="/x",phase="gemini",le="0.005"} 1' in text
+    assert 'lightyear_phase_duration_seconds_bucket{route="/x",phase="gemini",le="0.25"} 2' in text
+    assert 'lightyear_phase_duration_seconds_bucket{route="/x",phase="gemini",le="+Inf"} 3' in text
+    assert 'lightyear_phase_duration_seconds_count{route="/x",phase="gemini"} 3' in text
+
+
+def test_request_hook_labels_by_url_rule():
+    app = Flask(__name__)
+    init_request_metrics(app)
+
+    @app.route('/items/<item_id>')
+    def item(item_id):
+        with span('lookup'):
+            return item_id
+
+    client = app.test_client()
+    client.get('/items/1')
+    client.get('/items/2')
+
+    data = snapshot()
+    assert data[('/items/<item_id>', 'request')][2] == 2
+    assert data[('/items/<item_id>', 'lookup')][2] == 2
+
+
+def test_metrics_token(monkeypatch):
+    monkeypatch.setattr(request_metrics, 'METRICS_TOKEN', '')
+    assert not request_metrics.metrics_token_valid('Bearer ')
+    monkeypatch.setattr(request_metrics, 'METRICS_TOKEN', 's3cret')
+    assert request_metrics.metrics_token_valid('Bearer s3cret')
+    assert not request_metrics.metrics_token_valid('Bearer wrong')
+
+
+def test_gauges_and_counters_are_rendered():
+    request_metrics.set_gauge('model_queue_depth', 2, priority='batch')
+    request_metrics.increment('model_call_retries_total', model='gemini-2.0-flash')
+    request_metrics.increment('model_call_retries_total', model='gemini-2.0-flash')
+    text = render_prometheus()
+    assert '# TYPE lightyear_model_queue_depth gauge' in text
+    assert 'lightyear_model_queue_depth{priority="batch"} 2' in text
+    assert 'lightyear_model_call_retries_total{model="gemini-2.0-flash"} 2' in text
@@ -0,0 +1,76 @@
+import time
+
+from mcp.response_cache import ResponseCache, estimate_similarity, make_cache_keys, minhash_signature
+
+QUESTION = "Please summarize the main arguments of this document in a few short bullet points for my exam revision"
+
+
+def messages(final_text, document="Document content:\nPhotosynthesis turns light into chemical energy."):
+    return [
+        {"role": "user", "parts": [{"text": "System Instructions:\nBe concise."}]},
+        {"role": "model", "parts": [{"text": "I'll follow these instructions."}]},
+        {"role": "user", "parts": [{"text": document}, {"text": final_text}]}
+    ]
+
+
+def test_keys_ignore_whitespace_but_not_model_or_config():
+    keys = make_cache_keys("gemini-2.0-flash", messages(QUESTION))
+    assert keys == make_cache_keys("gemini-2.0-flash", messages("  " + QUESTION.replace(" ", "\n ")))
+    assert keys.exact != make_cache_keys("gemini-1.5-flash", messages(QUESTION)).exact
+    assert keys.exact != make_cache_keys("gemini-2.0-flash", messages(QUESTION), {"temperature": 0.2}).exact
+    assert keys.final_text == QUESTION
+
+
+def test_exact_hit_is_not_billed():
+    cache = ResponseCache(db_path=None)
+    keys = make_cache_keys("m", messages(QUESTION))
+    assert cache.get(keys) is None
+
+    cache.put(keys, "- point one", {"total_tokens": 120})
+    hit = cache.get(keys)
+    assert hit.text == "- point one"
+    assert hit.match == "exact"
+    assert hit.usage_metrics["total_tokens"] == 0
+    assert hit.usage_metrics["cached_total_tokens"] == 120
+
+
+def test_lru_eviction_and_ttl():
+    cache = ResponseCache(max_entries=2, db_path=None)
+    keys = [make_cache_keys("m", messages(f"question {i}")) for i in range(3)]
+    for k in keys:
+        cache.put(k, "answer", {})
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) is not None
+
+    expiring = ResponseCache(ttl=0.01, db_path=None)
+    expiring.put(keys[0], "answer", {})
+    time.sleep(0.02)
+    assert expiring.get(keys[0]) is None
+
+
+def test_sqlite_tier_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "responses.db")
+    keys = make_cache_keys("m", messages(QUESTION))
+    ResponseCache(db_path=path).put(keys, "stored", {"total_tokens": 5})
+
+    hit = ResponseCache(db_path=path).get(keys)
+    assert hit.text == "stored"
+
+
+def test_approximate_match_requires_same_context():
+    cache = ResponseCache(db_path=None, approximate=True, similarity=0.6)
+    cache.put(make_cache_keys("m", messages(QUESTION)), "summary", {"total_tokens": 50})
+
+    similar = QUESTION.replace("exam revision", "exam revision please")
+    hit = cache.get(make_cache_keys("m", messages(similar)))
+    assert hit is not None and hit.match == "approximate"
+
+    other_document = make_cache_keys("m", messages(similar, document="Document content:\nThe French Revolution."))
+    assert cache.get(other_document) is None
+    assert cache.get(make_cache_keys("m", messages("Translate this document into Polish"))) is None
+
+
+def test_minhash_similarity_estimate():
+    a = minhash_signature(QUESTION)
+    assert estimate_similarity(a, minhash_signature(QUESTION.upper())) == 1.0
+    assert estimate_similarity(a, minhash_signature("completely unrelated words about cooking pasta")) < 0.2
@@ -0,0 +1,64 @@
+import asyncio
+
+from mcp.single_flight import SingleFlight, make_flight_key, shared_usage
+
+
+def test_identical_concurrent_calls_run_once():
+    flights = SingleFlight()
+    calls = 0
+
+    async def generate():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        key = make_flight_key("gemini", [{"role": "user", "parts": ["hi"]}])
+        return await asyncio.gather(*(flights.do(key, generate) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert calls == 1
+    assert [result for result, _ in results] == ["answer"] * 3
+    assert [shared for _, shared in results] == [False, True, True]
+    assert flights.in_flight() == 0
+
+
+def test_distinct_keys_and_later_calls_are_not_shared():
+    flights = SingleFlight()
+    calls = []
+
+    async def generate(name):
+        calls.append(name)
+        await asyncio.sleep(0)
+        return name
+
+    async def main():
+        await asyncio.gather(flights.do("a", lambda: generate("a")), flights.do("b", lambda: generate("b")))
+        return await flights.do("a", lambda: generate("a"))
+
+    assert asyncio.run(main()) == ("a", False)
+    assert calls == ["a", "b", "a"]
+
+
+def test_errors_reach_every_waiter():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(flights.do("k", fail), flights.do("k", fail), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flights.in_flight() == 0
+
+
+def test_shared_usage_bills_nothing():
+    usage = shared_usage({"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15})
+    assert usage["total_tokens"] == 0
+    assert usage["coalesced"] == 1
+    assert usage["shared_total_tokens"] == 15
+    assert make_flight_key("m", [1]) != make_flight_key("m", [2])
@@ -0,0 +1,79 @@
+import pytest
+from unittest.mock import patch
+
+import subscription_utils
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    subscription_utils.invalidate_user_usage_cache()
+    yield
+    subscription_utils.invalidate_user_usage_cache()
+
+
+@patch('subscription_utils.get_user_daily_token_usage')
+@patch('subscription_utils.get_user_subscription')
+def test_cached_plan_and_usage_reads_once(mock_sub, mock_usage):
+    mock_sub.return_value = {'plan': 'premium'}
+    mock_usage.return_value = 1200
+
+    assert subscription_utils.get_cached_plan_and_usage('user1') == ('premium', 1200)
+    assert subscription_utils.get_cached_plan_and_usage('user1') == ('premium', 1200)
+
+    # Second lookup should be served from the cache
+    assert mock_sub.call_count == 1
+    assert mock_usage.call_count == 1
+
+
+@patch('subscription_utils.get_user_daily_token_usage')
+@patch('subscription_utils.get_user_subscription')
+def test_cache_tracks_usage_and_plan_updates(mock_sub, mock_usage):
+    mock_sub.return_value = {'plan': 'free'}
+    mock_usage.return_value = 100
+    subscription_utils.get_cached_plan_and_usage('user1')
+
+    subscription_utils._add_cached_usage('user1', 50)
+    subscription_utils._set_cached_plan('user1', 'premium')
+
+    assert subscription_utils.get_cached_plan_and_usage('user1') == ('premium', 150)
+    assert mock_usage.call_count == 1
+
+
+@patch('subscription_utils.get_user_daily_token_usage')
+@patch('subscription_utils.get_user_subscription')
+def test_invalidate_forces_reload(mock_sub, mock_usage):
+    mock_sub.return_value = {'plan': 'free'}
+    mock_usage.return_value = 10
+    subscription_utils.get_cached_plan_and_usage('user1')
+
+    subscription_utils.invalidate_user_usage_cache('user1')
+    mock_usage.return_value = 20
+
+    assert subscription_utils.get_cached_plan_and_usage('user1') == ('free', 20)
+    assert mock_usage.call_count == 2
+
+
+@patch('subscription_utils.increment_user_token_usage')
+def test_zero_token_calls_are_not_billed(mock_increment):
+    assert subscription_utils.track_token_usage_for_api_call('user1', 'hi', 'cached', 0) == 0
+    mock_increment.assert_not_called()
+
+
+@patch('subscription_utils.get_db')
+@patch('subscription_utils.get_user_daily_token_usage')
+@patch('subscription_utils.get_user_subscription')
+def test_limit_check_counts_queued_usage(mock_sub, mock_usage, mock_db):
+    mock_sub.return_value = {'plan': 'free'}
+    mock_usage.return_value = 0
+    mock_db.return_value.collection.return_value.document.return_value.get.return_value.exists = False
+
+    with patch('write_behind.write') as mock_write:
+        assert subscription_utils.check_user_token_limit('user1')[0]
+        subscription_utils.increment_user_token_usage('user1', subscription_utils.FREE_PLAN_DAILY_LIMIT)
+        subscription_utils.increment_user_token_usage('user1', 10)
+
+    # The queued increments count before Firestore has them
+    assert subscription_utils.check_user_token_limit('user1') == (False, -10)
+    daily_writes = [c.args[1] for c in mock_write.call_args_list if c.args[0].startswith('token_usage/')]
+    assert 'created_at' in daily_writes[0]
+    assert 'created_at' not in daily_writes[1]
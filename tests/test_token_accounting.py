@@ -0,0 +1,57 @@
+import re
+from types import SimpleNamespace
+
+import pytest
+
+import token_accounting
+from token_accounting import StreamTokenCounter, count_tokens, count_tokens_batch, usage_for_call
+
+TEXT = "The quick brown fox jumps over the lazy dog.  Then it naps,\nquietly, in the sun."
+
+
+class WordEncoder:
+    """Stands in for tiktoken: one token per word (with its leading space) or punctuation mark."""
+    pattern = re.compile(r"\s*\w+|\s*[^\w\s]|\s+")
+
+    def encode_ordinary(self, text):
+        return self.pattern.findall(text)
+
+    def encode_ordinary_batch(self, texts):
+        return [self.encode_ordinary(text) for text in texts]
+
+
+@pytest.fixture
+def encoder(monkeypatch):
+    monkeypatch.setattr(token_accounting, '_encoder', WordEncoder())
+    monkeypatch.setattr(token_accounting, '_encoder_loaded', True)
+
+
+def test_counts_use_the_shared_encoder(encoder):
+    assert count_tokens("hello world!") == 3
+    assert count_tokens_batch(["hello world!", "", "a b"]) == [3, 0, 2]
+
+
+def test_falls_back_to_estimate_without_encoder(monkeypatch):
+    monkeypatch.setattr(token_accounting, '_encoder', None)
+    monkeypatch.setattr(token_accounting, '_encoder_loaded', True)
+    assert count_tokens("x" * 40) == 10
+    assert count_tokens_batch(["x" * 8, "x" * 4]) == [2, 1]
+
+
+def test_stream_counter_matches_counting_the_whole_text(encoder):
+    for size in (1, 3, 7, 20):
+        counter = StreamTokenCounter()
+        for i in range(0, len(TEXT), size):
+            counter.add(TEXT[i:i + size])
+        assert counter.total == count_tokens(TEXT)
+
+
+def test_usage_prefers_reported_metadata(encoder):
+    messages = [{"role": "user", "parts": [{"text": "hello there"}, {"text": "friend"}]}]
+    response = SimpleNamespace(usage_metadata=SimpleNamespace(
+        prompt_token_count=12, candidates_token_count=30, total_token_count=42))
+
+    assert usage_for_call(messages, "hi you", response) == {
+        "prompt_tokens": 12, "completion_tokens": 30, "total_tokens": 42}
+    assert usage_for_call(messages, "hi you", SimpleNamespace()) == {
+        "prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
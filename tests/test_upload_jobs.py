@@ -0,0 +1,70 @@
+import time
+
+from upload_jobs import UploadJobQueue, JOB_DONE, JOB_FAILED
+
+
+def wait_for(queue, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in (JOB_DONE, JOB_FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError('job did not finish')
+
+
+def make_queue(tmp_path, extractor, stored):
+    def store_document(file_id, text, metadata):
+        stored[file_id] = (text, metadata)
+        return {'file_id': file_id, 'content_hash': 'hash', 'content_length': len(text)}
+
+    return UploadJobQueue(max_workers=1, jobs_dir=str(tmp_path),
+                          extractor=extractor, store_document=store_document)
+
+
+def test_job_reports_progress_and_preview(tmp_path):
+    def extractor(file_path, progress_callback=None):
+        for page in range(1, 4):
+            progress_callback(page, 3)
+        return 'x' * 2000
+
+    stored = {}
+    queue = make_queue(tmp_path, extractor, stored)
+    job = wait_for(queue, queue.submit('user-1', 'doc.pdf', 'doc.pdf'))
+
+    assert job['status'] == JOB_DONE
+    assert (job['pages_processed'], job['total_pages']) == (3, 3)
+    assert job['content_length'] == 2000
+    assert len(job['preview']) == 500
+    assert stored[job['file_id']][1] == {'filename': 'doc.pdf', 'user_id': 'user-1'}
+
+
+def test_status_is_readable_from_another_process(tmp_path):
+    queue = make_queue(tmp_path, lambda path, progress_callback=None: 'text', {})
+    job_id = queue.submit('user-1', 'doc.txt', 'doc.txt')
+    wait_for(queue, job_id)
+
+    # A second queue over the same directory stands in for another worker
+    other = UploadJobQueue(max_workers=1, jobs_dir=str(tmp_path))
+    assert other.get(job_id)['status'] == JOB_DONE
+    assert other.get('../../etc/passwd') is None
+
+
+def test_failed_extraction(tmp_path):
+    def extractor(file_path, progress_callback=None):
+        raise RuntimeError('corrupt file')
+
+    queue = make_queue(tmp_path, extractor, {})
+    job = wait_for(queue, queue.submit('user-1', 'bad.pdf', 'bad.pdf'))
+    assert job['status'] == JOB_FAILED
+    assert 'corrupt file' in job['error']
+
+
+def test_uploaded_file_is_removed_after_extraction(tmp_path):
+    upload = tmp_path / 'upload.txt'
+    upload.write_text('text')
+    queue = make_queue(tmp_path, lambda path, progress_callback=None: open(path).read(), {})
+    job = wait_for(queue, queue.submit('user-1', str(upload), 'upload.txt'))
+
+    assert job['status'] == JOB_DONE
+    assert not upload.exists()
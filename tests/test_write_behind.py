@@ -0,0 +1,119 @@
+import json
+import os
+
+import write_behind
+from write_behind import SERVER_TIMESTAMP, WriteBehindQueue, client_timestamp, coalesce, increment, ordered_stamp
+
+
+class FakeFirestore:
+    SERVER_TIMESTAMP = object()
+
+    class Increment:
+        def __init__(self, amount):
+            self.amount = amount
+
+
+class FakeRef:
+    def __init__(self, path):
+        self.path = path
+
+    def collection(self, name):
+        return FakeRef(f"{self.path}/{name}")
+
+    def document(self, name):
+        return FakeRef(f"{self.path}/{name}")
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, ref, data, merge=False):
+        self.writes.append((ref.path, data, merge))
+
+    def commit(self):
+        if self.db.fail:
+            raise RuntimeError("unavailable")
+        self.db.commits.append(self.writes)
+
+
+class FakeDB:
+    def __init__(self):
+        self.commits = []
+        self.fail = False
+
+    def collection(self, name):
+        return FakeRef(name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def make_queue(tmp_path, db, **kwargs):
+    return WriteBehindQueue(spool_dir=str(tmp_path), flush_interval=60,
+                            backend=lambda: (db, FakeFirestore), **kwargs)
+
+
+def test_coalesce_merges_updates_per_document():
+    ops = [
+        {"path": "a", "data": {"tokens": increment(5), "x": 1}, "merge": True},
+        {"path": "b", "data": {"content": "hi"}, "merge": False},
+        {"path": "a", "data": {"tokens": increment(7), "x": 2}, "merge": True},
+    ]
+    merged = coalesce(ops)
+    assert [op["path"] for op in merged] == ["a", "b"]
+    assert merged[0]["data"] == {"tokens": increment(12), "x": 2}
+
+
+def test_flush_commits_one_batch_and_clears_spool(tmp_path):
+    db = FakeDB()
+    queue = make_queue(tmp_path, db)
+    queue.write("users/u1/chat_history/m1", {"content": "hi", "timestamp": SERVER_TIMESTAMP})
+    queue.write("token_usage_monthly/2026-10", {"tokens_used": increment(10)}, merge=True)
+    queue.write("token_usage_monthly/2026-10", {"tokens_used": increment(5)}, merge=True)
+    assert queue.has_pending("users/u1/") and len(os.listdir(tmp_path)) == 1
+
+    assert queue.flush() == 3
+    [writes] = db.commits
+    assert [path for path, _, _ in writes] == ["users/u1/chat_history/m1", "token_usage_monthly/2026-10"]
+    assert writes[0][1]["timestamp"] is FakeFirestore.SERVER_TIMESTAMP
+    assert writes[1][1]["tokens_used"].amount == 15 and writes[1][2] is True
+    assert os.listdir(tmp_path) == []
+
+
+def test_failed_commit_keeps_writes_for_retry(tmp_path):
+    db = FakeDB()
+    db.fail = True
+    queue = make_queue(tmp_path, db)
+    queue.write("users/u1/usage/today", {"tokens": increment(3)}, merge=True)
+
+    assert queue.flush() == 0
+    assert queue.pending_count() == 1 and len(os.listdir(tmp_path)) == 1
+
+    db.fail = False
+    assert queue.flush() == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_spool_of_a_dead_worker_is_replayed(tmp_path, monkeypatch):
+    op = {"path": "users/u1/chat_history/m1", "data": {"content": "saved before crash"}, "merge": False}
+    (tmp_path / "999999-dead.jsonl").write_text(json.dumps(op) + "\n{\"path\": \"torn", encoding="utf-8")
+    monkeypatch.setattr(write_behind, "_pid_alive", lambda pid: False)
+
+    db = FakeDB()
+    queue = make_queue(tmp_path, db)
+    assert queue.pending_count() == 1
+    queue.close()
+    assert db.commits == [[("users/u1/chat_history/m1", {"content": "saved before crash"}, False)]]
+    assert os.listdir(tmp_path) == []
+
+
+def test_ordered_stamps_keep_queue_order_through_a_batch():
+    stamps = [ordered_stamp() for _ in range(50)]
+    assert [stamp[0] for stamp in stamps] == sorted(stamp[0] for stamp in stamps)
+    assert len({stamp[1] for stamp in stamps}) == 50
+
+    # The queued time is what gets committed (via the JSON spool), not the batch's commit time
+    data = json.loads(json.dumps({"timestamp": client_timestamp(stamps[0][1])}))
+    assert write_behind._decode(data, FakeFirestore)["timestamp"] == stamps[0][1]
@@ -0,0 +1,167 @@
+"""
+Token accounting for model calls.
+
+Gemini reports exact token counts in a response's usage_metadata, and those are
+used whenever they are present. Otherwise tokens are counted locally with a
+tiktoken encoding (GPT-4's cl100k_base by default, a close approximation for
+Gemini). The encoder is resolved once per process; if tiktoken or its encoding
+data is unavailable, counts fall back to the 4-characters-per-token estimate.
+"""
+
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# tiktoken encoding used for local counts
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+
+# Characters per token for the fallback estimate
+FALLBACK_CHARS_PER_TOKEN = 4
+
+_encoder = None
+_encoder_loaded = False
+_encoder_lock = threading.Lock()
+
+
+def get_encoder():
+    """Get the process-wide tiktoken encoder, or None if it can't be loaded."""
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        with _encoder_lock:
+            if not _encoder_loaded:
+                if tiktoken is not None:
+                    try:
+                        _encoder = tiktoken.get_encoding(TOKEN_ENCODING)
+                    except Exception as e:
+                        print(f"Warning: Could not load tiktoken encoding '{TOKEN_ENCODING}': {e}")
+                _encoder_loaded = True
+    return _encoder
+
+
+def _estimate(text: str) -> int:
+    return len(text) // FALLBACK_CHARS_PER_TOKEN
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens in a string."""
+    if not text:
+        return 0
+    encoder = get_encoder()
+    if encoder is None:
+        return _estimate(text)
+    # encode_ordinary: user text may contain special-token strings like <|endoftext|>
+    return len(encoder.encode_ordinary(text))
+
+
+def count_tokens_batch(texts: Iterable[str]) -> List[int]:
+    """Count the tokens of many strings at once (encoded in parallel by tiktoken)."""
+    texts = [text or "" for text in texts]
+    encoder = get_encoder()
+    if encoder is None:
+        return [_estimate(text) for text in texts]
+    if len(texts) < 2:
+        return [len(encoder.encode_ordinary(text)) for text in texts]
+    return [len(tokens) for tokens in encoder.encode_ordinary_batch(texts)]
+
+
+def count_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Count the tokens across all text parts of Gemini-style messages."""
+    return sum(count_tokens_batch(
+        part.get("text", "") for message in messages for part in message["parts"]
+    ))
+
+
+def usage_from_metadata(response: Any) -> Optional[Dict[str, int]]:
+    """
+    Read the token counts a Gemini response reports about itself.
+
+    Args:
+        response: A GenerateContentResponse, or a streamed chunk
+
+    Returns:
+        dict: prompt_tokens, completion_tokens and total_tokens, or None when
+        the response carries no usage metadata
+    """
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is None:
+        return None
+    prompt_tokens = getattr(metadata, "prompt_token_count", 0) or 0
+    completion_tokens = getattr(metadata, "candidates_token_count", 0) or 0
+    total_tokens = getattr(metadata, "total_token_count", 0) or (prompt_tokens + completion_tokens)
+    if not total_tokens:
+        return None
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": total_tokens
+    }
+
+
+def usage_for_call(messages: List[Dict[str, Any]], completion: str,
+                   response: Any = None, completion_tokens: Optional[int] = None) -> Dict[str, int]:
+    """
+    Token usage of a model call: reported by the response, otherwise counted.
+
+    Args:
+        messages: Messages sent to the model
+        completion: The generated text
+        response: Model response whose usage_metadata is preferred
+        completion_tokens: Already counted completion tokens (e.g. from a StreamTokenCounter)
+
+    Returns:
+        dict: prompt_tokens, completion_tokens and total_tokens
+    """
+    reported = usage_from_metadata(response) if response is not None else None
+    if reported is not None:
+        return reported
+
+    prompt_tokens = count_message_tokens(messages)
+    if completion_tokens is None:
+        completion_tokens = count_tokens(completion)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+
+class StreamTokenCounter:
+    """
+    Count tokens of streamed output as it arrives.
+
+    Text is encoded up to the last whitespace seen, where tokens start anyway,
+    and the remainder is held back until more text arrives. Each chunk is
+    therefore encoded about once instead of re-encoding the whole response.
+    """
+
+    __slots__ = ("_counted", "_pending")
+
+    def __init__(self):
+        self._counted = 0
+        self._pending = ""
+
+    def add(self, text: str) -> None:
+        """Add a chunk of output."""
+        if not text:
+            return
+        pending = self._pending + text
+        # Split before the last whitespace run so it stays with the following word
+        cut = len(pending.rstrip())
+        while cut > 0 and not pending[cut - 1].isspace():
+            cut -= 1
+        while cut > 0 and pending[cut - 1].isspace():
+            cut -= 1
+        if cut > 0:
+            self._counted += count_tokens(pending[:cut])
+            pending = pending[cut:]
+        self._pending = pending
+
+    @property
+    def total(self) -> int:
+        """Tokens in all output added so far."""
+        return self._counted + count_tokens(self._pending)
@@ -0,0 +1,206 @@
+"""
+Background text extraction jobs for uploaded documents.
+
+Parsing a large PDF can take seconds, so upload routes hand the saved file to
+this queue and return a job ID right away. A small thread pool does the
+extraction, stores the text in the document store and records progress that
+the status endpoint polls.
+
+Job status is kept in memory and mirrored to a JSON file per job so any
+worker process on the same host can answer a status request.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from document_store import DOCUMENT_STORE_DIR, save_document
+
+# Number of extraction threads per worker process
+UPLOAD_JOB_WORKERS = int(os.getenv("UPLOAD_JOB_WORKERS", "2"))
+
+# How long finished job records are kept (seconds)
+UPLOAD_JOB_TTL_SECONDS = int(os.getenv("UPLOAD_JOB_TTL_SECONDS", "3600"))
+
+# Characters of extracted text returned as a preview in the job status
+UPLOAD_PREVIEW_CHARS = 500
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# Job IDs are uuid4 hex strings; anything else never reaches the filesystem
+_JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _default_indexer(content_hash, text):
+    from document_index import index_document
+    return index_document(content_hash, text)
+
+
+def _default_extractor(file_path, progress_callback=None):
+    from file_utils import extract_text_from_file
+    return extract_text_from_file(file_path, progress_callback=progress_callback)
+
+
+class UploadJobQueue:
+    """Thread-pool backed queue of document extraction jobs."""
+
+    def __init__(self, max_workers=UPLOAD_JOB_WORKERS,
+                 jobs_dir=os.path.join(DOCUMENT_STORE_DIR, "jobs"),
+                 extractor=_default_extractor, store_document=save_document,
+                 index_document=_default_indexer):
+        self.jobs_dir = jobs_dir
+        self.extractor = extractor
+        self.store_document = store_document
+        self.index_document = index_document
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            job['updated_at'] = time.time()
+            snapshot = dict(job)
+
+        # Mirror to disk so other worker processes can serve the status
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.jobs_dir, suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self._job_path(job_id))
+        except OSError as e:
+            print(f"[UPLOAD JOBS] Could not persist status for job {job_id}: {e}")
+        return snapshot
+
+    def submit(self, user_id, file_path, filename):
+        """
+        Queue a file for text extraction.
+
+        Args:
+            user_id (str): Owner of the upload; only they can read the job status
+            file_path (str): Path of the saved upload
+            filename (str): Original (sanitized) filename
+
+        Returns:
+            str: Job ID to poll
+        """
+        self._purge_expired()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'user_id': user_id,
+                'filename': filename,
+                'status': JOB_QUEUED,
+                'pages_processed': 0,
+                'total_pages': None,
+                'file_id': None,
+                'content_length': 0,
+                'content_hash': None,
+                'preview': '',
+                'error': None,
+                'created_at': now,
+                'updated_at': now
+            }
+        self._update(job_id)
+        self._executor.submit(self._run, job_id, user_id, file_path, filename)
+        return job_id
+
+    def _run(self, job_id, user_id, file_path, filename):
+        self._update(job_id, status=JOB_RUNNING)
+
+        def on_progress(pages_done, total_pages):
+            self._update(job_id, pages_processed=pages_done, total_pages=total_pages)
+
+        try:
+            print(f"[UPLOAD JOBS] Extracting text for job {job_id}: {filename}")
+            try:
+                text = self.extractor(file_path, progress_callback=on_progress)
+            finally:
+                # The text goes to the document store; the uploaded file isn't needed again
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+            if not text:
+                self._update(job_id, status=JOB_FAILED, error='Could not extract text from the file')
+                return
+
+            file_id = str(uuid.uuid4())
+            record = self.store_document(file_id, text, {'filename': filename, 'user_id': user_id})
+            try:
+                # Index now so the first chat turn can retrieve chunks right away
+                self.index_document(record['content_hash'], text)
+            except Exception as e:
+                print(f"[UPLOAD JOBS] Could not index document for job {job_id}: {e}")
+            self._update(
+                job_id,
+                status=JOB_DONE,
+                file_id=file_id,
+                content_length=record['content_length'],
+                content_hash=record['content_hash'],
+                preview=text[:UPLOAD_PREVIEW_CHARS]
+            )
+            print(f"[UPLOAD JOBS] Job {job_id} done: {record['content_length']} characters, file ID {file_id}")
+        except Exception as e:
+            print(f"[UPLOAD JOBS] Job {job_id} failed: {e}")
+            self._update(job_id, status=JOB_FAILED, error=f'Error processing file: {str(e)}')
+
+    def get(self, job_id):
+        """Return a copy of the job status, or None if the job is unknown."""
+        if not job_id or not _JOB_ID_PATTERN.match(str(job_id)):
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        try:
+            with open(self._job_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _purge_expired(self):
+        cutoff = time.time() - UPLOAD_JOB_TTL_SECONDS
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job['status'] in (JOB_DONE, JOB_FAILED) and job['updated_at'] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        for job_id in expired:
+            try:
+                os.remove(self._job_path(job_id))
+            except OSError:
+                pass
+
+
+# Process-wide queue instance
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
+
+def get_upload_job_queue():
+    """Get the process-wide upload job queue, creating it on first use."""
+    global _QUEUE
+    if _QUEUE is None:
+        with _QUEUE_LOCK:
+            if _QUEUE is None:
+                _QUEUE = UploadJobQueue()
+    return _QUEUE
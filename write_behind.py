@@ -0,0 +1,373 @@
+"""
+Write-behind buffer for Firestore writes that don't need to block a response.
+
+Chat messages, agent memory and usage counters are queued here instead of
+being written one by one on the request path. A background thread commits the
+queue in WriteBatch chunks once it reaches WRITE_BEHIND_BATCH_SIZE operations
+or every WRITE_BEHIND_FLUSH_INTERVAL seconds, merging repeated updates of the
+same document (e.g. several token increments) into one write.
+
+Every queued operation is first appended to a spool file, and the file is
+deleted only after its operations are committed. A worker that dies with a
+non-empty queue leaves its spool behind; the next process to start replays it.
+Delivery is at-least-once: a crash between a commit and the spool deletion
+replays that commit, which is harmless for writes to fixed document IDs but
+can count an increment twice.
+
+Operations are plain JSON: document paths, field values, and the
+SERVER_TIMESTAMP / increment() / client_timestamp() markers, which are turned
+into Firestore values at commit time.
+
+Documents whose order matters (chat messages, agent memory) should not use
+SERVER_TIMESTAMP: every write in one batch gets the same commit time. They take
+their time and ID from ordered_stamp() when queued instead.
+"""
+
+import os
+import json
+import time
+import uuid
+import atexit
+import secrets
+import string
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+from request_metrics import increment as increment_metric, observe, set_gauge
+
+# Set to "false" to write to Firestore immediately, on the request path
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() != "false"
+
+# Queued operations that trigger a flush before the interval is up
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+
+# Seconds between flushes of a non-empty queue
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+
+# Longest wait between retries after failed commits (seconds)
+WRITE_BEHIND_MAX_BACKOFF = float(os.getenv("WRITE_BEHIND_MAX_BACKOFF", "60"))
+
+# Where spool files live; must be shared by the worker processes of a host
+WRITE_BEHIND_SPOOL_DIR = os.getenv(
+    "WRITE_BEHIND_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "lightyear_write_spool")
+)
+
+# Firestore rejects batches with more writes than this
+FIRESTORE_BATCH_LIMIT = 500
+
+_MARKER = "__write_behind__"
+
+# Field value replaced by the server's commit time
+SERVER_TIMESTAMP = {_MARKER: "server_timestamp"}
+
+_AUTO_ID_CHARS = string.ascii_letters + string.digits
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def increment(amount):
+    """Field value that adds amount to the stored number (like firestore.Increment)."""
+    return {_MARKER: "increment", "amount": amount}
+
+
+def client_timestamp(moment):
+    """Field value for a fixed time (a timezone-aware datetime), stored as a Firestore timestamp."""
+    # Whole microseconds, so the stored time is exactly the one handed out
+    return {_MARKER: "timestamp", "us": (moment - _EPOCH) // timedelta(microseconds=1)}
+
+
+def _is_increment(value):
+    return isinstance(value, dict) and value.get(_MARKER) == "increment"
+
+
+_last_stamp_us = 0
+_stamp_lock = threading.Lock()
+
+def ordered_stamp():
+    """
+    Time and document ID for a new document, in the order it was queued.
+
+    Within a process both strictly increase from call to call, so documents
+    queued one after another (a user turn and its reply) never tie, however
+    they are batched. The ID starts with the time in hex and sorts with it,
+    making it a queue-order tie-breaker after the time field.
+
+    Returns:
+        tuple: (20-character document ID, timezone-aware UTC datetime)
+    """
+    global _last_stamp_us
+    with _stamp_lock:
+        _last_stamp_us = max(time.time_ns() // 1000, _last_stamp_us + 1)
+        stamp_us = _last_stamp_us
+    document_id = f"{stamp_us:016x}" + "".join(secrets.choice(_AUTO_ID_CHARS) for _ in range(4))
+    return document_id, _EPOCH + timedelta(microseconds=stamp_us)
+
+
+def coalesce(operations):
+    """
+    Merge operations on the same document, keeping the order of first appearance.
+
+    Merged sets combine field by field (later values win, increments add up);
+    a full set replaces whatever was queued for the document before it.
+
+    Args:
+        operations (list): Operations as {"path", "data", "merge"} dicts
+
+    Returns:
+        list: At most one operation per document path
+    """
+    merged = {}
+    for op in operations:
+        previous = merged.get(op["path"])
+        if previous is None or not op["merge"]:
+            merged.pop(op["path"], None)
+            merged[op["path"]] = {"path": op["path"], "data": dict(op["data"]), "merge": op["merge"]}
+            continue
+        data = previous["data"]
+        for field, value in op["data"].items():
+            current = data.get(field)
+            if _is_increment(value) and _is_increment(current):
+                data[field] = increment(current["amount"] + value["amount"])
+            elif _is_increment(value) and isinstance(current, (int, float)) and not isinstance(current, bool):
+                data[field] = current + value["amount"]
+            else:
+                data[field] = value
+    return list(merged.values())
+
+
+def _decode(data, firestore):
+    """Replace markers with the Firestore sentinels they stand for."""
+    decoded = {}
+    for field, value in data.items():
+        if isinstance(value, dict) and _MARKER in value:
+            if value[_MARKER] == "increment":
+                value = firestore.Increment(value["amount"])
+            elif value[_MARKER] == "timestamp":
+                value = _EPOCH + timedelta(microseconds=value["us"])
+            else:
+                value = firestore.SERVER_TIMESTAMP
+        decoded[field] = value
+    return decoded
+
+
+def _document_ref(db, path):
+    """Resolve "collection/doc/collection/doc" one segment at a time (works with the mock client too)."""
+    parts = path.split("/")
+    ref = db.collection(parts[0]).document(parts[1])
+    for collection, document in zip(parts[2::2], parts[3::2]):
+        ref = ref.collection(collection).document(document)
+    return ref
+
+
+def _default_backend():
+    import firebase_utils
+    return firebase_utils.db, firebase_utils.firestore
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class WriteBehindQueue:
+    """Spooled queue of Firestore writes, committed in batches by a background thread."""
+
+    def __init__(self, spool_dir=WRITE_BEHIND_SPOOL_DIR, batch_size=WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval=WRITE_BEHIND_FLUSH_INTERVAL, backend=_default_backend):
+        self.spool_dir = spool_dir
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.backend = backend
+        self._pending = []
+        self._segments = []  # spool files holding exactly the pending operations
+        self._file = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+
+        if self.spool_dir:
+            try:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                self._recover()
+            except OSError as e:
+                print(f"[WRITE BEHIND] Spool unavailable, queue is memory-only: {e}")
+                self.spool_dir = None
+
+    def _recover(self):
+        """Claim spool files left by dead processes and queue their operations."""
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith(".jsonl"):
+                continue
+            try:
+                pid = int(name.split("-", 1)[0])
+            except ValueError:
+                continue
+            if pid == os.getpid() or _pid_alive(pid):
+                continue
+            claimed = self._segment_path()
+            try:
+                # Atomic: when two workers start together only one gets the file
+                os.rename(os.path.join(self.spool_dir, name), claimed)
+            except OSError:
+                continue
+            recovered = 0
+            with open(claimed, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._pending.append(json.loads(line))
+                        recovered += 1
+                    except ValueError:
+                        # A torn final line from the crash
+                        continue
+            self._segments.append(claimed)
+            print(f"[WRITE BEHIND] Recovered {recovered} queued write(s) from {name}")
+        if self._pending:
+            self._start()
+
+    def _segment_path(self):
+        return os.path.join(self.spool_dir, f"{os.getpid()}-{uuid.uuid4().hex}.jsonl")
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def write(self, path, data, merge=False):
+        """
+        Queue a document set.
+
+        Args:
+            path (str): Document path, e.g. "users/<uid>/chat_history/<id>"
+            data (dict): Fields to write; may use SERVER_TIMESTAMP and increment()
+            merge (bool): Merge into an existing document instead of replacing it
+        """
+        op = {"path": path, "data": data, "merge": merge}
+        with self._lock:
+            if self.spool_dir:
+                try:
+                    if self._file is None:
+                        segment = self._segment_path()
+                        self._file = open(segment, "a", encoding="utf-8")
+                        self._segments.append(segment)
+                    self._file.write(json.dumps(op, default=str) + "\n")
+                    # Reaches the OS before the request returns, so a worker crash can't lose it
+                    self._file.flush()
+                except OSError as e:
+                    print(f"[WRITE BEHIND] Could not spool write to {path}: {e}")
+            self._pending.append(op)
+            pending = len(self._pending)
+            self._start()
+        set_gauge("write_behind_pending", pending)
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def has_pending(self, prefix=""):
+        """Whether any queued write targets a path starting with prefix."""
+        with self._lock:
+            return any(op["path"].startswith(prefix) for op in self._pending)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """
+        Commit everything queued so far.
+
+        Returns:
+            int: Number of queued operations committed (0 if the commit failed)
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                operations, segments = self._pending, self._segments
+                self._pending, self._segments = [], []
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+
+            started = time.perf_counter()
+            try:
+                self._commit(coalesce(operations))
+            except Exception as e:
+                print(f"[WRITE BEHIND] Commit of {len(operations)} write(s) failed, will retry: {e}")
+                increment_metric("write_behind_failures_total")
+                with self._lock:
+                    self._pending = operations + self._pending
+                    self._segments = segments + self._segments
+                    pending = len(self._pending)
+                set_gauge("write_behind_pending", pending)
+                return 0
+            observe("firestore.write_behind", time.perf_counter() - started)
+
+            for segment in segments:
+                try:
+                    os.remove(segment)
+                except OSError:
+                    pass
+            increment_metric("write_behind_committed_total", len(operations))
+            set_gauge("write_behind_pending", self.pending_count())
+            return len(operations)
+
+    def _commit(self, operations):
+        db, firestore = self.backend()
+        for start in range(0, len(operations), FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            for op in operations[start:start + FIRESTORE_BATCH_LIMIT]:
+                batch.set(_document_ref(db, op["path"]), _decode(op["data"], firestore), merge=op["merge"])
+            batch.commit()
+
+    def _run(self):
+        failures = 0
+        while not self._closed:
+            delay = min(self.flush_interval * (2 ** failures), WRITE_BEHIND_MAX_BACKOFF)
+            self._wake.wait(delay)
+            self._wake.clear()
+            if not self.pending_count():
+                continue
+            failures = 0 if self.flush() else failures + 1
+
+    def close(self):
+        """Flush what is queued and stop the background thread."""
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+
+# Process-wide queue instance
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
+
+def get_write_behind_queue():
+    """Get the process-wide write-behind queue, creating it on first use."""
+    global _QUEUE
+    if _QUEUE is None:
+        with _QUEUE_LOCK:
+            if _QUEUE is None:
+                _QUEUE = WriteBehindQueue()
+                atexit.register(_QUEUE.close)
+    return _QUEUE
+
+
+def write(path, data, merge=False):
+    """Queue a Firestore document set, or write it right away when write-behind is disabled."""
+    if WRITE_BEHIND_ENABLED:
+        get_write_behind_queue().write(path, data, merge)
+        return
+    db, firestore = _default_backend()
+    _document_ref(db, path).set(_decode(data, firestore), merge=merge)
+
+
+def flush_pending(prefix=""):
+    """Commit queued writes now if any target paths under prefix (read-your-writes before a query)."""
+    if WRITE_BEHIND_ENABLED and _QUEUE is not None and _QUEUE.has_pending(prefix):
+        _QUEUE.flush()